@@ -0,0 +1,340 @@
+import datetime
+import json
+import logging
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from . import instrumentation
+from .domain import batch, transaction
+from .repository import mastercard
+from .repository.cache import RateCache
+from .repository.fake_mastercard import USD_VALUES, FakeMastercardServer
+
+WORKLOADS = (
+    "single",
+    "batch",
+    "concurrent",
+    "cached",
+    "bulk-float",
+    "bulk-decimal",
+    "bulk-units",
+)
+DEFAULT_ITERATIONS = 200
+DEFAULT_CONCURRENCY = 8
+DEFAULT_LATENCY = 0
+PERCENTILES = (50, 95, 99)
+USER_AGENT = "mc-bench"
+UNLIMITED = 1_000_000
+
+PAIRS = [
+    (transaction_currency, card_currency)
+    for transaction_currency in USD_VALUES
+    for card_currency in USD_VALUES
+    if transaction_currency != card_currency
+]
+# Batch rows repeat 60 combinations of pair and date, so some rows miss the cache and
+# the rest hit it, as in a typical statement
+BATCH_PAIRS = PAIRS[:12]
+BATCH_DATES = ("2018-06-04", "2018-06-05", "2018-06-06", "2018-06-07", "2018-06-08")
+EXCHANGE_RATE_DATE = BATCH_DATES[0]
+# Amounts converted by each operation of the bulk workloads
+BULK_AMOUNTS = 1000
+BULK_RATE = 0.754287
+BULK_BANK_FEE = 2.5
+# Where the time of a conversion goes, as the spans timing each phase
+PHASES = {
+    "request": "mastercard.request",
+    "decode": "mastercard.decode",
+    "mapping": "transaction.map",
+}
+
+
+def run(
+    workloads=WORKLOADS,
+    iterations=DEFAULT_ITERATIONS,
+    concurrency=DEFAULT_CONCURRENCY,
+    latency=DEFAULT_LATENCY,
+    memory=True,
+):
+    """Run each workload against a local fake Mastercard API and return a report.
+
+    Every workload is timed on its own, totalling up the time spent in each of
+    PHASES; with memory, it is then run again under tracemalloc to find its peak
+    memory use without slowing down the timed run.
+    """
+    with FakeMastercardServer(latency=latency) as fake:
+        # Failures should show up in the results rather than be hidden by retries
+        client = mastercard.MastercardClient(
+            base_url=fake.base_url,
+            user_agent=USER_AGENT,
+            retries=0,
+            # Measure mc itself rather than the pace it keeps for Mastercard's sake
+            requests_per_second=UNLIMITED,
+            burst=UNLIMITED,
+        )
+        mastercard.set_default_client(client)
+        try:
+            results = []
+            for workload in workloads:
+                logging.info(f"Running {workload} workload")
+                operation = WORKLOAD_FUNCTIONS[workload]
+                stats = instrumentation.Stats()
+                instrumentation.add_hook(stats)
+                try:
+                    timings = operation(iterations, concurrency)
+                finally:
+                    instrumentation.remove_hook(stats)
+                result = summarise(workload, *timings)
+                result["phases"] = phase_seconds(stats)
+                if memory:
+                    result["peak_memory_bytes"] = peak_memory(
+                        operation, iterations, concurrency
+                    )
+                results.append(result)
+        finally:
+            mastercard.set_default_client(None)
+            client.close()
+
+    return {
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "latency": latency,
+        },
+        "results": results,
+    }
+
+
+def single(iterations, concurrency):
+    """One conversion at a time, each a round trip to the API."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        latencies.append(timed(settle, i))
+    return latencies, time.perf_counter() - started
+
+
+def concurrent(iterations, concurrency):
+    """Conversions from several threads at once, each a round trip to the API."""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(lambda i: timed(settle, i), range(iterations)))
+        return latencies, time.perf_counter() - started
+
+
+def batch_rows(iterations, concurrency):
+    """A batch conversion, timing each row as it is converted."""
+    cache = RateCache(":memory:")
+    rows = (
+        {
+            "amount": 10.0 + i,
+            "from": BATCH_PAIRS[i % len(BATCH_PAIRS)][0],
+            "to": BATCH_PAIRS[i % len(BATCH_PAIRS)][1],
+            "date": BATCH_DATES[i % len(BATCH_DATES)],
+            "bank_fee": 0.0,
+        }
+        for i in range(iterations)
+    )
+
+    latencies = []
+    try:
+        started = time.perf_counter()
+        results = batch.convert_rows(rows, cache)
+        while True:
+            row_started = time.perf_counter()
+            if next(results, None) is None:
+                break
+            latencies.append(time.perf_counter() - row_started)
+        return latencies, time.perf_counter() - started
+    finally:
+        cache.close()
+
+
+def cached(iterations, concurrency):
+    """Conversions answered locally from a warm rate cache."""
+    cache = RateCache(":memory:")
+    try:
+        for transaction_currency, card_currency in PAIRS:
+            cache.put(EXCHANGE_RATE_DATE, transaction_currency, card_currency, 1.0)
+
+        latencies = []
+        started = time.perf_counter()
+        for i in range(iterations):
+            latencies.append(timed(settle, i, cache))
+        return latencies, time.perf_counter() - started
+    finally:
+        cache.close()
+
+
+def bulk_float(iterations, concurrency):
+    """Local conversions of float amounts, BULK_AMOUNTS per operation."""
+    amounts = [10.0 + i / 100 for i in range(BULK_AMOUNTS)]
+    return bulk(transaction.card_amounts, amounts, BULK_RATE, BULK_BANK_FEE, iterations)
+
+
+def bulk_decimal(iterations, concurrency):
+    """Local conversions of Decimal amounts in fixed point, BULK_AMOUNTS per operation."""
+    amounts = [Decimal(10) + Decimal(i).scaleb(-2) for i in range(BULK_AMOUNTS)]
+    return bulk(
+        transaction.exact_card_amounts,
+        amounts,
+        BULK_RATE,
+        BULK_BANK_FEE,
+        iterations,
+    )
+
+
+def bulk_units(iterations, concurrency):
+    """Local conversions of amounts as integer cents, BULK_AMOUNTS per operation."""
+    units = [1000 + i for i in range(BULK_AMOUNTS)]
+
+    def card_units(transaction_units, conversion_rate, bank_fee_percentage):
+        return transaction.card_units(
+            transaction_units, 2, conversion_rate, bank_fee_percentage
+        )
+
+    return bulk(card_units, units, BULK_RATE, BULK_BANK_FEE, iterations)
+
+
+def bulk(function, amounts, conversion_rate, bank_fee_percentage, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        latencies.append(timed(function, amounts, conversion_rate, bank_fee_percentage))
+    return latencies, time.perf_counter() - started
+
+
+WORKLOAD_FUNCTIONS = {
+    "single": single,
+    "batch": batch_rows,
+    "concurrent": concurrent,
+    "cached": cached,
+    "bulk-float": bulk_float,
+    "bulk-decimal": bulk_decimal,
+    "bulk-units": bulk_units,
+}
+
+
+def settle(i, cache=None):
+    transaction_currency, card_currency = PAIRS[i % len(PAIRS)]
+    return transaction.settle(
+        transaction_amount=10.0 + i,
+        transaction_currency=transaction_currency,
+        card_currency=card_currency,
+        exchange_rate_date=EXCHANGE_RATE_DATE,
+        cache=cache,
+    )
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def peak_memory(operation, iterations, concurrency):
+    # tracemalloc only traces allocations made after it starts, in any thread
+    tracemalloc.start()
+    try:
+        operation(iterations, concurrency)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarise(workload, latencies, seconds):
+    return {
+        "workload": workload,
+        "operations": len(latencies),
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else 0,
+        "latency": {
+            **{f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+            "mean": sum(latencies) / len(latencies) if latencies else 0,
+            "max": max(latencies, default=0),
+        },
+    }
+
+
+def phase_seconds(stats):
+    """Total seconds spent in each of PHASES, from the spans a Stats hook recorded."""
+    return {phase: stats.spans.get(name, (0, 0.0))[1] for phase, name in PHASES.items()}
+
+
+def percentile(values, p):
+    """The nearest-rank percentile of values."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))  # Ceiling division
+    return ordered[int(rank) - 1]
+
+
+def format_report(report, baseline=None):
+    baseline_results = {
+        result["workload"]: result for result in (baseline or {}).get("results", [])
+    }
+
+    lines = [
+        f"{'workload':<12}{'ops':>8}{'ops/s':>12}"
+        + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+        + f"{'peak KiB':>11}"
+    ]
+    for result in report["results"]:
+        latency = result["latency"]
+        peak = result.get("peak_memory_bytes")
+        line = (
+            f"{result['workload']:<12}{result['operations']:>8}"
+            f"{result['throughput']:>12.1f}"
+            + "".join(f"{latency[f'p{p}'] * 1000:>10.3f}" for p in PERCENTILES)
+            + (f"{peak / 1024:>11.1f}" if peak is not None else f"{'-':>11}")
+        )
+
+        previous = baseline_results.get(result["workload"])
+        if previous:
+            line += (
+                f"  throughput {change(previous['throughput'], result['throughput'])}"
+                f", p50 {change(previous['latency']['p50'], latency['p50'])}"
+            )
+        lines.append(line)
+
+    # Time per operation spent in each phase, to show where the time goes
+    lines.append("")
+    lines.append(f"{'workload':<12}" + "".join(f"{f'{p} ms':>12}" for p in PHASES))
+    for result in report["results"]:
+        phases = result.get("phases", {})
+        operations = result["operations"] or 1
+        lines.append(
+            f"{result['workload']:<12}"
+            + "".join(
+                f"{phases[phase] / operations * 1000:>12.3f}"
+                if phase in phases
+                else f"{'-':>12}"
+                for phase in PHASES
+            )
+        )
+
+    return "\n".join(lines)
+
+
+def change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before:+.1%}"
+
+
+def load_report(path):
+    with open(path) as report_file:
+        return json.load(report_file)
+
+
+def save_report(report, path):
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+        report_file.write("\n")
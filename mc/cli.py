@@ -1,21 +1,39 @@
 #!/usr/bin/env python
 
 import argparse
+import atexit
 import logging
-from functools import partial
+import sys
 
-from .domain import date, transaction
+# Only light modules are imported here so that `mc` starts quickly; anything slow to
+# import is imported by the code paths that need it
+from . import instrumentation, output
+from .domain import amount, currency, date, transaction
+from .repository import mastercard, throttle, transport
+from .repository.cache import DEFAULT_LRU_CAPACITY, LruRateCache, RateCache
 
 
-def main():
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Subcommands are checked by hand so plain `mc 10 usd gbp` keeps working
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    return convert(argv)
+
+
+def convert(argv):
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         description="Convert currency using MasterCard exchange rates",
-        epilog="If no date is specified, the most recent date with rates is used.",
+        epilog="If no date is specified, the most recent date with rates is used. "
+        "Run `mc batch --help` to convert many transactions at once.",
     )
     parser.add_argument(
         "from_quantity",
-        type=float,
+        type=amount.parse,
         help="Quantity of from_currency used in transaction",
     )
     parser.add_argument(
@@ -26,20 +44,15 @@ def main():
     parser.add_argument(
         "to_currency",
         type=str.upper,
-        help="The currency to convert to, i.e. the card currency, case-insensitive, e.g. GBP, usd, JPY",
+        nargs="+",
+        help="The currency to convert to, i.e. the card currency, case-insensitive, e.g. GBP, usd, JPY. "
+        "Give several to convert into each of them concurrently",
     )
     parser.add_argument(
         "-d",
         "--date",
         help="Day the exchange was made in format YYYY-MM-DD. Only today and yesterday appear to be supported by MasterCard. Defaults to most recent day with rates.",
     )
-    parser.add_argument(
-        "--log-level",
-        help="Set logging level",
-        default="WARNING",
-        type=str.upper,
-        choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"],
-    )
     parser.add_argument(
         "-t",
         "--today",
@@ -53,31 +66,792 @@ def main():
         default=0,
         help="Uses yesterday's exchange rates. Repeat to go further back in time",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--no-server",
+        action="store_true",
+        help="Don't use a running `mc serve`, even if there is one",
+    )
+    add_output_arguments(
+        parser,
+        "Write each conversion in full, with its rate and the date of the rate, "
+        "in this format instead of just the card amount",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
 
-    logging.basicConfig(level=logging.getLevelName(args.log_level))
-    logging.debug(args)
+    setup(args)
+
+    from .converter import (
+        CacheBackend,
+        Converter,
+        FallbackBackend,
+        MastercardBackend,
+        RateNotFoundError,
+        ServerBackend,
+    )
+
+    cache = None if args.no_cache else RateCache()
+    exchange_rate_date = requested_date(args)
+
+    # Cached rates can be used without any network requests at all, not even for the
+    # currency catalogue, so they are tried on their own first
+    results = None
+    if cache is not None and not args.refresh:
+        try:
+            results = convert_amounts(
+                Converter(CacheBackend(cache), exchange_rate_date=exchange_rate_date),
+                args,
+            )
+        except RateNotFoundError:
+            logging.debug("Not every rate is cached")
+
+    if results is not None:
+        cache.close()
+    else:
+        currencies = currency_catalogue(cache)
+        if currencies is not None:
+            for code in [args.from_currency, *args.to_currency]:
+                try:
+                    currency.check(code, currencies)
+                except currency.UnknownCurrencyError as e:
+                    parser.error(str(e))
 
+        # A running `mc serve` may answer from its warm cache, before asking
+        # MasterCard. The cache still comes first for any rates it does have
+        backends = []
+        if cache is not None and not args.refresh:
+            backends.append(CacheBackend(cache))
+        server_errors = ()
+        if not (
+            args.no_server
+            or args.no_cache
+            or args.refresh
+            or args.offline
+            or args.record
+        ):
+            # Imported only here as http.server is slow to import
+            from .server import ServerError
+
+            backends.append(ServerBackend())
+            server_errors = (ServerError,)
+        backends.append(MastercardBackend(cache=cache, refresh=args.refresh))
+
+        with Converter(
+            FallbackBackend(*backends), exchange_rate_date=exchange_rate_date
+        ) as converter:
+            try:
+                results = convert_amounts(converter, args)
+            except server_errors as e:
+                parser.exit(1, f"mc serve couldn't convert: {e}\n")
+            except transport.FixtureNotFoundError as e:
+                # Only replayed fixtures can be missing, with --offline
+                parser.exit(1, f"mc couldn't convert offline: {e}\n")
+
+    # Output conversion
+    if args.format:
+        write_records(results, args)
+    elif len(results) > 1:
+        for result in results:
+            print(amount.format(result["card_amount"]), result["card_currency"])
+    else:
+        print(amount.format(results[0]["card_amount"]))
+
+
+def convert_amounts(converter, args):
+    if len(args.to_currency) > 1:
+        return converter.convert_many(
+            {"amount": args.from_quantity, "from": args.from_currency, "to": to}
+            for to in args.to_currency
+        )
+    return [
+        converter.convert(args.from_quantity, args.from_currency, args.to_currency[0])
+    ]
+
+
+def write_records(results, args):
+    with output.RecordWriter(
+        sys.stdout, args.format, line_buffered=args.line_buffered
+    ) as writer:
+        for result in results:
+            writer.write(result)
+
+
+def currency_catalogue(cache):
+    """Return the currency catalogue for checking codes, or None if it's unavailable.
+
+    The catalogue is kept in the rate cache, so there is no check without it.
+    """
+    if cache is None:
+        return None
+    try:
+        return currency.catalogue(cache)
+    except (OSError, LookupError, ValueError) as e:
+        # Checking currencies is only a convenience, so it mustn't stop a conversion.
+        # Network and HTTP errors are OSErrors, missing fixtures and fields are
+        # LookupErrors, and a body that isn't JSON is a ValueError
+        logging.debug(f"Not checking currencies, as the catalogue is unavailable: {e}")
+        return None
+
+
+def requested_date(args):
     # Figure out which date to use
     if args.date is not None:  # User-specified date
-        settle = partial(transaction.settle, exchange_rate_date=date.parse(args.date))
+        return date.parse(args.date)
     elif args.today:  # Today
-        settle = partial(transaction.settle, exchange_rate_date=date.date_today())
+        return date.date_today()
     elif (
         args.yesterday > 0
     ):  # Yesterday (note that yesterday can be specified multiple times)
-        settle = partial(
-            transaction.settle, exchange_rate_date=date.date_n_days_ago(args.yesterday)
-        )
+        return date.date_n_days_ago(args.yesterday)
     else:  # Use most recent date with published rates, discover date from initial MasterCard call
-        settle = transaction.settle_latest
+        return transaction.LATEST_DATE
 
-    # Get card amount from MasterCard
-    result = settle(
-        transaction_amount=args.from_quantity,
-        transaction_currency=args.from_currency,
-        card_currency=args.to_currency,
+
+def convert_batch(argv):
+    from .domain import batch
+
+    parser = argparse.ArgumentParser(
+        prog="mc batch",
+        description="Convert many transactions read from a CSV or JSONL file",
+        epilog="Input rows have the fields amount, from, to and optionally date (YYYY-MM-DD, "
+        "defaults to the most recent day with rates) and bank_fee (percentage). "
+        "Rows are converted and written as they are read, so input of any size can be streamed.",
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="File to read transactions from, or - for stdin (default)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="File to write converted transactions to, or - for stdout (default)",
     )
+    parser.add_argument(
+        "--input-format",
+        choices=batch.FORMATS,
+        help="Format of the input. Guessed from the file extension, defaulting to csv",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Convert an input file in this many processes, for very large files. "
+        "Rows mustn't contain line breaks (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only convert rows added to the input since the last run, appending them "
+        "to the output. Progress is kept in OUTPUT.checkpoint",
+    )
+    add_output_arguments(
+        parser, "Format of the output. Defaults to the format of the input"
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
 
-    # Output conversion
-    print(result["card_amount"])
+    if args.workers > 1 and args.input == "-":
+        parser.error("--workers needs an input file, as stdin can't be split up")
+    if args.incremental and "-" in (args.input, args.output):
+        parser.error("--incremental needs input and output files, not stdin or stdout")
+    if args.incremental and args.workers > 1:
+        parser.error("--incremental can't be used with --workers")
+    if args.format == "json" and (args.incremental or args.workers > 1):
+        parser.error(
+            "json output can't be appended to or written in parallel, use jsonl"
+        )
+
+    setup(args)
+
+    input_format = args.input_format or guess_format(args.input)
+
+    # Even without the persistent cache, rows sharing a date and pair share a lookup
+    cache = RateCache(":memory:") if args.no_cache else RateCache()
+
+    if args.incremental:
+        try:
+            converted = batch.convert_appended(
+                args.input,
+                args.output,
+                input_format,
+                cache,
+                refresh=args.refresh,
+                currencies=currency_catalogue(cache),
+                output_format=args.format,
+            )
+        except ValueError as e:
+            # A row that can't be parsed, or has an unknown currency
+            parser.exit(1, f"{e}\n")
+        logging.info(f"Converted {converted} new rows")
+        return
+
+    if args.workers > 1:
+        with open_text(args.output, "w", sys.stdout) as output_file:
+            try:
+                batch.convert_file(
+                    args.input,
+                    output_file,
+                    input_format,
+                    cache,
+                    args.workers,
+                    refresh=args.refresh,
+                    currencies=currency_catalogue(cache),
+                    output_format=args.format,
+                    line_buffered=args.line_buffered,
+                )
+            except ValueError as e:
+                parser.exit(1, f"{e}\n")
+        return
+
+    try:
+        convert_stream(args, input_format, cache)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+
+def convert_stream(args, input_format, cache):
+    """Convert rows one at a time as they are read, for `mc batch` without --workers."""
+    from .domain import batch
+
+    with open_text(args.input, "r", sys.stdin) as input_file:
+        # Check every row before making any requests, if the input can be read twice
+        currencies = currency_catalogue(cache)
+        check_up_front = currencies is not None and input_file.seekable()
+        if check_up_front:
+            problems = batch.check_currencies(
+                batch.read_rows(input_file, input_format), currencies
+            )
+            if problems:
+                raise ValueError("\n".join(problems))
+            input_file.seek(0)
+
+        with open_text(args.output, "w", sys.stdout) as output_file:
+            rows = batch.read_rows(input_file, input_format)
+            if currencies is not None and not check_up_front:
+                # Streamed input is checked as it arrives instead
+                rows = batch.checked_rows(rows, currencies)
+            results = batch.convert_rows(rows, cache, refresh=args.refresh)
+            batch.write_rows(
+                results,
+                output_file,
+                args.format or input_format,
+                line_buffered=args.line_buffered,
+            )
+
+
+def convert_history(argv):
+    from .domain import history
+
+    parser = argparse.ArgumentParser(
+        prog="mc history",
+        description="Show a currency pair's rates for each day in a date range",
+        epilog="Days without published rates, such as weekends, are skipped. "
+        "Rates are stored in the local rate cache, so repeated queries don't use the network.",
+    )
+    parser.add_argument(
+        "from_currency",
+        type=str.upper,
+        help="The transaction currency, case-insensitive, e.g. GBP, usd, JPY",
+    )
+    parser.add_argument(
+        "to_currency",
+        type=str.upper,
+        help="The card currency, case-insensitive, e.g. GBP, usd, JPY",
+    )
+    parser.add_argument(
+        "--start",
+        required=True,
+        type=date.parse,
+        help="First day of the range, e.g. YYYY-MM-DD",
+    )
+    parser.add_argument(
+        "--end",
+        type=date.parse,
+        default=date.date_today(),
+        help="Last day of the range, e.g. YYYY-MM-DD. Defaults to today",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=history.DEFAULT_WORKERS,
+        help="Number of days to fetch concurrently (default: %(default)s)",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup(args)
+
+    # The rates have to be stored somewhere to be gathered up afterwards
+    cache = RateCache(":memory:") if args.no_cache else RateCache()
+
+    rates = history.history(
+        args.from_currency,
+        args.to_currency,
+        args.start,
+        args.end,
+        cache,
+        workers=args.workers,
+        refresh=args.refresh,
+    )
+
+    for fx_date, conversion_rate in rates:
+        print(fx_date, conversion_rate)
+
+
+def convert_store(argv):
+    from .domain import history
+    from .repository import rate_store
+
+    parser = argparse.ArgumentParser(
+        prog="mc store",
+        description="Keep a compact, memory-mapped history of rates against a pivot currency",
+        epilog="Only rates to and from the pivot are stored; rates between other currencies "
+        "are derived through the pivot.",
+    )
+    parser.add_argument(
+        "--path",
+        default=rate_store.default_store_path(),
+        help="Rate store file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--pivot",
+        type=str.upper,
+        default=rate_store.DEFAULT_PIVOT,
+        help="Pivot currency of a new store (default: %(default)s)",
+    )
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    fill = actions.add_parser(
+        "fill", help="Fetch currencies' rates to and from the pivot into the store"
+    )
+    fill.add_argument(
+        "currencies",
+        type=str.upper,
+        nargs="+",
+        help="Currencies to store, case-insensitive, e.g. GBP eur JPY",
+    )
+    fill.add_argument(
+        "--start",
+        required=True,
+        type=date.parse,
+        help="First day of the range, e.g. YYYY-MM-DD",
+    )
+    fill.add_argument(
+        "--end",
+        type=date.parse,
+        default=date.date_today(),
+        help="Last day of the range, e.g. YYYY-MM-DD. Defaults to today",
+    )
+    fill.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=history.DEFAULT_WORKERS,
+        help="Number of days to fetch concurrently (default: %(default)s)",
+    )
+    add_common_arguments(fill)
+
+    series = actions.add_parser(
+        "series", help="Show a currency pair's stored rates for each day in a range"
+    )
+    series.add_argument("from_currency", type=str.upper)
+    series.add_argument("to_currency", type=str.upper)
+    series.add_argument("--start", type=date.parse, default="0001-01-01")
+    series.add_argument("--end", type=date.parse, default="9999-12-31")
+
+    export = actions.add_parser("export", help="Write every stored rate as CSV")
+    export.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="File to write to, or - for stdout (default)",
+    )
+
+    import_ = actions.add_parser(
+        "import", help="Store rates from CSV written by export"
+    )
+    import_.add_argument("input", help="File to read from, or - for stdin")
+
+    args = parser.parse_args(argv)
+
+    with rate_store.RateStore(args.path, pivot=args.pivot) as store:
+        if args.action == "fill":
+            setup(args)
+            cache = RateCache(":memory:") if args.no_cache else RateCache()
+            stored = history.fill_store(
+                store,
+                args.currencies,
+                args.start,
+                args.end,
+                cache,
+                workers=args.workers,
+                refresh=args.refresh,
+            )
+            print(f"Stored {stored} rates against {store.pivot}")
+        elif args.action == "series":
+            for fx_date, conversion_rate in store.series(
+                args.from_currency, args.to_currency, args.start, args.end
+            ):
+                print(fx_date, conversion_rate)
+        elif args.action == "export":
+            with open_text(args.output, "w", sys.stdout) as output_file:
+                store.export_csv(output_file)
+        else:
+            with open_text(args.input, "r", sys.stdin) as input_file:
+                stored = store.import_csv(input_file)
+            print(f"Stored {stored} rates against {store.pivot}")
+
+
+def convert_prefetch(argv):
+    from .domain import prefetch
+    from .repository import rate_store
+
+    def currency_pair(text):
+        try:
+            return prefetch.parse_pair(text)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+    parser = argparse.ArgumentParser(
+        prog="mc prefetch",
+        description="Fetch the latest rates for currency pairs into the rate cache "
+        "as soon as MasterCard publishes them",
+        epilog="Only rates_available is polled until new rates appear, so waiting is cheap. "
+        "Conversions of the prefetched pairs then need no network requests.",
+    )
+    parser.add_argument(
+        "pairs",
+        type=currency_pair,
+        nargs="+",
+        metavar="FROM:TO",
+        help="Currency pairs to fetch, case-insensitive, e.g. USD:GBP eur:jpy",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Fetch the latest rates once and exit, e.g. from cron, instead of waiting "
+        "for each publication",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=prefetch.DEFAULT_INTERVAL_SECONDS,
+        help="Seconds between checks while a publication is overdue (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=rate_store.default_store_path(),
+        metavar="PATH",
+        help="Also keep the rates in a rate store, by default %(const)s",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=prefetch.DEFAULT_WORKERS,
+        help="Number of pairs to fetch concurrently (default: %(default)s)",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.no_cache:
+        parser.error(
+            "prefetching fills the rate cache, so can't be used with --no-cache"
+        )
+
+    setup(args)
+
+    cache = RateCache()
+    currencies = currency_catalogue(cache)
+    if currencies is not None:
+        try:
+            for pair in args.pairs:
+                for code in pair:
+                    currency.check(code, currencies)
+        except currency.UnknownCurrencyError as e:
+            parser.error(str(e))
+
+    store = rate_store.RateStore(args.store) if args.store else None
+    try:
+        if args.once:
+            fx_date, fetched = prefetch.prefetch(
+                args.pairs, cache, store, args.workers, refresh=args.refresh
+            )
+            print(f"{fx_date}: fetched {fetched} rates")
+        else:
+            prefetch.run(
+                args.pairs,
+                cache,
+                store,
+                workers=args.workers,
+                interval=args.interval,
+                report=lambda line: print(line, flush=True),
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store is not None:
+            store.close()
+
+
+def convert_serve(argv):
+    from . import server
+
+    parser = argparse.ArgumentParser(
+        prog="mc serve",
+        description="Run a local conversion server that keeps rates and connections warm",
+        epilog="While the server is running, `mc` sends conversions to it. "
+        "Conversions are available over HTTP at /convert?amount=10&from=USD&to=GBP"
+        "[&date=YYYY-MM-DD][&bank_fee=PERCENTAGE].",
+    )
+    parser.add_argument(
+        "--host",
+        default=server.DEFAULT_HOST,
+        help="Address to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=server.DEFAULT_PORT,
+        help="Port to listen on. Defaults to any free port",
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=DEFAULT_LRU_CAPACITY,
+        help="Number of rates to keep in memory (default: %(default)s)",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup(args)
+
+    cache = LruRateCache(
+        capacity=args.capacity, backing=None if args.no_cache else RateCache()
+    )
+    server.serve(cache, host=args.host, port=args.port)
+
+
+def convert_bench(argv):
+    from . import bench
+
+    parser = argparse.ArgumentParser(
+        prog="mc bench",
+        description="Benchmark conversions against a local stand-in for the MasterCard API",
+        epilog="Reports latency percentiles, throughput and peak memory for each workload: "
+        "single (one request at a time), batch (a statement with repeated rates), "
+        "concurrent (requests from several threads), cached (local conversions) and "
+        "bulk-float, bulk-decimal and bulk-units (many amounts converted locally as floats, "
+        "exact decimals and integer minor units).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workload",
+        action="append",
+        choices=bench.WORKLOADS,
+        help="Workload to run. Repeat to run several. Defaults to all of them",
+    )
+    parser.add_argument(
+        "-n",
+        "--iterations",
+        type=int,
+        default=bench.DEFAULT_ITERATIONS,
+        help="Conversions per workload (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=bench.DEFAULT_CONCURRENCY,
+        help="Threads used by the concurrent workload (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=bench.DEFAULT_LATENCY,
+        help="Seconds the stand-in API waits before each response (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip measuring peak memory, which runs each workload a second time",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Save the results as JSON to compare with later runs",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="Show the change from results saved earlier with --output",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup(args)
+
+    baseline = bench.load_report(args.compare) if args.compare else None
+    report = bench.run(
+        workloads=args.workload or bench.WORKLOADS,
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        latency=args.latency,
+        memory=not args.no_memory,
+    )
+
+    print(bench.format_report(report, baseline))
+    if args.output:
+        bench.save_report(report, args.output)
+
+
+def guess_format(filename):
+    from .domain import batch
+
+    return batch.guess_format(None if filename == "-" else filename)
+
+
+def open_text(filename, mode, standard_stream):
+    if filename == "-":
+        # Don't close stdin/stdout when finished
+        return open(standard_stream.fileno(), mode, newline="", closefd=False)
+    return open(filename, mode, newline="")
+
+
+def add_output_arguments(parser, format_help):
+    parser.add_argument("-f", "--format", choices=output.FORMATS, help=format_help)
+    parser.add_argument(
+        "--line-buffered",
+        action="store_true",
+        help="Flush the output after every record rather than in large blocks, "
+        "for programs reading it as it is written",
+    )
+
+
+def add_common_arguments(parser):
+    parser.add_argument(
+        "--log-level",
+        help="Set logging level",
+        default="WARNING",
+        type=str.upper,
+        choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"],
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the local rate cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached rates and fetch them again, updating the local rate cache",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=transport.DEFAULT_TIMEOUT,
+        help="Seconds to wait for MasterCard to respond to each request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=transport.DEFAULT_RETRIES,
+        help="Times to retry throttled, failed or timed out requests (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=throttle.DEFAULT_REQUESTS_PER_SECOND,
+        help="Most requests per second to make to MasterCard, halved whenever MasterCard "
+        "throttles requests (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=throttle.DEFAULT_BURST,
+        help="Requests that can be made at once before --rate-limit applies (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--circuit-threshold",
+        type=int,
+        default=throttle.DEFAULT_FAILURE_THRESHOLD,
+        help="Failed requests in a row after which MasterCard isn't contacted for a while, "
+        "using cached rates where possible (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--circuit-reset",
+        type=float,
+        default=throttle.DEFAULT_RESET_TIMEOUT,
+        help="Seconds to wait before contacting MasterCard again after repeated failures "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=mastercard.BASE_URL,
+        help="Base URL of the MasterCard currency rate API, e.g. to use a local stand-in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print timings of requests and cache lookups, and counts of cache hits, "
+        "retries and bytes received, to stderr on exit",
+    )
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument(
+        "--record",
+        metavar="FIXTURE_DIR",
+        help="Save every response from MasterCard as a fixture in FIXTURE_DIR",
+    )
+    fixtures.add_argument(
+        "--offline",
+        metavar="FIXTURE_DIR",
+        help="Answer requests from fixtures saved with --record instead of contacting MasterCard",
+    )
+
+
+def setup(args):
+    logging.basicConfig(level=logging.getLevelName(args.log_level))
+    logging.debug(args)
+
+    if args.stats:
+        stats = instrumentation.Stats()
+        instrumentation.add_hook(stats)
+        atexit.register(lambda: print(stats.summary(), file=sys.stderr))
+
+    http_settings = {
+        "retries": args.retries,
+        "timeout": args.timeout,
+        "requests_per_second": args.rate_limit,
+        "burst": args.burst,
+        "failure_threshold": args.circuit_threshold,
+        "reset_timeout": args.circuit_reset,
+    }
+    if args.offline:
+        mastercard.configure(
+            transport=transport.ReplayTransport(args.offline), base_url=args.base_url
+        )
+    elif args.record:
+        mastercard.configure(
+            transport=transport.RecordingTransport(
+                args.record, transport.default_transport(**http_settings)
+            ),
+            base_url=args.base_url,
+        )
+    else:
+        mastercard.configure(base_url=args.base_url, **http_settings)
+
+
+COMMANDS = {
+    "batch": convert_batch,
+    "bench": convert_bench,
+    "history": convert_history,
+    "prefetch": convert_prefetch,
+    "serve": convert_serve,
+    "store": convert_store,
+}
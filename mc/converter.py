@@ -0,0 +1,408 @@
+from mc.domain import transaction
+from mc.repository import mastercard, transport
+from mc.repository.cache import LruRateCache
+
+DEFAULT_WORKERS = 8
+
+
+class Converter:
+    """Converts currency at Mastercard's rates, keeping its state between conversions.
+
+    Rates come from a backend: by default Mastercard, through a client of its own
+    with an in-memory cache, so a long-lived process reuses connections and rates
+    rather than setting them up for every conversion. The classmethods build
+    converters for the other backends. exchange_rate_date and bank_fee_percentage
+    are the defaults for conversions that don't give them.
+
+        with Converter.live(cache=RateCache()) as converter:
+            converter.convert(Decimal("10.50"), "USD", "GBP")["card_amount"]
+
+    Closing the converter closes its backend, with the client and cache it holds.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        exchange_rate_date=transaction.LATEST_DATE,
+        bank_fee_percentage=0,
+        workers=DEFAULT_WORKERS,
+    ):
+        if backend is None:
+            backend = MastercardBackend(mastercard.MastercardClient(), LruRateCache())
+        self.backend = backend
+        self.exchange_rate_date = exchange_rate_date
+        self.bank_fee_percentage = bank_fee_percentage
+        self.workers = workers
+
+    @classmethod
+    def live(
+        cls,
+        cache=None,
+        exchange_rate_date=transaction.LATEST_DATE,
+        bank_fee_percentage=0,
+        workers=DEFAULT_WORKERS,
+        **client_settings,
+    ):
+        """Convert at rates fetched from Mastercard.
+
+        Fetched rates are kept in cache, by default in memory. Other keyword
+        arguments, such as base_url, timeout or requests_per_second, are passed on to
+        MastercardClient.
+        """
+        backend = MastercardBackend(
+            mastercard.MastercardClient(**client_settings),
+            LruRateCache() if cache is None else cache,
+        )
+        return cls(backend, exchange_rate_date, bank_fee_percentage, workers)
+
+    @classmethod
+    def offline(cls, fixture_dir, base_url=mastercard.BASE_URL, **settings):
+        """Convert at rates from fixtures saved with `mc --record`, without the network."""
+        client = mastercard.MastercardClient(
+            transport=transport.ReplayTransport(fixture_dir), base_url=base_url
+        )
+        return cls(MastercardBackend(client, LruRateCache()), **settings)
+
+    @classmethod
+    def cached(cls, cache, **settings):
+        """Convert at rates already in cache only, never contacting Mastercard."""
+        return cls(CacheBackend(cache), **settings)
+
+    @classmethod
+    def from_matrix(cls, matrix, **settings):
+        """Convert at the rates in a RateMatrix, on its date only."""
+        return cls(MatrixBackend(matrix), **settings)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.backend.close()
+
+    def convert(
+        self,
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        exchange_rate_date=None,
+        bank_fee_percentage=None,
+    ):
+        """Settle a transaction, returning the same result as transaction.settle."""
+        return self.backend.settle(
+            transaction_amount=transaction_amount,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=self._date(exchange_rate_date),
+            bank_fee_percentage=self._bank_fee(bank_fee_percentage),
+        )
+
+    def convert_many(self, transactions):
+        """Settle many transactions, returning their results in the same order.
+
+        Transactions are mappings with the fields amount, from, to and optionally date
+        and bank_fee, as `mc batch` reads them. Each is settled just as convert
+        settles it, with up to workers settled at a time; those needing the same rate
+        share a single request for it. Mastercard is asked through an event loop, so
+        this can't be called from a running one; use convert_many_async there.
+        """
+        return self.backend.settle_many(self._settlements(transactions), self.workers)
+
+    async def convert_many_async(self, transactions):
+        """Like convert_many, but awaited in the caller's running event loop."""
+        return await self.backend.settle_many_async(
+            self._settlements(transactions), self.workers
+        )
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date=None):
+        """Return (conversion_rate_date, conversion_rate) for a currency pair."""
+        return self.backend.rate(
+            transaction_currency, card_currency, self._date(exchange_rate_date)
+        )
+
+    def _settlements(self, transactions):
+        return [
+            {
+                "transaction_amount": row["amount"],
+                "transaction_currency": row["from"],
+                "card_currency": row["to"],
+                "exchange_rate_date": self._date(row.get("date")),
+                "bank_fee_percentage": self._bank_fee(row.get("bank_fee")),
+            }
+            for row in transactions
+        ]
+
+    def _date(self, exchange_rate_date):
+        return exchange_rate_date or self.exchange_rate_date
+
+    def _bank_fee(self, bank_fee_percentage):
+        if bank_fee_percentage is None:
+            return self.bank_fee_percentage
+        return bank_fee_percentage
+
+
+class MastercardBackend:
+    """Rates from Mastercard, read from and written to cache if given.
+
+    Requests go through client, a MastercardClient, or the module-level default client
+    if None, so that the backend follows mastercard.configure.
+    """
+
+    def __init__(self, client=None, cache=None, refresh=False):
+        self.client = client
+        self.cache = cache
+        self.refresh = refresh
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def settle(self, **arguments):
+        return transaction.settle(
+            cache=self.cache, refresh=self.refresh, client=self.client, **arguments
+        )
+
+    def settle_many(self, settlements, workers):
+        # Imported here as asyncio is slow to import
+        import asyncio
+
+        return asyncio.run(self.settle_many_async(settlements, workers))
+
+    async def settle_many_async(self, settlements, workers):
+        import asyncio
+
+        from mc.repository.mastercard_async import AsyncMastercardClient
+
+        # Without a client of its own, the default client is used, as it is by the
+        # module-level functions behind transaction.settle
+        client = AsyncMastercardClient(
+            self.client or mastercard.default_client(), workers
+        )
+        try:
+            return await asyncio.gather(
+                *(
+                    transaction.settle_async(
+                        client, cache=self.cache, refresh=self.refresh, **arguments
+                    )
+                    for arguments in settlements
+                )
+            )
+        finally:
+            client.close()
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date):
+        return transaction.rate(
+            transaction_currency,
+            card_currency,
+            exchange_rate_date,
+            cache=self.cache,
+            refresh=self.refresh,
+            client=self.client,
+        )
+
+
+class CacheBackend:
+    """Rates already in a rate cache, raising RateNotFoundError for any other."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def close(self):
+        self.cache.close()
+
+    def settle(self, **arguments):
+        return settle_locally(self, **arguments)
+
+    def settle_many(self, settlements, workers):
+        return settle_each(self, settlements)
+
+    async def settle_many_async(self, settlements, workers):
+        return settle_each(self, settlements)
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date):
+        cached = transaction.cached_rate(
+            self.cache, transaction_currency, card_currency, exchange_rate_date
+        )
+        if cached is None:
+            raise RateNotFoundError(
+                f"No cached rate for {transaction_currency}->{card_currency}"
+                f" on {exchange_rate_date}"
+            )
+        return cached
+
+
+class MatrixBackend:
+    """Rates from a RateMatrix, which only has rates for its own date."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def close(self):
+        pass
+
+    def settle(self, **arguments):
+        return settle_locally(self, **arguments)
+
+    def settle_many(self, settlements, workers):
+        return settle_each(self, settlements)
+
+    async def settle_many_async(self, settlements, workers):
+        return settle_each(self, settlements)
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date):
+        if exchange_rate_date not in (transaction.LATEST_DATE, self.matrix.fx_date):
+            raise RateNotFoundError(
+                f"Rate matrix is for {self.matrix.fx_date}, not {exchange_rate_date}"
+            )
+        try:
+            return self.matrix.fx_date, self.matrix.rate(
+                transaction_currency, card_currency
+            )
+        except KeyError as e:
+            raise RateNotFoundError(
+                f"No rate known for {transaction_currency}->{card_currency}"
+                f" on {self.matrix.fx_date}"
+            ) from e
+
+
+class ServerBackend:
+    """Rates from a running `mc serve`, found through its state file unless address is given."""
+
+    def __init__(self, address=None):
+        self.address = address
+
+    def close(self):
+        pass
+
+    def settle(self, **arguments):
+        # Imported here as http.server is slow to import
+        from mc import server
+
+        address = self.address or server.server_address()
+        result = (
+            None if address is None else server.settle_via_server(address, **arguments)
+        )
+        if result is None:
+            raise RateNotFoundError("No conversion server is running")
+        return result
+
+    def settle_many(self, settlements, workers):
+        return settle_each(self, settlements)
+
+    async def settle_many_async(self, settlements, workers):
+        import asyncio
+
+        # Requests to the server block, so they're kept out of the event loop
+        return await asyncio.to_thread(settle_each, self, settlements)
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date):
+        result = self.settle(
+            transaction_amount=1,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=exchange_rate_date,
+        )
+        return result["conversion_rate_date"], result["conversion_rate"]
+
+
+class FallbackBackend:
+    """Tries each backend in turn, moving on when one doesn't have a rate."""
+
+    def __init__(self, *backends):
+        self.backends = backends
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    def settle(self, **arguments):
+        return self._first("settle", **arguments)
+
+    def settle_many(self, settlements, workers):
+        results, pending = self._settle_all_but_last(settlements)
+
+        # What's left is settled together by the last backend
+        if pending:
+            settled = self.backends[-1].settle_many(
+                [settlements[i] for i in pending], workers
+            )
+            for i, result in zip(pending, settled):
+                results[i] = result
+        return results
+
+    async def settle_many_async(self, settlements, workers):
+        results, pending = self._settle_all_but_last(settlements)
+
+        if pending:
+            settled = await self.backends[-1].settle_many_async(
+                [settlements[i] for i in pending], workers
+            )
+            for i, result in zip(pending, settled):
+                results[i] = result
+        return results
+
+    def rate(self, transaction_currency, card_currency, exchange_rate_date):
+        return self._first(
+            "rate", transaction_currency, card_currency, exchange_rate_date
+        )
+
+    def _settle_all_but_last(self, settlements):
+        """Settle what all but the last backend can.
+
+        Returns the results, None where not yet settled, and the indexes of the
+        settlements that are left.
+        """
+        results = [None] * len(settlements)
+        pending = range(len(settlements))
+        for backend in self.backends[:-1]:
+            missing = []
+            for i in pending:
+                try:
+                    results[i] = backend.settle(**settlements[i])
+                except RateNotFoundError:
+                    missing.append(i)
+            pending = missing
+        return results, pending
+
+    def _first(self, method, *args, **kwargs):
+        for backend in self.backends[:-1]:
+            try:
+                return getattr(backend, method)(*args, **kwargs)
+            except RateNotFoundError:
+                continue
+        return getattr(self.backends[-1], method)(*args, **kwargs)
+
+
+def settle_locally(
+    backend,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+):
+    """Settle a transaction at the rate a backend gives for its currency pair."""
+    conversion_rate_date, conversion_rate = backend.rate(
+        transaction_currency, card_currency, exchange_rate_date
+    )
+    return transaction.local_settle(
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        conversion_rate_date,
+        conversion_rate,
+        bank_fee_percentage,
+    )
+
+
+def settle_each(backend, settlements):
+    """Settle transactions one after another, for backends that settle locally."""
+    return [backend.settle(**arguments) for arguments in settlements]
+
+
+class RateNotFoundError(LookupError):
+    pass
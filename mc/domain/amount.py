@@ -0,0 +1,105 @@
+import json
+from decimal import ROUND_HALF_UP, Context, Decimal, InvalidOperation
+
+# Card amounts are rounded half away from zero, as Mastercard's rounding appears to
+# be; no recorded response lands exactly half way, so that isn't confirmed. The
+# precision is plenty for the product of an amount, a rate and a bank fee to be
+# exact before it is rounded.
+EXACT = Context(prec=100, rounding=ROUND_HALF_UP)
+# Decimal("1E-places") for rounding to places
+QUANTUMS = [Decimal(1).scaleb(-places) for places in range(19)]
+# Mastercard's crdhldBillAmt carries as many decimal places as its conversionRate
+CARD_AMOUNT_PLACES = 6
+
+
+def parse(value):
+    """Parse an amount such as "1234567.89", or a number read from JSON, as a Decimal."""
+    try:
+        amount = to_decimal(value.strip() if isinstance(value, str) else value)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount {value!r}")
+    return amount
+
+
+def to_decimal(number):
+    """Convert a number to a Decimal, taking floats to be the decimal they're shown as.
+
+    That way 0.1 becomes Decimal("0.1") rather than the binary fraction nearest it.
+    """
+    if isinstance(number, Decimal):
+        return number
+    if isinstance(number, float):
+        return Decimal(repr(number))
+    return Decimal(number)
+
+
+def format(number):
+    """Show an amount in plain notation, never with an exponent, e.g. 1234567.89."""
+    return f"{to_decimal(number):f}"
+
+
+def round_places(number, places):
+    """Round a Decimal to places as Mastercard do, dropping trailing zeros after the point."""
+    rounded = EXACT.normalize(EXACT.quantize(number, QUANTUMS[places]))
+    if rounded == rounded.to_integral_value():
+        # normalize gives whole numbers an exponent, e.g. 1E+3
+        return EXACT.quantize(rounded, QUANTUMS[0])
+    return rounded
+
+
+def card_amount(transaction_amount, conversion_rate, bank_fee_percentage=0):
+    """The card amount for a Decimal transaction amount, computed exactly as a Decimal.
+
+    The products are exact, so the only rounding is Mastercard's, to
+    CARD_AMOUNT_PLACES.
+    """
+    return round_places(
+        EXACT.multiply(
+            transaction_amount, card_multiplier(conversion_rate, bank_fee_percentage)
+        ),
+        CARD_AMOUNT_PLACES,
+    )
+
+
+def card_multiplier(conversion_rate, bank_fee_percentage=0):
+    """What a transaction amount is multiplied by to give the card amount, exactly."""
+    # Mastercard applies the bank fee on top of the converted amount
+    return EXACT.multiply(
+        to_decimal(conversion_rate),
+        EXACT.divide(100 + to_decimal(bank_fee_percentage), 100),
+    )
+
+
+def fixed(number):
+    """Split a Decimal exactly into integer units and decimal places: units / 10**places."""
+    sign, digits, exponent = number.as_tuple()
+    units = int("".join(map(str, digits)))
+    if sign:
+        units = -units
+    if exponent >= 0:
+        return units * 10**exponent, 0
+    return units, -exponent
+
+
+def to_json(value):
+    """JSON text for value, writing Decimals as numbers with exactly their own digits.
+
+    json.dumps can only write numbers through float, which keeps about 15
+    significant digits; this handles the dicts and lists results are made of.
+    """
+    if isinstance(value, Decimal):
+        return format(value)
+    if isinstance(value, dict):
+        return (
+            "{"
+            + ", ".join(
+                f"{json.dumps(str(key))}: {to_json(item)}"
+                for key, item in value.items()
+            )
+            + "}"
+        )
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(to_json(item) for item in value) + "]"
+    return json.dumps(value)
@@ -0,0 +1,439 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import pairwise
+
+from mc.domain import amount, currency, date, transaction
+from mc.output import RecordWriter
+
+INPUT_FIELDS = ("amount", "from", "to", "date", "bank_fee")
+FORMATS = ("csv", "jsonl")
+# Large enough to keep workers busy, small enough not to hold much output at once
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+CHECKPOINT_SUFFIX = ".checkpoint"
+# How much of the converted input is read at a time to check it is unchanged
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def guess_format(filename):
+    if filename is not None and filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def read_rows(lines, input_format="csv", fieldnames=None):
+    """Lazily parse transaction rows from an iterable of text lines.
+
+    CSV lines without a header line need its fieldnames. A row that can't be parsed
+    raises RowError, with rows numbered from 1.
+    """
+    if input_format == "jsonl":
+        records = (line for line in lines if line.strip())
+    else:
+        records = csv.DictReader(lines, fieldnames)
+
+    for number, record in enumerate(records, start=1):
+        try:
+            if input_format == "jsonl":
+                # Amounts are read as Decimals, as a float would lose digits
+                record = json.loads(record, parse_float=Decimal)
+            row = parse_row(record)
+        except ValueError as e:
+            raise RowError(number, str(e)) from None
+        yield row
+
+
+def parse_row(record):
+    # Every problem with a row is a ValueError, which read_rows reports as a RowError,
+    # a JSON line that isn't an object included
+    try:
+        missing = [field for field in ("amount", "from", "to") if not record.get(field)]
+    except AttributeError:
+        raise ValueError(f"Row isn't an object: {record!r}") from None
+    if missing:
+        raise ValueError(f"Row is missing required fields {missing}: {record}")
+
+    exchange_rate_date = record.get("date")
+    return {
+        "amount": amount.parse(record["amount"]),
+        "from": str(record["from"]).strip().upper(),
+        "to": str(record["to"]).strip().upper(),
+        "date": date.parse(exchange_rate_date)
+        if exchange_rate_date
+        else transaction.LATEST_DATE,
+        "bank_fee": amount.parse(record.get("bank_fee") or 0),
+    }
+
+
+class RowError(ValueError):
+    """A row that can't be parsed, and its number."""
+
+    def __init__(self, number, problem):
+        # Passing both on keeps the error picklable, to cross from worker processes
+        super().__init__(number, problem)
+        self.number = number
+        self.problem = problem
+
+    def __str__(self):
+        return f"Row {self.number}: {self.problem}"
+
+
+def numbered_from(rows, path, offset, input_format):
+    """Pass on rows read from offset in a file, numbering a RowError from the file's start.
+
+    The rows before offset are only counted if there is an error.
+    """
+    try:
+        yield from rows
+    except RowError as e:
+        before = rows_before(path, offset, input_format)
+        raise RowError(before + e.number, e.problem) from None
+
+
+def rows_before(path, offset, input_format):
+    """How many rows a file has before offset, which is at the start of a line."""
+    with open(path, "rb") as input_file:
+        lines = sum(
+            1
+            for line in read_lines(input_file, 0, offset)
+            if input_format == "csv" or line.strip()
+        )
+    # The CSV header line isn't a row
+    return max(lines - 1, 0) if input_format == "csv" else lines
+
+
+def check_currencies(rows, currencies):
+    """Return a message for every row using a currency not in the catalogue."""
+    problems = []
+    for number, row in enumerate(rows, start=1):
+        for field in ("from", "to"):
+            try:
+                currency.check(row[field], currencies)
+            except currency.UnknownCurrencyError as e:
+                problems.append(f"Row {number}: {e}")
+    return problems
+
+
+def checked_rows(rows, currencies):
+    """Pass rows on, raising UnknownCurrencyError at the first with an unknown currency."""
+    for row in rows:
+        currency.check(row["from"], currencies)
+        currency.check(row["to"], currencies)
+        yield row
+
+
+def convert_rows(rows, cache, refresh=False):
+    """Settle each row as it arrives.
+
+    Rows sharing a date and currency pair only cause one rate lookup, as every rate
+    fetched is put into the cache and later rows are settled locally from it.
+    """
+    refreshed = set()
+
+    for row in rows:
+        key = (row["date"], row["from"], row["to"])
+        yield transaction.settle(
+            transaction_amount=row["amount"],
+            transaction_currency=row["from"],
+            card_currency=row["to"],
+            exchange_rate_date=row["date"],
+            bank_fee_percentage=row["bank_fee"],
+            cache=cache,
+            refresh=refresh and key not in refreshed,
+        )
+        refreshed.add(key)
+
+
+def write_rows(results, output, output_format="csv", header=True, line_buffered=False):
+    with RecordWriter(output, output_format, header, line_buffered) as writer:
+        for result in results:
+            writer.write(result)
+
+
+def convert_appended(
+    input_path,
+    output_path,
+    input_format,
+    cache,
+    refresh=False,
+    currencies=None,
+    output_format=None,
+):
+    """Convert the rows appended to a file since the last run, appending them to output.
+
+    A checkpoint next to the output records how much of the input was converted,
+    the SHA-256 of that much and the size of the output. If the input no longer
+    starts with what was converted, or the output has lost rows, everything is
+    converted again. Only complete lines are converted, so that a row still being
+    written is left for the next run. With a currency catalogue, every new row is
+    checked before any are converted. The output is in input_format unless an
+    output_format is given, which can't be json as a JSON array can't be appended
+    to. Returns how many rows were converted.
+    """
+    output_format = output_format or input_format
+    if output_format == "json":
+        raise ValueError("Rows can't be appended to json output, use jsonl instead")
+
+    checkpoint_file = output_path + CHECKPOINT_SUFFIX
+    checkpoint = read_checkpoint(checkpoint_file)
+
+    with open(input_path, "rb") as input_file:
+        start, hasher = resume_offset(input_file, output_path, checkpoint)
+
+        end = start
+        for line in input_file:
+            if not line.endswith(b"\n"):
+                break
+            hasher.update(line)
+            end += len(line)
+
+        fieldnames = None
+        if input_format == "csv" and start:
+            input_file.seek(0)
+            fieldnames = next(csv.reader([input_file.readline().decode()]))
+
+        def rows():
+            lines = read_lines(input_file, start, end)
+            if not start:
+                return read_rows(lines, input_format)
+            return numbered_from(
+                read_rows(lines, input_format, fieldnames),
+                input_path,
+                start,
+                input_format,
+            )
+
+        if currencies is not None:
+            for _ in checked_rows(rows(), currencies):
+                pass
+
+        if start:
+            # Drop any rows written after the checkpoint by a run that didn't finish
+            os.truncate(output_path, checkpoint["output_size"])
+        converted = 0
+
+        def counted(results):
+            nonlocal converted
+            for result in results:
+                converted += 1
+                yield result
+
+        with open(output_path, "a" if start else "w", newline="") as output:
+            results = convert_rows(rows(), cache, refresh=refresh)
+            write_rows(counted(results), output, output_format, header=not start)
+
+    write_checkpoint(
+        checkpoint_file,
+        {
+            "input_offset": end,
+            "sha256": hasher.hexdigest(),
+            "output_size": os.path.getsize(output_path),
+        },
+    )
+    return converted
+
+
+def resume_offset(input_file, output_path, checkpoint):
+    """Return where to carry on converting input_file from, and a hash of the input up to there.
+
+    The input is read up to the offset in the checkpoint, and the offset is 0 if
+    there's no checkpoint or it no longer matches the input or output.
+    """
+    if checkpoint is None or "sha256" not in checkpoint:
+        return 0, hashlib.sha256()
+    if not os.path.exists(output_path):
+        return 0, hashlib.sha256()
+    if os.path.getsize(output_path) < checkpoint["output_size"]:
+        return 0, hashlib.sha256()
+
+    hasher = hashlib.sha256()
+    remaining = checkpoint["input_offset"]
+    while remaining:
+        block = input_file.read(min(remaining, HASH_BLOCK_BYTES))
+        if not block:
+            break
+        hasher.update(block)
+        remaining -= len(block)
+
+    if remaining or hasher.hexdigest() != checkpoint["sha256"]:
+        input_file.seek(0)
+        return 0, hashlib.sha256()
+    return checkpoint["input_offset"], hasher
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_checkpoint(path, checkpoint):
+    # Replace the checkpoint in one go, so that it is never half-written
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+
+def read_lines(input_file, start, end):
+    """Yield the lines of a binary file from start to end as text."""
+    input_file.seek(start)
+    while start < end:
+        line = input_file.readline()
+        start += len(line)
+        yield line.decode()
+
+
+def convert_file(
+    path,
+    output,
+    input_format,
+    cache,
+    workers,
+    refresh=False,
+    currencies=None,
+    output_format=None,
+    line_buffered=False,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+):
+    """Convert a whole file in a pool of worker processes, writing results in input order.
+
+    The file is split into chunks of whole lines, so rows mustn't contain line
+    breaks. Workers first find the rates the rows need, which are looked up once
+    here and handed to every worker; the workers then settle their chunks locally,
+    exactly as convert_rows settles rows whose rate is cached. Every chunk is
+    therefore parsed twice, once for its rates and once to convert it, so that no
+    rows are held in memory in between. With a currency catalogue, every currency
+    used is checked before any rates are looked up. The output is in input_format
+    unless an output_format other than json is given.
+
+    At most two chunks per worker are converted ahead of the output, so the
+    converted output held in memory doesn't grow with the size of the file.
+    """
+    output_format = output_format or input_format
+    if output_format == "json":
+        raise ValueError("json output can't be written in parallel, use jsonl instead")
+
+    with open(path, "rb") as input_file:
+        header = input_file.readline() if input_format == "csv" else b""
+        size = os.fstat(input_file.fileno()).st_size
+        count = max(workers, -(-size // chunk_bytes))
+        chunks = chunk_ranges(input_file, len(header), size, count)
+    fieldnames = next(csv.reader([header.decode()])) if header else None
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        keys = set().union(
+            *bounded_map(
+                executor,
+                chunk_keys,
+                [(path, chunk, input_format, fieldnames) for chunk in chunks],
+                2 * workers,
+            )
+        )
+
+    if currencies is not None:
+        for code in sorted({code for key in keys for code in key[1:]}):
+            currency.check(code, currencies)
+
+    rates = {
+        key: transaction.rate(key[1], key[2], key[0], cache=cache, refresh=refresh)
+        for key in sorted(keys)
+    }
+
+    with (
+        RecordWriter(output, output_format, line_buffered=line_buffered) as writer,
+        ProcessPoolExecutor(
+            max_workers=workers, initializer=use_rates, initargs=(rates,)
+        ) as executor,
+    ):
+        for converted in bounded_map(
+            executor,
+            convert_chunk,
+            [
+                (path, chunk, input_format, fieldnames, output_format)
+                for chunk in chunks
+            ],
+            2 * workers,
+        ):
+            writer.write_formatted(converted)
+
+
+def bounded_map(executor, function, calls, in_flight):
+    """Yield function(*arguments) for each of calls in order, like executor.map.
+
+    Unlike executor.map, which submits every call at once, only in_flight calls are
+    submitted ahead of the result being yielded, so results that haven't been used
+    yet don't pile up in memory.
+    """
+    pending = deque()
+    for arguments in calls:
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, *arguments))
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunk_ranges(input_file, start, size, count):
+    """Split the bytes from start to size into about count ranges ending at line breaks."""
+    boundaries = [start]
+    for i in range(1, count):
+        input_file.seek(max(start + (size - start) * i // count, boundaries[-1]))
+        input_file.readline()
+        position = input_file.tell()
+        if position > boundaries[-1]:
+            boundaries.append(position)
+    if size > boundaries[-1]:
+        boundaries.append(size)
+    return list(pairwise(boundaries))
+
+
+def read_chunk(path, chunk, input_format, fieldnames):
+    start, end = chunk
+    with open(path, "rb") as input_file:
+        input_file.seek(start)
+        text = input_file.read(end - start).decode()
+
+    lines = io.StringIO(text, newline="")
+    return numbered_from(
+        read_rows(lines, input_format, fieldnames), path, start, input_format
+    )
+
+
+def chunk_keys(path, chunk, input_format, fieldnames):
+    return {
+        (row["date"], row["from"], row["to"])
+        for row in read_chunk(path, chunk, input_format, fieldnames)
+    }
+
+
+# Rates for every (date, from, to) in the file, set in each worker process
+_rates = None
+
+
+def use_rates(rates):
+    global _rates
+    _rates = rates
+
+
+def convert_chunk(path, chunk, input_format, fieldnames, output_format):
+    results = (
+        transaction.local_settle(
+            row["amount"],
+            row["from"],
+            row["to"],
+            *_rates[row["date"], row["from"], row["to"]],
+            row["bank_fee"],
+        )
+        for row in read_chunk(path, chunk, input_format, fieldnames)
+    )
+
+    output = io.StringIO(newline="")
+    write_rows(results, output, output_format, header=False)
+    return output.getvalue()
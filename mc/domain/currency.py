@@ -0,0 +1,57 @@
+import difflib
+import time
+
+from mc.repository import mastercard
+
+# Mastercard rarely changes the currencies it settles in
+CATALOGUE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+MAX_SUGGESTIONS = 3
+
+
+class UnknownCurrencyError(ValueError):
+    def __init__(self, code, suggestions):
+        self.code = code
+        self.suggestions = suggestions
+        message = f"Unknown currency {code}"
+        if suggestions:
+            message += f", did you mean {' or '.join(suggestions)}?"
+        super().__init__(message)
+
+
+def catalogue(cache, refresh=False):
+    """Return {alpha_code: name} for every currency Mastercard settles in.
+
+    The catalogue is kept in the cache and fetched again once it is a week old.
+    """
+    if not refresh:
+        currencies = cache.currencies()
+        if currencies is not None:
+            return currencies
+
+    currencies = {
+        currency["alphaCd"]: currency["currNam"].strip()
+        for currency in mastercard.currencies()
+    }
+    cache.put_currencies(currencies, time.time() + CATALOGUE_MAX_AGE_SECONDS)
+    return currencies
+
+
+def check(code, currencies):
+    """Raise UnknownCurrencyError, suggesting similar currencies, if code isn't known."""
+    if code not in currencies:
+        raise UnknownCurrencyError(code, suggestions(code, currencies))
+
+
+def suggestions(code, currencies):
+    """Return the currencies whose code or name most resemble code."""
+    matches = difflib.get_close_matches(code, currencies, n=MAX_SUGGESTIONS, cutoff=0.6)
+    if matches:
+        return matches
+
+    # Perhaps a currency was given by name, e.g. "yen"
+    by_word = {}
+    for alpha_code, name in currencies.items():
+        for word in name.upper().split():
+            by_word.setdefault(word, []).append(alpha_code)
+    words = difflib.get_close_matches(code.upper(), by_word, n=1, cutoff=0.75)
+    return by_word[words[0]][:MAX_SUGGESTIONS] if words else []
@@ -1,12 +1,21 @@
 import datetime
 
-from dateutil.parser import parse as parse_date
-
 MASTERCARD_DATE_FORMAT = "%Y-%m-%d"
+# Mastercard publish each weekday's rates part way through the day; this is roughly
+# when they have appeared by, in UTC
+PUBLICATION_HOUR_UTC = 14
+# How soon to check again when rates are late
+LATE_PUBLICATION_RETRY_SECONDS = 15 * 60
 
 
 def parse(date):
-    return parse_date(date).strftime(MASTERCARD_DATE_FORMAT)
+    # Most dates are given in ISO format, which doesn't need dateutil (slow to import)
+    try:
+        return datetime.datetime.fromisoformat(date).strftime(MASTERCARD_DATE_FORMAT)
+    except ValueError:
+        from dateutil.parser import parse as parse_date
+
+        return parse_date(date).strftime(MASTERCARD_DATE_FORMAT)
 
 
 def date_today():
@@ -22,5 +31,56 @@ def date_n_days_ago(days_ago):
     return format_date(date)
 
 
+def dates_between(start_date, end_date):
+    """Yield each date from start_date to end_date inclusive, both in Mastercard format."""
+    date = parse_iso(start_date)
+    end = parse_iso(end_date)
+    while date <= end:
+        yield format_date(date)
+        date += datetime.timedelta(days=1)
+
+
+def is_weekend(date):
+    # Mastercard don't publish rates on Saturdays or Sundays
+    return parse_iso(date).weekday() >= 5
+
+
+def latest_rates_expiry(fx_date, now, late_retry=LATE_PUBLICATION_RETRY_SECONDS):
+    """Return the timestamp until which fx_date can be taken as the latest rates' date.
+
+    That's the next expected publication after now, skipping weekends. If today's
+    rates are due but fx_date is older, they are late, so check again in late_retry.
+    """
+    if is_late(fx_date, now):
+        return now + late_retry
+
+    now_utc = datetime.datetime.fromtimestamp(now, datetime.UTC)
+    publication = now_utc.replace(
+        hour=PUBLICATION_HOUR_UTC, minute=0, second=0, microsecond=0
+    )
+
+    if now_utc >= publication:
+        publication += datetime.timedelta(days=1)
+
+    while publication.weekday() >= 5:
+        publication += datetime.timedelta(days=1)
+
+    return publication.timestamp()
+
+
+def is_late(fx_date, now):
+    """Whether today's rates are due by now but fx_date, the latest found, is older."""
+    now_utc = datetime.datetime.fromtimestamp(now, datetime.UTC)
+    return (
+        now_utc.weekday() < 5
+        and now_utc.hour >= PUBLICATION_HOUR_UTC
+        and fx_date < format_date(now_utc.date())
+    )
+
+
+def parse_iso(date):
+    return datetime.datetime.strptime(date, MASTERCARD_DATE_FORMAT).date()
+
+
 def format_date(date):
     return date.strftime(MASTERCARD_DATE_FORMAT)
@@ -0,0 +1,93 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from mc.domain import date, transaction
+from mc.repository import mastercard
+
+DEFAULT_WORKERS = 8
+
+
+def history(
+    transaction_currency,
+    card_currency,
+    start_date,
+    end_date,
+    cache,
+    workers=DEFAULT_WORKERS,
+    refresh=False,
+):
+    """Return [(fx_date, conversion_rate)] for each published day between two dates.
+
+    Days already in the cache are not fetched again. Weekends are skipped outright,
+    and other days are only fetched if rates_available says they were published.
+    Missing days are fetched by up to workers threads and stored in the cache; the
+    client's rate limit still paces the requests, so it sets the pace rather than
+    workers once workers exceeds its burst.
+    With refresh, every published day is fetched again.
+    """
+    missing = [
+        day
+        for day in date.dates_between(start_date, end_date)
+        if not date.is_weekend(day)
+        and not cache.is_unpublished(day)
+        and (refresh or cache.get(day, transaction_currency, card_currency) is None)
+    ]
+    logging.debug(f"Fetching {len(missing)} days of rates: {missing}")
+
+    def fetch(day):
+        if not mastercard.rates_available(day):
+            # Today's rates may just not be published yet
+            if day < date.date_today():
+                cache.mark_unpublished(day)
+            return
+        transaction.settle(
+            transaction_amount=1,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=day,
+            cache=cache,
+            refresh=refresh,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so that any exception is raised here
+        list(executor.map(fetch, missing))
+
+    return cache.series(transaction_currency, card_currency, start_date, end_date)
+
+
+def fill_store(
+    store,
+    currencies,
+    start_date,
+    end_date,
+    cache,
+    workers=DEFAULT_WORKERS,
+    refresh=False,
+):
+    """Fetch each currency's rates to and from the store's pivot into a RateStore.
+
+    Returns how many rates were stored. Rates come from history, so days already in
+    the cache are not fetched again.
+    """
+    stored = 0
+    for currency in currencies:
+        if currency == store.pivot:
+            continue
+        for transaction_currency, card_currency in (
+            (currency, store.pivot),
+            (store.pivot, currency),
+        ):
+            for fx_date, conversion_rate in history(
+                transaction_currency,
+                card_currency,
+                start_date,
+                end_date,
+                cache,
+                workers=workers,
+                refresh=refresh,
+            ):
+                stored += store.put(
+                    fx_date, transaction_currency, card_currency, conversion_rate
+                )
+    return stored
@@ -0,0 +1,147 @@
+import math
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from mc.domain import transaction
+
+DEFAULT_PIVOT = "USD"
+DEFAULT_TOLERANCE = 0.005
+DEFAULT_WORKERS = 8
+
+
+class RateMatrix:
+    """Rates between every pair of a set of currencies on one date.
+
+    Rates are stored in a flat row-major array of doubles indexed by currency, with
+    NaN for unknown pairs. Pairs without a known rate are answered by triangulating
+    through the pivot currency, so only one rate per currency needs fetching.
+    """
+
+    def __init__(self, currencies, fx_date, pivot=DEFAULT_PIVOT):
+        self.currencies = list(currencies)
+        if pivot not in self.currencies:
+            self.currencies.append(pivot)
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        self.fx_date = fx_date
+        self.pivot = pivot
+
+        size = len(self.currencies)
+        self.size = size
+        self.rates = array("d", [math.nan]) * (size * size)
+        for i in range(size):
+            self.rates[i * size + i] = 1.0
+
+    @classmethod
+    def from_catalogue(cls, currencies, fx_date, pivot=DEFAULT_PIVOT):
+        """Build an empty matrix from a Mastercard settlement-currencies listing."""
+        return cls([currency["alphaCd"] for currency in currencies], fx_date, pivot)
+
+    @classmethod
+    def from_store(cls, store, fx_date):
+        """Build a matrix of every currency in a RateStore on a date."""
+        matrix = cls(store.currencies, fx_date, store.pivot)
+        matrix.load(store)
+        return matrix
+
+    def set(self, transaction_currency, card_currency, conversion_rate):
+        self.rates[self._offset(transaction_currency, card_currency)] = conversion_rate
+
+    def load(self, cache):
+        """Fill in every rate already cached for this matrix's date.
+
+        Works with a RateStore in place of the cache too.
+        """
+        for transaction_currency, card_currency, conversion_rate in cache.rates_on(
+            self.fx_date
+        ):
+            if transaction_currency in self.index and card_currency in self.index:
+                self.set(transaction_currency, card_currency, conversion_rate)
+
+    def direct(self, transaction_currency, card_currency):
+        """Return a known rate for the pair, or its inverse's reciprocal, or None."""
+        rate = self.rates[self._offset(transaction_currency, card_currency)]
+        if not math.isnan(rate):
+            return rate
+
+        inverse = self.rates[self._offset(card_currency, transaction_currency)]
+        if not math.isnan(inverse) and inverse:
+            return 1 / inverse
+
+        return None
+
+    def rate(self, transaction_currency, card_currency):
+        rate = self.direct(transaction_currency, card_currency)
+        if rate is not None:
+            return rate
+
+        to_pivot = self.direct(transaction_currency, self.pivot)
+        from_pivot = self.direct(self.pivot, card_currency)
+        if to_pivot is None or from_pivot is None:
+            raise KeyError(
+                f"No rate known for {transaction_currency}->{card_currency}"
+                f" on {self.fx_date}, directly or via {self.pivot}"
+            )
+        return to_pivot * from_pivot
+
+    def _offset(self, transaction_currency, card_currency):
+        return self.index[transaction_currency] * self.size + self.index[card_currency]
+
+
+def build(
+    currencies, exchange_rate_date, cache, pivot=DEFAULT_PIVOT, workers=DEFAULT_WORKERS
+):
+    """Build a RateMatrix by fetching each currency's rate against the pivot.
+
+    Rates already in the cache are used as-is, so only the missing ones are fetched.
+    """
+    matrix = RateMatrix(currencies, exchange_rate_date, pivot)
+    matrix.load(cache)
+
+    missing = [
+        currency
+        for currency in matrix.currencies
+        if matrix.direct(currency, pivot) is None
+    ]
+
+    def fetch(currency):
+        return transaction.settle(
+            transaction_amount=1,
+            transaction_currency=currency,
+            card_currency=pivot,
+            exchange_rate_date=exchange_rate_date,
+            cache=cache,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(fetch, missing):
+            # Latest rates are resolved to the concrete date they were published for
+            matrix.fx_date = result["conversion_rate_date"]
+            matrix.set(
+                result["transaction_currency"],
+                result["card_currency"],
+                result["conversion_rate"],
+            )
+
+    return matrix
+
+
+def verify(matrix, pairs, tolerance=DEFAULT_TOLERANCE):
+    """Compare derived rates for a sample of pairs against real Mastercard quotes.
+
+    Returns [(transaction_currency, card_currency, derived, actual)] for every pair
+    whose relative difference exceeds the tolerance.
+    """
+    mismatches = []
+    for transaction_currency, card_currency in pairs:
+        derived = matrix.rate(transaction_currency, card_currency)
+        actual = transaction.settle(
+            transaction_amount=1,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=matrix.fx_date,
+        )["conversion_rate"]
+
+        if abs(derived - actual) > tolerance * abs(actual):
+            mismatches.append((transaction_currency, card_currency, derived, actual))
+
+    return mismatches
@@ -0,0 +1,98 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mc.domain import date, transaction
+
+DEFAULT_WORKERS = 8
+# How often to check for rates that are late being published
+DEFAULT_INTERVAL_SECONDS = 5 * 60
+
+
+def parse_pair(pair):
+    """Parse a currency pair given as FROM:TO, e.g. usd:gbp."""
+    transaction_currency, separator, card_currency = pair.upper().partition(":")
+    if not separator or not transaction_currency or not card_currency:
+        raise ValueError(f"Currency pair {pair!r} isn't in the form FROM:TO")
+    return transaction_currency, card_currency
+
+
+def store_pairs(pairs, pivot):
+    """The pairs to and from the pivot that a RateStore needs for pairs."""
+    currencies = sorted({currency for pair in pairs for currency in pair} - {pivot})
+    return [
+        leg for currency in currencies for leg in ((currency, pivot), (pivot, currency))
+    ]
+
+
+def prefetch(pairs, cache, store=None, workers=DEFAULT_WORKERS, refresh=False):
+    """Fetch the latest rates for each pair into the cache, and a RateStore if given.
+
+    Returns (fx_date, fetched): the date of the latest rates and how many rates had
+    to be fetched, as rates already in the cache aren't fetched again. Finding the
+    latest date only probes rates_available, and with refresh it is probed even if
+    the date is memoized. Rates are fetched by up to workers threads, at the pace
+    the client's rate limit allows.
+    """
+    fx_date = transaction.latest_date(cache, refresh=refresh)
+
+    wanted = list(pairs)
+    if store is not None:
+        wanted += store_pairs(pairs, store.pivot)
+    missing = sorted({pair for pair in wanted if cache.get(fx_date, *pair) is None})
+    logging.debug(f"Prefetching {len(missing)} rates for {fx_date}: {missing}")
+
+    def fetch(pair):
+        transaction.rate(*pair, fx_date, cache=cache)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so that any exception is raised here
+        list(executor.map(fetch, missing))
+
+    if store is not None:
+        for pair in store_pairs(pairs, store.pivot):
+            cached = cache.get(fx_date, *pair)
+            if cached is None:
+                # Mastercard answered with the rate of another date
+                logging.warning(f"No {pair[0]}->{pair[1]} rate for {fx_date} to store")
+                continue
+            store.put(fx_date, *pair, cached[1])
+
+    return fx_date, len(missing)
+
+
+def next_poll(fx_date, now, interval=DEFAULT_INTERVAL_SECONDS):
+    """Return (seconds to wait, whether rates are late) before prefetching again.
+
+    That's until the next publication is due, or interval if it's overdue.
+    """
+    due = date.latest_rates_expiry(fx_date, now, late_retry=interval)
+    return max(0.0, due - now), date.is_late(fx_date, now)
+
+
+def run(
+    pairs,
+    cache,
+    store=None,
+    workers=DEFAULT_WORKERS,
+    interval=DEFAULT_INTERVAL_SECONDS,
+    report=print,
+    clock=time.time,
+    sleep=time.sleep,
+):
+    """Prefetch whenever new rates are published, until interrupted.
+
+    A failed prefetch is logged and tried again after interval.
+    """
+    late = False
+    while True:
+        try:
+            fx_date, fetched = prefetch(pairs, cache, store, workers, refresh=late)
+        except Exception:
+            logging.exception(f"Prefetch failed, trying again in {interval:.0f}s")
+            sleep(interval)
+            continue
+        report(f"{fx_date}: fetched {fetched} rates")
+        wait, late = next_poll(fx_date, clock(), interval)
+        logging.info(f"Next prefetch in {wait:.0f}s")
+        sleep(wait)
@@ -0,0 +1,98 @@
+import threading
+
+from mc import instrumentation
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls for the same key.
+
+    While a call for a key is in flight, further calls for that key wait for it and
+    share its result, or its exception, instead of making their own. Works across
+    threads with do() and across tasks in an event loop with do_async(). How many
+    calls were merged is counted as <name>.calls and <name>.merged.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.tasks = {}
+        self.total = 0
+        self.merged = 0
+
+    @property
+    def merge_ratio(self):
+        """Fraction of calls that shared another call's result."""
+        with self.lock:
+            return self.merged / self.total if self.total else 0.0
+
+    def do(self, key, function, *args, **kwargs):
+        """Return (result, shared) of function(*args, **kwargs), calling it once per key at a time.
+
+        shared is True when the result came from a call made for another caller.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        self._count(shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    async def do_async(self, key, function, *args, **kwargs):
+        """Like do(), but awaits the coroutine function(*args, **kwargs)."""
+        # Imported here as asyncio is slow to import
+        import asyncio
+
+        # Tasks can only be awaited in the loop running them
+        key = (asyncio.get_running_loop(), key)
+        with self.lock:
+            task = self.tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self.tasks[key] = asyncio.ensure_future(
+                    function(*args, **kwargs)
+                )
+                task.add_done_callback(lambda _: self._forget_task(key))
+        self._count(shared=not leader)
+
+        # A cancelled caller mustn't cancel the call for everyone else
+        return await asyncio.shield(task), not leader
+
+    def _forget_task(self, key):
+        with self.lock:
+            del self.tasks[key]
+
+    def _count(self, shared):
+        with self.lock:
+            self.total += 1
+            if shared:
+                self.merged += 1
+        instrumentation.count(f"{self.name}.calls")
+        if shared:
+            instrumentation.count(f"{self.name}.merged")
+
+
+class Call:
+    __slots__ = ("done", "error", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
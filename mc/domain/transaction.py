@@ -1,8 +1,19 @@
 import logging
+import time
+from array import array
+from decimal import Decimal
 
+from mc import instrumentation
+from mc.domain import amount, date, singleflight
 from mc.repository import mastercard
+from mc.repository.throttle import CircuitOpenError
 
 DATE_FORMAT = "%Y-%m-%d"
+LATEST_DATE = "0000-00-00"
+CARD_AMOUNT_PLACES = amount.CARD_AMOUNT_PLACES
+
+# Concurrent settlements needing the same rate share one request for it
+rate_requests = singleflight.SingleFlight("rate_requests")
 
 
 def settle(
@@ -11,35 +22,457 @@ def settle(
     card_currency,
     exchange_rate_date,
     bank_fee_percentage=0,
+    cache=None,
+    refresh=False,
+    client=None,
 ):
-    result = mastercard.settle(
-        bank_fee_percentage=bank_fee_percentage,
-        card_currency=card_currency,
-        exchange_rate_date=exchange_rate_date,
-        transaction_amount=transaction_amount,
-        transaction_currency=transaction_currency,
-    )
+    """Settle a transaction at Mastercard's rate, or a cached one.
 
-    logging.debug(result)
+    Requests go through client, a MastercardClient, if given, otherwise through the
+    module-level default client.
+    """
+    with instrumentation.span("transaction.settle"):
+        # Only requests for the latest rates may fall back to stale ones, so the
+        # requested date is kept for that once LATEST_DATE is resolved to a date
+        requested_date = exchange_rate_date
+        exchange_rate_date = resolve_date(exchange_rate_date, cache, refresh)
 
-    return {
-        "bank_fee_percentage": bank_fee_percentage,
-        "card_amount": result["crdhldBillAmt"],
-        "card_currency": result["crdhldBillCurr"],
-        "conversion_rate": result["conversionRate"],
-        "conversion_rate_date": result["fxDate"],
-        "transaction_amount": result["transAmt"],
-        "transaction_currency": result["transCurr"],
-    }
+        if cache is not None and not refresh:
+            cached = cached_settle(
+                cache,
+                transaction_amount,
+                transaction_currency,
+                card_currency,
+                exchange_rate_date,
+                bank_fee_percentage,
+            )
+            if cached is not None:
+                return cached
+
+        try:
+            result, shared = rate_requests.do(
+                (exchange_rate_date, transaction_currency, card_currency),
+                mastercard.settle if client is None else client.settle,
+                bank_fee_percentage=bank_fee_percentage,
+                card_currency=card_currency,
+                exchange_rate_date=exchange_rate_date,
+                transaction_amount=transaction_amount,
+                transaction_currency=transaction_currency,
+            )
+        except CircuitOpenError:
+            fallback = stale_settle(
+                cache,
+                transaction_amount,
+                transaction_currency,
+                card_currency,
+                requested_date,
+                bank_fee_percentage,
+            )
+            if fallback is None:
+                raise
+            return fallback
+
+        logging.debug(result)
+
+        if shared:
+            return shared_settle(result, transaction_amount, bank_fee_percentage)
+        return settlement(
+            result, exchange_rate_date, bank_fee_percentage, cache, transaction_amount
+        )
 
 
 def settle_latest(
-    transaction_amount, transaction_currency, card_currency, bank_fee_percentage=0
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    bank_fee_percentage=0,
+    cache=None,
+    refresh=False,
 ):
     return settle(
         transaction_amount,
         transaction_currency,
         card_currency,
-        "0000-00-00",
+        LATEST_DATE,
+        bank_fee_percentage,
+        cache=cache,
+        refresh=refresh,
+    )
+
+
+async def settle_async(
+    client,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+    cache=None,
+    refresh=False,
+):
+    """Like settle, but fetches rates through an AsyncMastercardClient."""
+    # Only requests for the latest rates may fall back to stale ones, so the
+    # requested date is kept for that once LATEST_DATE is resolved to a date
+    requested_date = exchange_rate_date
+    exchange_rate_date = resolve_date(exchange_rate_date, cache, refresh)
+
+    if cache is not None and not refresh:
+        cached = cached_settle(
+            cache,
+            transaction_amount,
+            transaction_currency,
+            card_currency,
+            exchange_rate_date,
+            bank_fee_percentage,
+        )
+        if cached is not None:
+            return cached
+
+    try:
+        result, shared = await rate_requests.do_async(
+            (exchange_rate_date, transaction_currency, card_currency),
+            client.settle,
+            bank_fee_percentage=bank_fee_percentage,
+            card_currency=card_currency,
+            exchange_rate_date=exchange_rate_date,
+            transaction_amount=transaction_amount,
+            transaction_currency=transaction_currency,
+        )
+    except CircuitOpenError:
+        fallback = stale_settle(
+            cache,
+            transaction_amount,
+            transaction_currency,
+            card_currency,
+            requested_date,
+            bank_fee_percentage,
+        )
+        if fallback is None:
+            raise
+        return fallback
+
+    logging.debug(result)
+
+    if shared:
+        return shared_settle(result, transaction_amount, bank_fee_percentage)
+    return settlement(
+        result, exchange_rate_date, bank_fee_percentage, cache, transaction_amount
+    )
+
+
+async def settle_latest_async(
+    client,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    bank_fee_percentage=0,
+    cache=None,
+    refresh=False,
+):
+    return await settle_async(
+        client,
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        LATEST_DATE,
+        bank_fee_percentage,
+        cache=cache,
+        refresh=refresh,
+    )
+
+
+def resolve_date(exchange_rate_date, cache, refresh=False):
+    """Swap LATEST_DATE for the memoized date of the latest rates, if still valid.
+
+    Conversions at the latest rates then use the same concrete-date cache entries
+    as conversions at that date.
+    """
+    if exchange_rate_date != LATEST_DATE or cache is None or refresh:
+        return exchange_rate_date
+    return cache.latest_date() or LATEST_DATE
+
+
+def latest_date(cache, max_days=7, refresh=False):
+    """Find the date of the latest published rates by probing rates_available.
+
+    The date is memoized in the cache until the next publication is due, unless
+    refreshing.
+    """
+    memoized = None if refresh else cache.latest_date()
+    if memoized is not None:
+        return memoized
+
+    for days_ago in range(max_days):
+        day = date.date_n_days_ago(days_ago)
+        if date.is_weekend(day) or not mastercard.rates_available(day):
+            continue
+        cache.put_latest_date(day, date.latest_rates_expiry(day, time.time()))
+        return day
+
+    raise LookupError(f"No rates published in the last {max_days} days")
+
+
+def cached_settle(
+    cache,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+):
+    # Published rates never change, so a cached rate can be applied to any amount locally
+    cached = cached_rate(cache, transaction_currency, card_currency, exchange_rate_date)
+    if cached is None:
+        return None
+
+    fx_date, conversion_rate = cached
+    return local_settle(
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        fx_date,
+        conversion_rate,
+        bank_fee_percentage,
+    )
+
+
+def cached_rate(cache, transaction_currency, card_currency, exchange_rate_date):
+    """Return (fx_date, conversion_rate) from the cache, or None, counting hits and misses."""
+    with instrumentation.span("cache.get"):
+        cached = cache.get(exchange_rate_date, transaction_currency, card_currency)
+    instrumentation.count("cache.misses" if cached is None else "cache.hits")
+    return cached
+
+
+def stale_settle(
+    cache,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+):
+    """Settle at the newest cached rate while Mastercard can't be reached.
+
+    Only conversions at the latest rates can fall back like this: rates for a
+    requested date must be the ones published for that date.
+    """
+    if cache is None or exchange_rate_date != LATEST_DATE:
+        return None
+
+    cached = cache.most_recent(transaction_currency, card_currency)
+    if cached is None:
+        return None
+
+    fx_date, conversion_rate = cached
+    logging.warning(
+        f"Mastercard is unavailable, using cached {transaction_currency}->{card_currency}"
+        f" rate from {fx_date}"
+    )
+    return local_settle(
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        fx_date,
+        conversion_rate,
+        bank_fee_percentage,
+    )
+
+
+def settlement(
+    result, exchange_rate_date, bank_fee_percentage, cache=None, transaction_amount=None
+):
+    """Map a Mastercard settlement onto our result, caching its rate if possible.
+
+    If the transaction amount was a Decimal, so are the amounts in the result.
+    """
+    if cache is not None:
+        cache.put(
+            result["fxDate"],
+            result["transCurr"],
+            result["crdhldBillCurr"],
+            result["conversionRate"],
+        )
+        if exchange_rate_date == LATEST_DATE:
+            cache.put_latest_date(
+                result["fxDate"],
+                date.latest_rates_expiry(result["fxDate"], time.time()),
+            )
+
+    with instrumentation.span("transaction.map"):
+        card_amount = amount.to_decimal(result["crdhldBillAmt"])
+        if not isinstance(transaction_amount, Decimal):
+            # Amounts given as numbers other than Decimals are answered in floats
+            card_amount = float(card_amount)
+            transaction_amount = result["transAmt"]
+            if isinstance(transaction_amount, Decimal):
+                transaction_amount = float(transaction_amount)
+
+        return {
+            "bank_fee_percentage": bank_fee_percentage,
+            "card_amount": card_amount,
+            "card_currency": result["crdhldBillCurr"],
+            "conversion_rate": result["conversionRate"],
+            "conversion_rate_date": result["fxDate"],
+            "transaction_amount": transaction_amount,
+            "transaction_currency": result["transCurr"],
+        }
+
+
+def shared_settle(result, transaction_amount, bank_fee_percentage=0):
+    """Settle locally at the rate of a Mastercard settlement made for another amount."""
+    return local_settle(
+        transaction_amount,
+        result["transCurr"],
+        result["crdhldBillCurr"],
+        result["fxDate"],
+        result["conversionRate"],
         bank_fee_percentage,
     )
+
+
+def local_settle(
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    conversion_rate_date,
+    conversion_rate,
+    bank_fee_percentage=0,
+):
+    with instrumentation.span("transaction.map"):
+        return {
+            "bank_fee_percentage": bank_fee_percentage,
+            "card_amount": card_amount(
+                transaction_amount, conversion_rate, bank_fee_percentage
+            ),
+            "card_currency": card_currency,
+            "conversion_rate": conversion_rate,
+            "conversion_rate_date": conversion_rate_date,
+            "transaction_amount": transaction_amount,
+            "transaction_currency": transaction_currency,
+        }
+
+
+def settle_amounts(
+    transaction_amounts,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+    cache=None,
+    refresh=False,
+):
+    """Settle many amounts in one currency pair, fetching the rate only once.
+
+    transaction_amounts can be any iterable of numbers, including buffers such as
+    array("d"). The card amounts are returned as an array("d") in the same order.
+    """
+    conversion_rate_date, conversion_rate = rate(
+        transaction_currency,
+        card_currency,
+        exchange_rate_date,
+        cache=cache,
+        refresh=refresh,
+    )
+
+    return {
+        "bank_fee_percentage": bank_fee_percentage,
+        "card_amounts": card_amounts(
+            transaction_amounts, conversion_rate, bank_fee_percentage
+        ),
+        "card_currency": card_currency,
+        "conversion_rate": conversion_rate,
+        "conversion_rate_date": conversion_rate_date,
+        "transaction_currency": transaction_currency,
+    }
+
+
+def rate(
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    cache=None,
+    refresh=False,
+    client=None,
+):
+    """Return (conversion_rate_date, conversion_rate) for a currency pair."""
+    result = settle(
+        transaction_amount=1,
+        transaction_currency=transaction_currency,
+        card_currency=card_currency,
+        exchange_rate_date=exchange_rate_date,
+        cache=cache,
+        refresh=refresh,
+        client=client,
+    )
+    return result["conversion_rate_date"], result["conversion_rate"]
+
+
+def card_amount(transaction_amount, conversion_rate, bank_fee_percentage=0):
+    if isinstance(transaction_amount, Decimal):
+        return exact_card_amounts(
+            [transaction_amount], conversion_rate, bank_fee_percentage
+        )[0]
+    # Mastercard applies the bank fee on top of the converted amount
+    return round(
+        transaction_amount * conversion_rate * bank_fee_multiplier(bank_fee_percentage),
+        CARD_AMOUNT_PLACES,
+    )
+
+
+def card_amounts(transaction_amounts, conversion_rate, bank_fee_percentage=0):
+    """card_amount for every amount in one pass, evaluated exactly as card_amount does."""
+    multiplier = bank_fee_multiplier(bank_fee_percentage)
+    return array(
+        "d",
+        [
+            round(amount * conversion_rate * multiplier, CARD_AMOUNT_PLACES)
+            for amount in transaction_amounts
+        ],
+    )
+
+
+def exact_card_amounts(transaction_amounts, conversion_rate, bank_fee_percentage=0):
+    """card_amount of Decimal amounts, computed exactly and returned as Decimals.
+
+    The products are exact, so the only rounding is Mastercard's, to
+    CARD_AMOUNT_PLACES.
+    """
+    multiplier = amount.card_multiplier(conversion_rate, bank_fee_percentage)
+    return [
+        amount.round_places(
+            amount.EXACT.multiply(transaction_amount, multiplier), CARD_AMOUNT_PLACES
+        )
+        for transaction_amount in transaction_amounts
+    ]
+
+
+def card_units(transaction_units, places, conversion_rate, bank_fee_percentage=0):
+    """card_amount in fixed point, for many amounts given as integer minor units.
+
+    transaction_units are amounts times 10**places, e.g. cents with places 2. The
+    card amounts are returned as a list of integers of 10**-CARD_AMOUNT_PLACES, rounded
+    as Mastercard rounds them. Being integer arithmetic throughout, this is the
+    fastest exact way to convert many amounts.
+    """
+    factor, factor_places = amount.fixed(
+        amount.card_multiplier(conversion_rate, bank_fee_percentage)
+    )
+    shift = places + factor_places - CARD_AMOUNT_PLACES
+    if shift <= 0:
+        factor *= 10**-shift
+        return [units * factor for units in transaction_units]
+
+    divisor = 10**shift
+    half = divisor // 2
+    # Halves are rounded away from zero
+    return [
+        (units * factor + half) // divisor
+        if units >= 0
+        else -((half - units * factor) // divisor)
+        for units in transaction_units
+    ]
+
+
+def bank_fee_multiplier(bank_fee_percentage):
+    return 1 + bank_fee_percentage / 100
@@ -0,0 +1,99 @@
+import threading
+import time
+
+# Hooks are called as hook(kind, name, value, attributes) for every measurement:
+# kind is "span" with value the duration in seconds, or "count" with value the amount
+# to add to the counter. With no hooks added, measuring costs a single function call.
+_hooks = []
+
+
+class Span:
+    __slots__ = ("attributes", "name", "started")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        emit("span", self.name, time.perf_counter() - self.started, self.attributes)
+
+
+class NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def enabled():
+    return bool(_hooks)
+
+
+def span(name, **attributes):
+    """Time a block of code: `with span("name"): ...`"""
+    if not _hooks:
+        return NO_SPAN
+    return Span(name, attributes)
+
+
+def count(name, value=1, **attributes):
+    if _hooks:
+        emit("count", name, value, attributes)
+
+
+def emit(kind, name, value, attributes):
+    for hook in tuple(_hooks):
+        hook(kind, name, value, attributes)
+
+
+class Stats:
+    """Hook that totals up spans and counters, for a summary at the end of a run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        # name -> [calls, total seconds, max seconds]
+        self.spans = {}
+
+    def __call__(self, kind, name, value, attributes):
+        with self.lock:
+            if kind == "span":
+                totals = self.spans.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += value
+                totals[2] = max(totals[2], value)
+            else:
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self):
+        with self.lock:
+            lines = [
+                f"{'span':<28}{'calls':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}"
+            ]
+            for name, (calls, total, longest) in sorted(self.spans.items()):
+                lines.append(
+                    f"{name:<28}{calls:>8}{total * 1000:>12.3f}"
+                    f"{total / calls * 1000:>10.3f}{longest * 1000:>10.3f}"
+                )
+            lines.append(f"{'counter':<28}{'value':>8}")
+            for name, value in sorted(self.counts.items()):
+                lines.append(f"{name:<28}{value:>8}")
+        return "\n".join(lines)
@@ -0,0 +1,99 @@
+import csv
+import io
+
+from mc.domain import amount
+
+FORMATS = ("csv", "tsv", "json", "jsonl")
+FIELDS = (
+    "transaction_amount",
+    "transaction_currency",
+    "card_amount",
+    "card_currency",
+    "conversion_rate",
+    "conversion_rate_date",
+    "bank_fee_percentage",
+)
+# Records are gathered up and written out in blocks of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+
+class RecordWriter:
+    """Writes conversion results to a text stream as csv, tsv, json or jsonl.
+
+    json is a single array of records, written as the records arrive; the other
+    formats have a record per line. Output is buffered and written in large blocks,
+    unless line_buffered, when the stream is flushed after every record so that a
+    program reading it sees each record straight away. Decimal amounts are written
+    as numbers, in JSON with exactly their own digits.
+
+    Leaving a with block by an exception discards any output not yet written and
+    leaves a json array unterminated, so that failed output isn't taken as complete.
+    """
+
+    def __init__(self, stream, output_format, header=True, line_buffered=False):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format {output_format}")
+        self.stream = stream
+        self.output_format = output_format
+        self.line_buffered = line_buffered
+        self.buffer = io.StringIO(newline="")
+        self.records = 0
+
+        if output_format in ("csv", "tsv"):
+            self.csv_writer = csv.DictWriter(
+                self.buffer,
+                FIELDS,
+                extrasaction="ignore",
+                delimiter="\t" if output_format == "tsv" else ",",
+            )
+            if header:
+                self.csv_writer.writeheader()
+        elif output_format == "json":
+            self.buffer.write("[")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write(self, record):
+        if self.output_format in ("csv", "tsv"):
+            self.csv_writer.writerow(record)
+        else:
+            text = amount.to_json(
+                {field: record[field] for field in FIELDS if field in record}
+            )
+            if self.output_format == "jsonl":
+                self.buffer.write(text + "\n")
+            else:
+                self.buffer.write(("," if self.records else "") + "\n" + text)
+        self.records += 1
+        self._written()
+
+    def write_formatted(self, text):
+        """Write records already formatted, such as by a RecordWriter without a header."""
+        self.buffer.write(text)
+        self._written()
+
+    def _written(self):
+        if self.line_buffered:
+            self.flush()
+        elif self.buffer.tell() >= BUFFER_SIZE:
+            self.drain()
+
+    def drain(self):
+        """Hand the buffered output to the stream, without flushing the stream."""
+        self.stream.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def flush(self):
+        self.drain()
+        self.stream.flush()
+
+    def close(self):
+        if self.output_format == "json":
+            self.buffer.write("\n]\n" if self.records else "]\n")
+        self.flush()
@@ -0,0 +1,298 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR_NAME = "mastercardconvert"
+CACHE_FILE_NAME = "rates.sqlite3"
+LATEST_DATE = "0000-00-00"
+DEFAULT_LRU_CAPACITY = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    fx_date TEXT NOT NULL,
+    transaction_currency TEXT NOT NULL,
+    card_currency TEXT NOT NULL,
+    conversion_rate REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (fx_date, transaction_currency, card_currency)
+);
+CREATE TABLE IF NOT EXISTS latest_date (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    fx_date TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unpublished (
+    fx_date TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS currencies (
+    alpha_code TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS currencies_expiry (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, CACHE_DIR_NAME)
+
+
+def default_cache_path():
+    return os.path.join(default_cache_dir(), CACHE_FILE_NAME)
+
+
+class RateCache:
+    """Local store of published conversion rates.
+
+    Rates for a concrete date never change once published, so they are kept forever.
+    The date of the latest published rates is remembered until the expiry it was
+    stored with, and lookups of LATEST_DATE are answered using it.
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or default_cache_path()
+        self.clock = clock
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        # The connection is shared between threads, so serialise access to it
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, exchange_rate_date, transaction_currency, card_currency):
+        """Return (fx_date, conversion_rate) for the pair, or None if not cached."""
+        if exchange_rate_date == LATEST_DATE:
+            exchange_rate_date = self.latest_date()
+            if exchange_rate_date is None:
+                return None
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT conversion_rate FROM rates"
+                " WHERE fx_date = ? AND transaction_currency = ? AND card_currency = ?",
+                (exchange_rate_date, transaction_currency, card_currency),
+            ).fetchone()
+
+        logging.debug(
+            f"Rate cache {'hit' if row else 'miss'}: "
+            f"{exchange_rate_date} {transaction_currency}->{card_currency}"
+        )
+
+        if row is None:
+            return None
+        return exchange_rate_date, row[0]
+
+    def put(self, fx_date, transaction_currency, card_currency, conversion_rate):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)",
+                (
+                    fx_date,
+                    transaction_currency,
+                    card_currency,
+                    conversion_rate,
+                    self.clock(),
+                ),
+            )
+
+    def latest_date(self):
+        """Return the date of the latest published rates, or None if it may be stale."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fx_date, expires_at FROM latest_date"
+            ).fetchone()
+
+        if row is None or self.clock() >= row[1]:
+            return None
+        return row[0]
+
+    def put_latest_date(self, fx_date, expires_at):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO latest_date VALUES (0, ?, ?)",
+                (fx_date, expires_at),
+            )
+
+    def series(self, transaction_currency, card_currency, start_date, end_date):
+        """Return [(fx_date, conversion_rate)] for the pair between two dates inclusive."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT fx_date, conversion_rate FROM rates"
+                " WHERE transaction_currency = ? AND card_currency = ?"
+                " AND fx_date BETWEEN ? AND ? ORDER BY fx_date",
+                (transaction_currency, card_currency, start_date, end_date),
+            ).fetchall()
+
+    def most_recent(self, transaction_currency, card_currency):
+        """Return (fx_date, conversion_rate) of the newest cached rate for the pair, or None."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT fx_date, conversion_rate FROM rates"
+                " WHERE transaction_currency = ? AND card_currency = ?"
+                " ORDER BY fx_date DESC LIMIT 1",
+                (transaction_currency, card_currency),
+            ).fetchone()
+
+    def rates_on(self, fx_date):
+        """Return [(transaction_currency, card_currency, conversion_rate)] cached for a date."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT transaction_currency, card_currency, conversion_rate FROM rates"
+                " WHERE fx_date = ?",
+                (fx_date,),
+            ).fetchall()
+
+    def mark_unpublished(self, fx_date):
+        """Remember a past date Mastercard never published rates for."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO unpublished VALUES (?)", (fx_date,)
+            )
+
+    def is_unpublished(self, fx_date):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM unpublished WHERE fx_date = ?", (fx_date,)
+            ).fetchone()
+        return row is not None
+
+    def currencies(self):
+        """Return the currency catalogue as {alpha_code: name}, or None if it may be stale."""
+        with self.lock:
+            expiry = self.connection.execute(
+                "SELECT expires_at FROM currencies_expiry"
+            ).fetchone()
+            if expiry is None or self.clock() >= expiry[0]:
+                return None
+            return dict(
+                self.connection.execute("SELECT alpha_code, name FROM currencies")
+            )
+
+    def put_currencies(self, currencies, expires_at):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM currencies")
+            self.connection.executemany(
+                "INSERT INTO currencies VALUES (?, ?)", currencies.items()
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO currencies_expiry VALUES (0, ?)", (expires_at,)
+            )
+
+
+class LruRateCache:
+    """In-memory rate cache holding the most recently used rates.
+
+    Follows the same rules as RateCache, and can sit in front of one: misses are
+    looked up in the backing cache, and puts are written through to it.
+    """
+
+    def __init__(self, capacity=DEFAULT_LRU_CAPACITY, backing=None, clock=time.time):
+        self.capacity = capacity
+        self.backing = backing
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.rates = OrderedDict()
+        self.latest = None
+        self.catalogue = None
+
+    def close(self):
+        if self.backing is not None:
+            self.backing.close()
+
+    def get(self, exchange_rate_date, transaction_currency, card_currency):
+        if exchange_rate_date == LATEST_DATE:
+            exchange_rate_date = self.latest_date()
+            if exchange_rate_date is None:
+                return None
+
+        key = (exchange_rate_date, transaction_currency, card_currency)
+        with self.lock:
+            conversion_rate = self.rates.get(key)
+            if conversion_rate is not None:
+                self.rates.move_to_end(key)
+                return exchange_rate_date, conversion_rate
+
+        if self.backing is None:
+            return None
+
+        cached = self.backing.get(
+            exchange_rate_date, transaction_currency, card_currency
+        )
+        if cached is not None:
+            self._remember(key, cached[1])
+        return cached
+
+    def put(self, fx_date, transaction_currency, card_currency, conversion_rate):
+        self._remember((fx_date, transaction_currency, card_currency), conversion_rate)
+        if self.backing is not None:
+            self.backing.put(
+                fx_date, transaction_currency, card_currency, conversion_rate
+            )
+
+    def latest_date(self):
+        with self.lock:
+            latest = self.latest
+        if latest is not None and self.clock() < latest[1]:
+            return latest[0]
+
+        if self.backing is None:
+            return None
+        return self.backing.latest_date()
+
+    def put_latest_date(self, fx_date, expires_at):
+        with self.lock:
+            self.latest = (fx_date, expires_at)
+        if self.backing is not None:
+            self.backing.put_latest_date(fx_date, expires_at)
+
+    def most_recent(self, transaction_currency, card_currency):
+        if self.backing is not None:
+            return self.backing.most_recent(transaction_currency, card_currency)
+
+        with self.lock:
+            cached = [
+                (fx_date, conversion_rate)
+                for (
+                    fx_date,
+                    cached_from,
+                    cached_to,
+                ), conversion_rate in self.rates.items()
+                if (cached_from, cached_to) == (transaction_currency, card_currency)
+            ]
+        return max(cached, default=None)
+
+    def currencies(self):
+        with self.lock:
+            catalogue = self.catalogue
+        if catalogue is not None and self.clock() < catalogue[1]:
+            return catalogue[0]
+
+        if self.backing is None:
+            return None
+        return self.backing.currencies()
+
+    def put_currencies(self, currencies, expires_at):
+        with self.lock:
+            self.catalogue = (dict(currencies), expires_at)
+        if self.backing is not None:
+            self.backing.put_currencies(currencies, expires_at)
+
+    def _remember(self, key, conversion_rate):
+        with self.lock:
+            self.rates[key] = conversion_rate
+            self.rates.move_to_end(key)
+            if len(self.rates) > self.capacity:
+                self.rates.popitem(last=False)
@@ -0,0 +1,272 @@
+import argparse
+import datetime
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mc.domain import amount
+
+BASE_PATH = "/settlement/currencyrate"
+
+# Value of one unit of each currency in US dollars
+USD_VALUES = {
+    "AUD": 0.66,
+    "CAD": 0.73,
+    "CHF": 1.12,
+    "CNY": 0.14,
+    "EUR": 1.08,
+    "GBP": 1.27,
+    "HKD": 0.128,
+    "INR": 0.012,
+    "JPY": 0.0067,
+    "NZD": 0.61,
+    "SEK": 0.095,
+    "SGD": 0.74,
+    "USD": 1.0,
+}
+CURRENCY_NAMES = {
+    "AUD": "AUSTRALIAN DOLLAR",
+    "CAD": "CANADIAN DOLLAR",
+    "CHF": "SWISS FRANC         ",
+    "CNY": "CHINA YUAN RENMINBI ",
+    "EUR": "EURO",
+    "GBP": "GREAT BRITISH POUND",
+    "HKD": "HONG KONG DOLLAR",
+    "INR": "INDIAN RUPEE",
+    "JPY": "JAPANESE YEN",
+    "NZD": "NEW ZEALAND DOLLAR",
+    "SEK": "SWEDISH KRONA",
+    "SGD": "SINGAPORE DOLLAR",
+    "USD": "UNITED STATES DOLLAR",
+}
+
+
+class FakeMastercardServer:
+    """Local stand-in for the Mastercard settlement currency rate API.
+
+    Serves the conversion-rate, conversion-rate-issued and settlement-currencies
+    endpoints with made-up but self-consistent rates, so that mc can be run, tested
+    and benchmarked without Mastercard. Each response can be delayed by `latency`
+    seconds, and a fraction `error_rate` of requests fail with `error_status`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0,
+        error_rate=0,
+        error_status=503,
+        retry_after=None,
+        seed=None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), FakeMastercardRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{BASE_PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def should_fail(self):
+        with self.lock:
+            self.request_count += 1
+            return self.random.random() < self.error_rate
+
+
+class FakeMastercardRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would delay
+    # on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urllib.parse.urlsplit(self.path)
+        query = {
+            key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()
+        }
+
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        if fake.should_fail():
+            headers = {}
+            if fake.retry_after is not None:
+                headers["Retry-After"] = str(fake.retry_after)
+            return self.send_json(
+                fake.error_status, {"error": "Injected error"}, headers
+            )
+
+        endpoint = url.path.removeprefix(BASE_PATH)
+        try:
+            if endpoint == "/conversion-rate":
+                body = conversion_rate(query)
+            elif endpoint == "/conversion-rate-issued":
+                body = conversion_rate_issued(query)
+            elif endpoint == "/settlement-currencies":
+                body = settlement_currencies()
+            else:
+                return self.send_json(404, {"error": f"Unknown path {url.path}"})
+        except (KeyError, ValueError) as e:
+            return self.send_json(400, {"error": f"Bad request: {e}"})
+
+        self.send_json(200, body)
+
+    def send_json(self, status, body, headers=None):
+        content = amount.to_json(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def conversion_rate(query):
+    fx_date = query["fxDate"]
+    if fx_date == "0000-00-00":
+        fx_date = latest_weekday()
+
+    transaction_currency = query["transCurr"]
+    card_currency = query["crdhldBillCurr"]
+    transaction_amount = amount.parse(query["transAmt"])
+    bank_fee = amount.parse(query.get("bankFee", "0"))
+
+    rate = round(USD_VALUES[transaction_currency] / USD_VALUES[card_currency], 6)
+    return response(
+        "settlement-conversion-rate",
+        "Settlement conversion rate and billing amount",
+        {
+            "conversionRate": rate,
+            # Calculated exactly, as Mastercard send every digit
+            "crdhldBillAmt": amount.card_amount(transaction_amount, rate, bank_fee),
+            "fxDate": fx_date,
+            "transCurr": transaction_currency,
+            "crdhldBillCurr": card_currency,
+            "transAmt": transaction_amount,
+            "bankFee": bank_fee,
+        },
+    )
+
+
+def conversion_rate_issued(query):
+    issued = datetime.date.fromisoformat(query["date"]).weekday() < 5
+    return response(
+        "settlement-conversion-rate-issued",
+        "Is settlement conversion rate issued",
+        {"rateIssued": "YES" if issued else "NO"},
+    )
+
+
+def settlement_currencies():
+    return response(
+        "settlement-currency",
+        "A list of settlement active currencies",
+        {
+            "currencies": [
+                {"alphaCd": code, "currNam": name}
+                for code, name in CURRENCY_NAMES.items()
+            ]
+        },
+    )
+
+
+def response(name, description, data):
+    return {
+        "name": name,
+        "description": description,
+        "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "data": data,
+    }
+
+
+def latest_weekday():
+    day = datetime.date.today()
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a local stand-in for the Mastercard currency rate API",
+        epilog="Point mc at it with --base-url, as printed on startup.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds to delay each response"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests to fail, between 0 and 1",
+    )
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=503,
+        help="HTTP status of failed requests (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        help="Retry-After seconds to send with failed requests",
+    )
+    parser.add_argument("--seed", type=int, help="Seed for error injection")
+    args = parser.parse_args()
+
+    fake = FakeMastercardServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"Serving fake Mastercard API, use: --base-url {fake.base_url}")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
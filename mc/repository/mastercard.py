@@ -1,25 +1,167 @@
 import logging
 import string
+from decimal import Decimal
+from urllib.parse import quote, urlsplit
 
-import requests
+from mc import instrumentation
+from mc.repository.transport import default_transport
 
-from latest_user_agents import get_random_user_agent
-
-CURRENCY_URL = (
-    "https://www.mastercard.com/settlement/currencyrate/settlement-currencies"
-)
-RATE_URL = string.Template(
-    "https://www.mastercard.com/settlement/currencyrate/conversion-rate?fxDate=$exchange_rate_date&transCurr=$transaction_currency&crdhldBillCurr=$card_currency&bankFee=$bank_fee_percentage&transAmt=$transaction_amount"
-)
-RATE_ISSUED_URL = string.Template(
-    "https://www.mastercard.com/settlement/currencyrate/conversion-rate-issued?date=$exchange_rate_date"
+BASE_URL = "https://www.mastercard.com/settlement/currencyrate"
+CURRENCY_PATH = "/settlement-currencies"
+RATE_PATH = string.Template(
+    "/conversion-rate?fxDate=$exchange_rate_date&transCurr=$transaction_currency&crdhldBillCurr=$card_currency&bankFee=$bank_fee_percentage&transAmt=$transaction_amount"
 )
+RATE_ISSUED_PATH = string.Template("/conversion-rate-issued?date=$exchange_rate_date")
+CURRENCY_URL = BASE_URL + CURRENCY_PATH
+RATE_URL = string.Template(BASE_URL + RATE_PATH.template)
+RATE_ISSUED_URL = string.Template(BASE_URL + RATE_ISSUED_PATH.template)
 REFERRER_URL = (
     "https://www.mastercard.com/global/en/personal/get-support/convert-currency.html"
 )
 HOST = "www.mastercard.com"
 
 
+class MastercardClient:
+    """Client for the Mastercard API.
+
+    Requests are carried by a transport (see mc.repository.transport), by default an
+    HttpTransport that reuses connections, behind a ThrottledTransport that paces
+    requests and retries throttled or failed ones; any other keyword arguments are
+    passed on to default_transport. base_url allows pointing the client at a
+    stand-in for Mastercard, such as mc.repository.fake_mastercard.
+    Unless a user_agent is given, each request uses a random browser user agent.
+    """
+
+    def __init__(
+        self, transport=None, base_url=BASE_URL, user_agent=None, **http_settings
+    ):
+        self.transport = transport or default_transport(**http_settings)
+        self.base_url = base_url
+        self.host = urlsplit(base_url).netloc
+        self.user_agent = user_agent
+
+    def close(self):
+        self.transport.close()
+
+    def settle(
+        self,
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        exchange_rate_date,
+        bank_fee_percentage,
+    ):
+        # Values are quoted so that none can add parameters of their own
+        url = self.base_url + RATE_PATH.substitute(
+            bank_fee_percentage=quote(str(bank_fee_percentage), safe=""),
+            card_currency=quote(card_currency, safe=""),
+            exchange_rate_date=quote(exchange_rate_date, safe=""),
+            transaction_amount=quote(format_amount(transaction_amount), safe=""),
+            transaction_currency=quote(transaction_currency, safe=""),
+        )
+
+        with instrumentation.span("mastercard.settle"):
+            response = self.request(url)
+
+            # Throw exception if a bad response code was returned
+            response.raise_for_status()
+
+            # Return just the 'data' key, as it is the only part of the request that contains relevant information
+            # Amounts are decoded as Decimals to keep every digit. Rates are floats,
+            # as they are everywhere else
+            with instrumentation.span("mastercard.decode"):
+                json = response.json(parse_float=Decimal)
+                data = json["data"]
+                data["conversionRate"] = float(data["conversionRate"])
+        logging.debug(json)
+
+        return data
+
+    def currencies(self):
+        with instrumentation.span("mastercard.currencies"):
+            response = self.request(self.base_url + CURRENCY_PATH)
+
+            response.raise_for_status()
+
+            return response.json()["data"]["currencies"]
+
+    def rates_available(self, exchange_rate_date):
+        url = self.base_url + RATE_ISSUED_PATH.substitute(
+            exchange_rate_date=quote(exchange_rate_date, safe="")
+        )
+
+        with instrumentation.span("mastercard.rates_available"):
+            response = self.request(url)
+
+            response.raise_for_status()
+
+            return response.json()["data"]["rateIssued"] == "YES"
+
+    def request(self, url):
+        with instrumentation.span("mastercard.request"):
+            return self.transport.get(url, self.headers)
+
+    def headers(self):
+        return {
+            "Accept": "application/json, text/plain, */*",
+            "Accept-Encoding": "gzip, deflate, br, zstd",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Connection": "keep-alive",
+            "DNT": "1",
+            "Host": self.host,
+            "Priority": "u=0",
+            "Referer": REFERRER_URL,
+            "Sec-Fetch-Dest": "empty",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Site": "same-origin",
+            "Sec-GPC": "1",
+            "User-Agent": self.user_agent or get_random_user_agent(),
+        }
+
+
+def format_amount(transaction_amount):
+    """Show an amount in full, e.g. 1234567.89 rather than :g's 1.23457e+06."""
+    if isinstance(transaction_amount, float):
+        # repr is the shortest form that reads back as the same float
+        transaction_amount = repr(transaction_amount)
+    amount = Decimal(transaction_amount)
+    # Without trailing zeros, as :g gave them, so that recorded fixtures still match
+    if amount == amount.to_integral_value():
+        return f"{amount.quantize(1):f}"
+    return f"{amount.normalize():f}"
+
+
+def get_random_user_agent():
+    # Imported here as latest_user_agents is slow to import
+    from latest_user_agents import get_random_user_agent
+
+    return get_random_user_agent()
+
+
+_default_client = None
+_default_client_settings = {}
+
+
+def default_client():
+    """Return the client shared by the module-level functions, creating it if needed."""
+    global _default_client
+    if _default_client is None:
+        _default_client = MastercardClient(**_default_client_settings)
+    return _default_client
+
+
+def configure(**settings):
+    """Set MastercardClient arguments for the default client, created when first used."""
+    global _default_client
+    _default_client_settings.update(settings)
+    _default_client = None
+
+
+def set_default_client(client):
+    global _default_client
+    _default_client = client
+
+
 def settle(
     transaction_amount,
     transaction_currency,
@@ -27,54 +169,22 @@ def settle(
     exchange_rate_date,
     bank_fee_percentage,
 ):
-    url = RATE_URL.substitute(
-        bank_fee_percentage=bank_fee_percentage,
+    return default_client().settle(
+        transaction_amount=transaction_amount,
+        transaction_currency=transaction_currency,
         card_currency=card_currency,
         exchange_rate_date=exchange_rate_date,
-        transaction_amount=f"{transaction_amount:g}",
-        transaction_currency=transaction_currency,
+        bank_fee_percentage=bank_fee_percentage,
     )
 
-    response = make_mastercard_request(url)
-
-    # Throw exception if a bad response code was returned
-    response.raise_for_status()
 
-    # Return just the 'data' key, as it is the only part of the request that contains relevant information
-    json = response.json()
-    logging.debug(json)
-
-    return json["data"]
+def currencies():
+    return default_client().currencies()
 
 
 def rates_available(exchange_rate_date):
-    url = RATE_ISSUED_URL.substitute(exchange_rate_date=exchange_rate_date)
-
-    response = make_mastercard_request(url)
-
-    response.raise_for_status()
-
-    return response.json()["data"]["rateIssued"] == "YES"
+    return default_client().rates_available(exchange_rate_date)
 
 
 def make_mastercard_request(url):
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive",
-        "DNT": "1",
-        "Host": HOST,
-        "Priority": "u=0",
-        "Referer": REFERRER_URL,
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin",
-        "Sec-GPC": "1",
-        "User-Agent": get_random_user_agent(),
-    }
-
-    logging.debug(f"Making request to Mastercard API: {url}")
-    logging.debug(f"Using headers: {headers}")
-
-    return requests.get(url, headers=headers)
+    return default_client().request(url)
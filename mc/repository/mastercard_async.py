@@ -0,0 +1,96 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from mc.repository import mastercard
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_REQUESTS_PER_SECOND = 50
+
+
+class HostRateLimiter:
+    """Spaces out the start of requests to each host so no host sees more than
+    requests_per_second of them. A rate of None disables limiting."""
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {}
+
+    async def acquire(self, host):
+        if not self.interval:
+            return
+
+        # Reserve the next free slot before sleeping, so waiters queue up in order
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncMastercardClient:
+    """Asyncio counterpart to MastercardClient.
+
+    Requests run on a thread pool over the pooled MastercardClient session, so
+    many can be in flight at once. At most `concurrency` requests run at a time
+    and requests to each host are rate limited.
+
+    The client's transport keeps its own limit too: the default transport's token
+    bucket allows throttle.DEFAULT_REQUESTS_PER_SECOND (10 per second, bursts of 5),
+    which caps requests_per_second. Give a client with a faster transport to go
+    beyond it.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        concurrency=DEFAULT_CONCURRENCY,
+        requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+    ):
+        # Only close the synchronous client if it was created here
+        self.owns_client = client is None
+        self.client = client or mastercard.MastercardClient(pool_size=concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.owns_client:
+            self.client.close()
+
+    async def settle(
+        self,
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        exchange_rate_date,
+        bank_fee_percentage,
+    ):
+        return await self._run(
+            self.client.settle,
+            transaction_amount=transaction_amount,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=exchange_rate_date,
+            bank_fee_percentage=bank_fee_percentage,
+        )
+
+    async def rates_available(self, exchange_rate_date):
+        return await self._run(self.client.rates_available, exchange_rate_date)
+
+    async def currencies(self):
+        return await self._run(self.client.currencies)
+
+    async def _run(self, function, *args, **kwargs):
+        async with self.semaphore:
+            # Clients pointed elsewhere, e.g. at a fake Mastercard, are limited apart
+            await self.rate_limiter.acquire(
+                getattr(self.client, "host", mastercard.HOST)
+            )
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, partial(function, *args, **kwargs)
+            )
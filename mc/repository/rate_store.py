@@ -0,0 +1,289 @@
+import csv
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import ExitStack
+
+from mc.repository.cache import default_cache_dir
+
+STORE_FILE_NAME = "rates.mcrates"
+MAGIC = b"MCRATES\0"
+VERSION = 1
+DEFAULT_PIVOT = "USD"
+# Room for every currency Mastercard settles in, several times over
+DEFAULT_CAPACITY = 512
+CODE_SIZE = 4
+# magic, version, capacity, currency count, record count, pivot
+HEADER = struct.Struct("<8sIIII4s")
+CSV_FIELDS = ("fx_date", "transaction_currency", "card_currency", "conversion_rate")
+
+
+def default_store_path():
+    return os.path.join(default_cache_dir(), STORE_FILE_NAME)
+
+
+class RateStore:
+    """Compact history of rates against a pivot currency, read through mmap.
+
+    The file starts with a header and a table of currency codes, each currency
+    having a fixed slot. After that come fixed-size records of float64s, one per
+    date: the date as YYYYMMDD, then every currency's rate to the pivot, then the
+    pivot's rate to every currency, NaN where unknown. Reads go straight to the
+    mapped file without copying, so scanning years of history takes little memory.
+
+    Only rates to or from the pivot are kept. Other pairs are derived through the
+    pivot, as RateMatrix does.
+    """
+
+    def __init__(self, path=None, pivot=DEFAULT_PIVOT, capacity=DEFAULT_CAPACITY):
+        self.path = path or default_store_path()
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "wb") as store_file:
+                store_file.write(header_bytes(pivot, capacity, [], 0))
+
+        # The file stays open until close, unless it can't be mapped
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(self.path, "r+b"))
+            self._map()
+            stack.pop_all()
+
+    def close(self):
+        with self.lock:
+            self._unmap()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self):
+        self.mmap = mmap.mmap(self.file.fileno(), 0)
+        magic, version, capacity, count, records, pivot = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != VERSION:
+            self.mmap.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} rate store")
+
+        self.pivot = pivot.rstrip(b"\0").decode("ascii")
+        self.capacity = capacity
+        self.record_count = records
+        self.currencies = [
+            self.mmap[offset : offset + CODE_SIZE].rstrip(b"\0").decode("ascii")
+            for offset in range(HEADER.size, HEADER.size + count * CODE_SIZE, CODE_SIZE)
+        ]
+        self.index = {code: slot for slot, code in enumerate(self.currencies)}
+
+        self.data_offset = data_offset(capacity)
+        self.stride = 1 + 2 * capacity
+        self.values = memoryview(self.mmap)[self.data_offset :].cast("d")
+        self.dates = {
+            int(self.values[record * self.stride]): record
+            for record in range(self.record_count)
+        }
+
+    def _unmap(self):
+        self.values.release()
+        self.mmap.close()
+
+    def put(self, fx_date, transaction_currency, card_currency, conversion_rate):
+        """Store a rate, returning False if it's not to or from the pivot."""
+        if card_currency == self.pivot and transaction_currency != self.pivot:
+            currency, column = transaction_currency, 1
+        elif transaction_currency == self.pivot and card_currency != self.pivot:
+            currency, column = card_currency, 1 + self.capacity
+        else:
+            return False
+
+        with self.lock:
+            slot = self._slot(currency)
+            record = self._record(fx_date)
+            self.values[record * self.stride + column + slot] = conversion_rate
+        return True
+
+    def get(self, fx_date, transaction_currency, card_currency):
+        """Return the rate between two currencies on a date, or None if not known."""
+        with self.lock:
+            return self._get(date_key(fx_date), transaction_currency, card_currency)
+
+    def _get(self, key, transaction_currency, card_currency):
+        record = self.dates.get(key)
+        if record is None:
+            return None
+
+        base = record * self.stride
+        to_pivot = self._leg(base, transaction_currency, self.pivot)
+        from_pivot = self._leg(base, self.pivot, card_currency)
+        if to_pivot is None or from_pivot is None:
+            return None
+        if transaction_currency == self.pivot or card_currency == self.pivot:
+            # Don't lose the exact stored rate to floating point multiplication
+            return to_pivot if card_currency == self.pivot else from_pivot
+        return to_pivot * from_pivot
+
+    def _leg(self, base, transaction_currency, card_currency):
+        """The rate of a pair including the pivot, directly or from its inverse."""
+        if transaction_currency == card_currency:
+            return 1.0
+        if card_currency == self.pivot:
+            currency, column, inverse_column = (
+                transaction_currency,
+                1,
+                1 + self.capacity,
+            )
+        else:
+            currency, column, inverse_column = card_currency, 1 + self.capacity, 1
+
+        slot = self.index.get(currency)
+        if slot is None:
+            return None
+        rate = self.values[base + column + slot]
+        if not math.isnan(rate):
+            return rate
+        inverse = self.values[base + inverse_column + slot]
+        if not math.isnan(inverse) and inverse:
+            return 1 / inverse
+        return None
+
+    def series(self, transaction_currency, card_currency, start_date, end_date):
+        """Return [(fx_date, conversion_rate)] known for the pair between two dates inclusive."""
+        start, end = date_key(start_date), date_key(end_date)
+        rates = []
+        with self.lock:
+            for key in sorted(self.dates):
+                if start <= key <= end:
+                    rate = self._get(key, transaction_currency, card_currency)
+                    if rate is not None:
+                        rates.append((date_string(key), rate))
+        return rates
+
+    def rates_on(self, fx_date):
+        """Return [(transaction_currency, card_currency, conversion_rate)] stored for a date.
+
+        These are the rates to and from the pivot, as RateMatrix.load expects.
+        """
+        rates = []
+        with self.lock:
+            record = self.dates.get(date_key(fx_date))
+            if record is None:
+                return rates
+
+            base = record * self.stride
+            for currency, slot in self.index.items():
+                to_pivot = self.values[base + 1 + slot]
+                if not math.isnan(to_pivot):
+                    rates.append((currency, self.pivot, to_pivot))
+                from_pivot = self.values[base + 1 + self.capacity + slot]
+                if not math.isnan(from_pivot):
+                    rates.append((self.pivot, currency, from_pivot))
+        return rates
+
+    def fx_dates(self):
+        with self.lock:
+            return [date_string(key) for key in sorted(self.dates)]
+
+    def export_csv(self, output):
+        writer = csv.writer(output)
+        writer.writerow(CSV_FIELDS)
+        for fx_date in self.fx_dates():
+            for transaction_currency, card_currency, rate in self.rates_on(fx_date):
+                writer.writerow((fx_date, transaction_currency, card_currency, rate))
+
+    def import_csv(self, lines):
+        """Store every rate in CSV lines as written by export_csv, returning how many were kept."""
+        stored = 0
+        for row in csv.DictReader(lines):
+            stored += self.put(
+                row["fx_date"],
+                row["transaction_currency"].upper(),
+                row["card_currency"].upper(),
+                float(row["conversion_rate"]),
+            )
+        return stored
+
+    def _slot(self, currency):
+        slot = self.index.get(currency)
+        if slot is not None:
+            return slot
+
+        slot = len(self.currencies)
+        if slot >= self.capacity:
+            raise ValueError(f"Rate store {self.path} has no room for {currency}")
+        offset = HEADER.size + slot * CODE_SIZE
+        self.mmap[offset : offset + CODE_SIZE] = currency.encode("ascii").ljust(
+            CODE_SIZE, b"\0"
+        )
+        self.currencies.append(currency)
+        self.index[currency] = slot
+        self._write_counts()
+        return slot
+
+    def _record(self, fx_date):
+        key = date_key(fx_date)
+        record = self.dates.get(key)
+        if record is not None:
+            return record
+
+        # Grow the file by one record of NaNs and map it again
+        record = self.record_count
+        self._unmap()
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(
+            struct.pack(f"<{self.stride}d", key, *[math.nan] * (self.stride - 1))
+        )
+        self.file.flush()
+        self.mmap = mmap.mmap(self.file.fileno(), 0)
+        self.values = memoryview(self.mmap)[self.data_offset :].cast("d")
+
+        self.record_count += 1
+        self.dates[key] = record
+        self._write_counts()
+        return record
+
+    def _write_counts(self):
+        HEADER.pack_into(
+            self.mmap,
+            0,
+            MAGIC,
+            VERSION,
+            self.capacity,
+            len(self.currencies),
+            self.record_count,
+            self.pivot.encode("ascii"),
+        )
+
+
+def header_bytes(pivot, capacity, currencies, record_count):
+    header = bytearray(data_offset(capacity))
+    HEADER.pack_into(
+        header,
+        0,
+        MAGIC,
+        VERSION,
+        capacity,
+        len(currencies),
+        record_count,
+        pivot.encode("ascii"),
+    )
+    return bytes(header)
+
+
+def data_offset(capacity):
+    # Records start on an 8-byte boundary so that they can be cast to doubles
+    size = HEADER.size + capacity * CODE_SIZE
+    return -(-size // 8) * 8
+
+
+def date_key(fx_date):
+    """YYYY-MM-DD as the number YYYYMMDD, which a float64 holds exactly."""
+    return int(fx_date.replace("-", ""))
+
+
+def date_string(key):
+    key = str(int(key))
+    return f"{key[:4]}-{key[4:6]}-{key[6:]}"
@@ -0,0 +1,164 @@
+import datetime
+import logging
+import random
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_SECOND = 10
+DEFAULT_BURST = 5
+# Never slow down below this, however often Mastercard asks
+MIN_REQUESTS_PER_SECOND = 0.2
+# Requests per second regained after each request that isn't throttled
+RECOVERY_PER_REQUEST = 0.5
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+MAX_BACKOFF_SECONDS = 30
+
+
+class TokenBucket:
+    """Limits the rate of requests, adapting to throttling.
+
+    Requests take a token each, and tokens are added at requests_per_second up to
+    burst. When throttled, the rate is halved and requests pause for any Retry-After;
+    each request that isn't throttled then wins back a little of the rate, up to the
+    configured maximum.
+    """
+
+    def __init__(
+        self,
+        requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+        burst=DEFAULT_BURST,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = clock()
+        self.paused_until = 0
+
+    def acquire(self):
+        """Wait for a token, returning how many seconds were spent waiting."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Reserve a token now and wait for it afterwards, so that waiting callers
+            # queue up behind one another
+            self.tokens -= 1
+            wait = max(self.paused_until - now, -self.tokens / self.rate, 0)
+
+        if wait:
+            logging.debug(f"Waiting {wait:.3f}s before requesting from Mastercard")
+            self.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after=None):
+        with self.lock:
+            self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate / 2)
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, self.clock() + retry_after)
+        logging.info(
+            f"Throttled by Mastercard, slowing to {self.rate:.2f} requests per second"
+        )
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + RECOVERY_PER_REQUEST)
+
+
+class CircuitBreaker:
+    """Stops requests to Mastercard after repeated failures.
+
+    After failure_threshold failures in a row the circuit opens and requests fail
+    straight away. Once reset_timeout seconds have passed, a single trial request is
+    allowed through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout=DEFAULT_RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if (
+                self.trial_in_flight
+                or self.clock() < self.opened_at + self.reset_timeout
+            ):
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def succeeded(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("Mastercard is responding again, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logging.warning(
+                        f"Mastercard failed {self.failures} times in a row, "
+                        f"pausing requests for {self.reset_timeout}s"
+                    )
+                self.opened_at = self.clock()
+                self.trial_in_flight = False
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+def backoff_delay(attempt, backoff_factor, retry_after=None, rng=random):
+    """Seconds to wait before retry number attempt (from 0), with full jitter."""
+    delay = rng.uniform(0, min(MAX_BACKOFF_SECONDS, backoff_factor * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_after_seconds(value, now=None):
+    """Parse a Retry-After header, given as seconds or an HTTP date, or return None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    from email.utils import parsedate_to_datetime
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = now or datetime.datetime.now(datetime.UTC)
+    return max(0.0, (when - now).total_seconds())
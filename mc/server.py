@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import signal
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .domain import amount, date, transaction
+from .repository.cache import default_cache_dir
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 0  # Any free port, recorded in the state file for clients to find
+CLIENT_TIMEOUT = 5
+STATE_FILE_NAME = "server.json"
+
+
+def default_state_path():
+    return os.path.join(default_cache_dir(), STATE_FILE_NAME)
+
+
+class ConversionService:
+    """Settles transactions from a rate cache.
+
+    When several requests need the same uncached rate at once, only the first asks
+    Mastercard; the rest share its rate through transaction.rate_requests.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def settle(
+        self,
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        exchange_rate_date,
+        bank_fee_percentage=0,
+    ):
+        return transaction.settle(
+            transaction_amount=transaction_amount,
+            transaction_currency=transaction_currency,
+            card_currency=card_currency,
+            exchange_rate_date=exchange_rate_date,
+            bank_fee_percentage=bank_fee_percentage,
+            cache=self.cache,
+        )
+
+    def stats(self):
+        requests = transaction.rate_requests
+        return {
+            "rate_requests": requests.total,
+            "rate_requests_merged": requests.merged,
+            "merge_ratio": requests.merge_ratio,
+        }
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/health":
+            return self.send_json(200, {"status": "ok", **self.server.service.stats()})
+        if url.path != "/convert":
+            return self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+        try:
+            arguments = parse_query(urllib.parse.parse_qs(url.query))
+        except (KeyError, ValueError, OverflowError) as e:
+            return self.send_json(400, {"error": f"Bad request: {e}"})
+
+        try:
+            result = self.server.service.settle(**arguments)
+        except Exception as e:
+            logging.exception("Conversion failed")
+            return self.send_json(502, {"error": str(e)})
+
+        self.send_json(200, result)
+
+    def send_json(self, status, body):
+        content = amount.to_json(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def parse_query(query):
+    exchange_rate_date = query.get("date", [transaction.LATEST_DATE])[0]
+    if exchange_rate_date != transaction.LATEST_DATE:
+        exchange_rate_date = date.parse(exchange_rate_date)
+    return {
+        "transaction_amount": amount.parse(query["amount"][0]),
+        "transaction_currency": parse_currency(query["from"][0]),
+        "card_currency": parse_currency(query["to"][0]),
+        "exchange_rate_date": exchange_rate_date,
+        "bank_fee_percentage": amount.parse(query.get("bank_fee", ["0"])[0]),
+    }
+
+
+def parse_currency(currency):
+    # Currency codes go into Mastercard's query, so nothing else may get through
+    if len(currency) != 3 or not (currency.isascii() and currency.isalpha()):
+        raise ValueError(f"{currency!r} isn't a currency code")
+    return currency.upper()
+
+
+def serve(cache, host=DEFAULT_HOST, port=DEFAULT_PORT, state_path=None):
+    """Serve conversions until interrupted, advertising the address in a state file."""
+    state_path = state_path or default_state_path()
+
+    httpd = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    httpd.service = ConversionService(cache)
+    host, port = httpd.server_address[:2]
+
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    with open(state_path, "w") as state_file:
+        json.dump({"host": host, "port": port, "pid": os.getpid()}, state_file)
+
+    logging.info(f"Serving conversions on http://{host}:{port}")
+    # Exit cleanly when terminated so the state file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        os.remove(state_path)
+
+
+def server_address(state_path=None):
+    """Return the (host, port) of a running server, or None if there isn't one."""
+    try:
+        with open(state_path or default_state_path()) as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+    return state["host"], state["port"]
+
+
+def settle_via_server(
+    address,
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage=0,
+):
+    """Ask a running server to settle a transaction.
+
+    Returns None if the server can't be reached, or what answered isn't a conversion
+    server, so the caller can settle itself. Raises ServerError if the server
+    couldn't settle the transaction.
+    """
+    query = urllib.parse.urlencode(
+        {
+            "amount": transaction_amount,
+            "from": transaction_currency,
+            "to": card_currency,
+            "date": exchange_rate_date,
+            "bank_fee": bank_fee_percentage,
+        }
+    )
+    url = f"http://{address[0]}:{address[1]}/convert?{query}"
+
+    try:
+        with urllib.request.urlopen(url, timeout=CLIENT_TIMEOUT) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            error = json.load(e)["error"]
+        except (ValueError, KeyError, TypeError):
+            # A stale state file can point at a port since taken by something else
+            logging.debug(f"{address} isn't a conversion server: {e}")
+            return None
+        # The server was reached, so report its error rather than retrying locally
+        raise ServerError(error) from e
+    except ValueError as e:
+        logging.debug(f"{address} isn't a conversion server: {e}")
+        return None
+    except OSError as e:
+        logging.debug(f"Conversion server at {address} is unreachable: {e}")
+        return None
+
+
+class ServerError(RuntimeError):
+    pass
@@ -0,0 +1,46 @@
+import unittest
+from decimal import Decimal
+
+from domain import amount
+
+
+class TestAmountParse(unittest.TestCase):
+    def test_keeps_every_digit(self):
+        self.assertEqual(amount.parse("1234567.89"), Decimal("1234567.89"))
+
+    def test_json_numbers(self):
+        self.assertEqual(amount.parse(0.1), Decimal("0.1"))
+        self.assertEqual(amount.parse(10), Decimal(10))
+
+    def test_invalid(self):
+        for value in ("ten", "", "NaN", "inf", None):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                amount.parse(value)
+
+
+class TestAmountFormat(unittest.TestCase):
+    def test_plain_notation(self):
+        self.assertEqual(amount.format(Decimal("1E+3")), "1000")
+        self.assertEqual(amount.format(1e16), "10000000000000000")
+        self.assertEqual(amount.format(Decimal("1234567.89")), "1234567.89")
+
+
+class TestAmountRoundPlaces(unittest.TestCase):
+    def test_halves_round_away_from_zero(self):
+        # The rounding chosen for Mastercard, which no recorded response confirms
+        self.assertEqual(
+            amount.round_places(Decimal("0.0000025"), 6), Decimal("0.000003")
+        )
+        self.assertEqual(
+            amount.round_places(Decimal("-0.0000025"), 6), Decimal("-0.000003")
+        )
+
+    def test_drops_trailing_zeros(self):
+        self.assertEqual(str(amount.round_places(Decimal("7.5428700"), 6)), "7.54287")
+        self.assertEqual(str(amount.round_places(Decimal("1000.0000001"), 6)), "1000")
+
+
+class TestAmountFixed(unittest.TestCase):
+    def test_fixed(self):
+        self.assertEqual(amount.fixed(Decimal("-12.340")), (-12340, 3))
+        self.assertEqual(amount.fixed(Decimal("1E+3")), (1000, 0))
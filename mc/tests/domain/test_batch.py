@@ -0,0 +1,376 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest.mock import patch
+
+from domain import batch
+from repository.cache import RateCache
+
+from mc.tests.fakes import fake_settle
+
+fake_mastercard_settle = fake_settle(
+    lambda transaction_currency, card_currency, exchange_rate_date: (
+        0.754287 if transaction_currency == "USD" else 1.325754
+    )
+)
+
+
+class TestBatchReadRows(unittest.TestCase):
+    def test_csv(self):
+        lines = io.StringIO(
+            "amount,from,to,date,bank_fee\n10,usd,gbp,2018-06-03,2\n5,GBP,USD,,\n"
+        )
+
+        rows = list(batch.read_rows(lines, "csv"))
+
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "amount": 10.0,
+                    "from": "USD",
+                    "to": "GBP",
+                    "date": "2018-06-03",
+                    "bank_fee": 2.0,
+                },
+                {
+                    "amount": 5.0,
+                    "from": "GBP",
+                    "to": "USD",
+                    "date": "0000-00-00",
+                    "bank_fee": 0.0,
+                },
+            ],
+        )
+
+    def test_jsonl_skips_blank_lines(self):
+        lines = io.StringIO('{"amount": 10, "from": "usd", "to": "gbp"}\n\n')
+
+        rows = list(batch.read_rows(lines, "jsonl"))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["date"], "0000-00-00")
+
+    def test_missing_field(self):
+        lines = io.StringIO("amount,from\n10,usd\n")
+
+        with self.assertRaises(ValueError):
+            list(batch.read_rows(lines, "csv"))
+
+    def test_jsonl_amounts_keep_every_digit(self):
+        lines = io.StringIO(
+            '{"amount": 12345678901234567.89, "from": "usd", "to": "gbp"}\n'
+        )
+
+        (row,) = batch.read_rows(lines, "jsonl")
+
+        self.assertEqual(row["amount"], Decimal("12345678901234567.89"))
+
+    def test_bad_row_is_numbered(self):
+        lines = io.StringIO('{"amount": 10, "from": "usd", "to": "gbp"}\n\n[1]\n')
+
+        with self.assertRaisesRegex(batch.RowError, "^Row 2: Row isn't an object"):
+            list(batch.read_rows(lines, "jsonl"))
+
+    def test_check_currencies(self):
+        lines = io.StringIO("amount,from,to\n10,usd,gbp\n5,usx,gbp\n5,gbp,gpb\n")
+
+        problems = batch.check_currencies(
+            batch.read_rows(lines, "csv"), {"GBP": "POUND", "USD": "DOLLAR"}
+        )
+
+        self.assertEqual(
+            problems,
+            [
+                "Row 2: Unknown currency USX, did you mean USD?",
+                "Row 3: Unknown currency GPB, did you mean GBP?",
+            ],
+        )
+
+    def test_is_lazy(self):
+        lines = iter(["amount,from,to\n", "10,usd,gbp\n", "not,a,row,at,all,really\n"])
+
+        rows = batch.read_rows(lines, "csv")
+
+        self.assertEqual(next(rows)["amount"], 10.0)
+
+
+class TestBatchConvertRows(unittest.TestCase):
+    @patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+    def test_collapses_lookups_per_date_and_pair(self, settle_mock):
+        rows = [
+            {
+                "amount": amount,
+                "from": "USD",
+                "to": "GBP",
+                "date": "2018-06-03",
+                "bank_fee": 0,
+            }
+            for amount in (10, 20, 30)
+        ] + [
+            {
+                "amount": 1,
+                "from": "GBP",
+                "to": "USD",
+                "date": "2018-06-03",
+                "bank_fee": 0,
+            }
+        ]
+
+        results = list(batch.convert_rows(rows, RateCache(":memory:")))
+
+        self.assertEqual(settle_mock.call_count, 2)
+        self.assertEqual(
+            [result["card_amount"] for result in results],
+            [7.54287, 15.08574, 22.62861, 1.325754],
+        )
+
+    @patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+    def test_refresh_fetches_each_key_once(self, settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-03", "USD", "GBP", 0.5)
+        rows = [
+            {
+                "amount": amount,
+                "from": "USD",
+                "to": "GBP",
+                "date": "2018-06-03",
+                "bank_fee": 0,
+            }
+            for amount in (10, 20)
+        ]
+
+        results = list(batch.convert_rows(rows, cache, refresh=True))
+
+        self.assertEqual(settle_mock.call_count, 1)
+        self.assertEqual(results[1]["conversion_rate"], 0.754287)
+
+
+class TestBatchConvertFile(unittest.TestCase):
+    ROWS = "".join(
+        f"{amount},{pair},{exchange_rate_date},{amount % 3}\n"
+        for amount in range(1, 200)
+        for pair, exchange_rate_date in (("usd,gbp", "2018-06-03"), ("GBP,USD", ""))
+    )
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_input(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", newline="") as input_file:
+            input_file.write(text)
+        return path
+
+    @patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+    def test_csv_matches_convert_rows(self, settle_mock):
+        self.assert_matches_convert_rows(
+            "rows.csv", "amount,from,to,date,bank_fee\n" + self.ROWS, "csv"
+        )
+
+    @patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+    def test_jsonl_matches_convert_rows(self, settle_mock):
+        text = "".join(
+            json.dumps(dict(zip(batch.INPUT_FIELDS, line.split(",")))) + "\n"
+            for line in self.ROWS.splitlines()
+        )
+        self.assert_matches_convert_rows("rows.jsonl", text, "jsonl")
+
+    def assert_matches_convert_rows(self, name, text, input_format):
+        path = self.write_input(name, text)
+        cache = RateCache(":memory:")
+        parallel = io.StringIO()
+
+        batch.convert_file(
+            path, parallel, input_format, cache, workers=2, chunk_bytes=1000
+        )
+
+        serial = io.StringIO()
+        with open(path) as input_file:
+            batch.write_rows(
+                batch.convert_rows(batch.read_rows(input_file, input_format), cache),
+                serial,
+                input_format,
+            )
+        self.assertEqual(parallel.getvalue(), serial.getvalue())
+
+    def test_unknown_currency(self):
+        path = self.write_input("rows.csv", "amount,from,to\n10,usd,gpb\n")
+
+        with self.assertRaises(ValueError):
+            batch.convert_file(
+                path,
+                io.StringIO(),
+                "csv",
+                RateCache(":memory:"),
+                workers=2,
+                currencies={"GBP": "POUND", "USD": "DOLLAR"},
+            )
+
+    def test_bad_row_is_numbered_from_start_of_file(self):
+        path = self.write_input(
+            "rows.csv", "amount,from,to,date,bank_fee\n" + self.ROWS + "ten,usd,gbp,,\n"
+        )
+
+        with self.assertRaises(batch.RowError) as raised:
+            batch.convert_file(
+                path,
+                io.StringIO(),
+                "csv",
+                RateCache(":memory:"),
+                workers=2,
+                chunk_bytes=1000,
+            )
+        self.assertEqual(raised.exception.number, self.ROWS.count("\n") + 1)
+
+    def test_chunk_ranges_end_at_line_breaks(self):
+        text = b"header\n" + b"".join(b"%d\n" % (i * 1000) for i in range(100))
+        input_file = io.BytesIO(text)
+
+        chunks = batch.chunk_ranges(input_file, 7, len(text), 7)
+
+        self.assertEqual(len(chunks), 7)
+        self.assertEqual(chunks[0][0], 7)
+        self.assertEqual(chunks[-1][1], len(text))
+        for (_, end), (start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(text[end - 1 : end], b"\n")
+
+
+class TestBatchBoundedMap(unittest.TestCase):
+    def test_keeps_order_with_few_calls_in_flight(self):
+        submitted = []
+
+        def square(n):
+            submitted.append(n)
+            return n * n
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = []
+            for result in batch.bounded_map(
+                executor, square, [(n,) for n in range(10)], 3
+            ):
+                # Each result is yielded before more than 3 calls are submitted past it
+                self.assertLessEqual(len(submitted), len(results) + 3)
+                results.append(result)
+
+        self.assertEqual(results, [n * n for n in range(10)])
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestBatchConvertAppended(unittest.TestCase):
+    HEADER = "amount,from,to,date\n"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input_path = os.path.join(directory.name, "statement.csv")
+        self.output_path = os.path.join(directory.name, "converted.csv")
+        self.cache = RateCache(":memory:")
+
+    def append(self, text):
+        with open(self.input_path, "a", newline="") as input_file:
+            input_file.write(text)
+
+    def convert(self):
+        return batch.convert_appended(
+            self.input_path, self.output_path, "csv", self.cache
+        )
+
+    def output_amounts(self):
+        with open(self.output_path, newline="") as output_file:
+            return [row["card_amount"] for row in csv.DictReader(output_file)]
+
+    def test_converts_only_new_rows(self, settle_mock):
+        self.append(self.HEADER + "10,usd,gbp,2018-06-03\n")
+        self.assertEqual(self.convert(), 1)
+
+        self.append("20,usd,gbp,2018-06-03\n30,usd,gbp,2018-06-03\n")
+        self.assertEqual(self.convert(), 2)
+        self.assertEqual(self.convert(), 0)
+
+        self.assertEqual(self.output_amounts(), ["7.54287", "15.08574", "22.62861"])
+
+    def test_leaves_incomplete_line(self, settle_mock):
+        self.append(self.HEADER + "10,usd,gbp,2018-06-03\n20,usd,g")
+        self.assertEqual(self.convert(), 1)
+
+        self.append("bp,2018-06-03\n")
+        self.assertEqual(self.convert(), 1)
+
+        self.assertEqual(self.output_amounts(), ["7.54287", "15.08574"])
+
+    def test_changed_prefix_converts_everything(self, settle_mock):
+        self.append(self.HEADER + "10,usd,gbp,2018-06-03\n")
+        self.convert()
+
+        with open(self.input_path, "w", newline="") as input_file:
+            input_file.write(self.HEADER + "30,usd,gbp,2018-06-03\n")
+        self.append("20,usd,gbp,2018-06-03\n")
+
+        self.assertEqual(self.convert(), 2)
+        self.assertEqual(self.output_amounts(), ["22.62861", "15.08574"])
+
+    def test_changed_middle_row_converts_everything(self, settle_mock):
+        self.append(self.HEADER + "10,usd,gbp,2018-06-03\n" * 3)
+        self.convert()
+
+        with open(self.input_path, "r+", newline="") as input_file:
+            input_file.seek(len(self.HEADER) + 22)
+            input_file.write("40")
+        self.append("20,usd,gbp,2018-06-03\n")
+
+        self.assertEqual(self.convert(), 4)
+
+    def test_drops_output_of_unfinished_run(self, settle_mock):
+        self.append(self.HEADER + "10,usd,gbp,2018-06-03\n")
+        self.convert()
+        with open(self.output_path, "a", newline="") as output_file:
+            output_file.write("99,USD,1,GBP,1,2018-06-03,0\n")
+
+        self.append("20,usd,gbp,2018-06-03\n")
+        self.convert()
+
+        self.assertEqual(self.output_amounts(), ["7.54287", "15.08574"])
+
+
+class TestBatchWriteRows(unittest.TestCase):
+    def test_csv(self):
+        output = io.StringIO()
+
+        batch.write_rows([self.valid_result()], output, "csv")
+
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "transaction_amount,transaction_currency,card_amount,card_currency,conversion_rate,conversion_rate_date,bank_fee_percentage",
+                "10,USD,7.54287,GBP,0.754287,2018-06-03,0",
+            ],
+        )
+
+    def test_jsonl(self):
+        output = io.StringIO()
+
+        batch.write_rows([self.valid_result(), self.valid_result()], output, "jsonl")
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), self.valid_result())
+
+    @staticmethod
+    def valid_result():
+        return {
+            "bank_fee_percentage": 0,
+            "card_amount": 7.54287,
+            "card_currency": "GBP",
+            "conversion_rate": 0.754287,
+            "conversion_rate_date": "2018-06-03",
+            "transaction_amount": 10,
+            "transaction_currency": "USD",
+        }
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+from domain import currency
+from repository.cache import RateCache
+
+
+class TestCurrencyCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.cache = RateCache(":memory:")
+        self.addCleanup(self.cache.close)
+
+    @patch("mc.repository.mastercard.currencies")
+    def test_fetches_once_then_uses_cache(self, currencies_mock):
+        currencies_mock.return_value = self.valid_currencies()
+
+        first = currency.catalogue(self.cache)
+        second = currency.catalogue(self.cache)
+
+        currencies_mock.assert_called_once()
+        self.assertEqual(first, {"GBP": "GREAT BRITISH POUND", "JPY": "JAPANESE YEN"})
+        self.assertEqual(second, first)
+
+    @patch("mc.repository.mastercard.currencies")
+    def test_refresh_fetches_again(self, currencies_mock):
+        currencies_mock.return_value = self.valid_currencies()
+
+        currency.catalogue(self.cache)
+        currency.catalogue(self.cache, refresh=True)
+
+        self.assertEqual(currencies_mock.call_count, 2)
+
+    @staticmethod
+    def valid_currencies():
+        return [
+            {"alphaCd": "GBP", "currNam": "GREAT BRITISH POUND"},
+            {"alphaCd": "JPY", "currNam": "JAPANESE YEN        "},
+        ]
+
+
+class TestCurrencyCheck(unittest.TestCase):
+    CURRENCIES = {
+        "GBP": "GREAT BRITISH POUND",
+        "JPY": "JAPANESE YEN",
+        "USD": "UNITED STATES DOLLAR",
+    }
+
+    def test_known(self):
+        currency.check("GBP", self.CURRENCIES)
+
+    def test_suggests_similar_code(self):
+        with self.assertRaises(currency.UnknownCurrencyError) as raised:
+            currency.check("USX", self.CURRENCIES)
+
+        self.assertEqual(raised.exception.suggestions, ["USD"])
+        self.assertEqual(
+            str(raised.exception), "Unknown currency USX, did you mean USD?"
+        )
+
+    def test_suggests_by_name(self):
+        with self.assertRaises(currency.UnknownCurrencyError) as raised:
+            currency.check("YEN", self.CURRENCIES)
+
+        self.assertEqual(raised.exception.suggestions, ["JPY"])
+
+    def test_no_suggestions(self):
+        with self.assertRaises(currency.UnknownCurrencyError) as raised:
+            currency.check("QQQ", self.CURRENCIES)
+
+        self.assertEqual(raised.exception.suggestions, [])
+        self.assertEqual(str(raised.exception), "Unknown currency QQQ")
@@ -0,0 +1,63 @@
+import datetime
+import unittest
+
+from domain import date
+
+
+def timestamp(*args):
+    return datetime.datetime(*args, tzinfo=datetime.UTC).timestamp()
+
+
+class TestLatestRatesExpiry(unittest.TestCase):
+    def test_before_publication_expires_at_publication(self):
+        # Wednesday morning, showing Tuesday's rates
+        expiry = date.latest_rates_expiry("2018-06-05", timestamp(2018, 6, 6, 9))
+
+        self.assertEqual(expiry, timestamp(2018, 6, 6, date.PUBLICATION_HOUR_UTC))
+
+    def test_after_publication_expires_at_next_publication(self):
+        expiry = date.latest_rates_expiry("2018-06-06", timestamp(2018, 6, 6, 18))
+
+        self.assertEqual(expiry, timestamp(2018, 6, 7, date.PUBLICATION_HOUR_UTC))
+
+    def test_skips_weekends(self):
+        # Friday's rates on Friday evening last until Monday
+        expiry = date.latest_rates_expiry("2018-06-08", timestamp(2018, 6, 8, 18))
+
+        self.assertEqual(expiry, timestamp(2018, 6, 11, date.PUBLICATION_HOUR_UTC))
+
+    def test_weekend(self):
+        expiry = date.latest_rates_expiry("2018-06-08", timestamp(2018, 6, 9, 18))
+
+        self.assertEqual(expiry, timestamp(2018, 6, 11, date.PUBLICATION_HOUR_UTC))
+
+    def test_late_publication_checks_again_soon(self):
+        now = timestamp(2018, 6, 6, 18)
+
+        expiry = date.latest_rates_expiry("2018-06-05", now)
+
+        self.assertEqual(expiry, now + date.LATE_PUBLICATION_RETRY_SECONDS)
+
+    def test_late_retry(self):
+        now = timestamp(2018, 6, 6, 18)
+
+        expiry = date.latest_rates_expiry("2018-06-05", now, late_retry=60)
+
+        self.assertEqual(expiry, now + 60)
+
+    def test_is_late(self):
+        self.assertTrue(date.is_late("2018-06-05", timestamp(2018, 6, 6, 18)))
+        self.assertFalse(date.is_late("2018-06-05", timestamp(2018, 6, 6, 9)))
+        self.assertFalse(date.is_late("2018-06-06", timestamp(2018, 6, 6, 18)))
+        self.assertFalse(date.is_late("2018-06-08", timestamp(2018, 6, 9, 18)))
+
+
+class TestDatesBetween(unittest.TestCase):
+    def test_inclusive(self):
+        self.assertEqual(
+            list(date.dates_between("2018-06-29", "2018-07-02")),
+            ["2018-06-29", "2018-06-30", "2018-07-01", "2018-07-02"],
+        )
+
+    def test_empty(self):
+        self.assertEqual(list(date.dates_between("2018-06-02", "2018-06-01")), [])
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from domain import history
+from repository.cache import RateCache
+from repository.rate_store import RateStore
+
+from mc.tests.fakes import fake_settle
+
+# A different rate for every day
+fake_mastercard_settle = fake_settle(
+    lambda transaction_currency, card_currency, exchange_rate_date: (
+        0.75 + int(exchange_rate_date[-2:]) / 1000
+    )
+)
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+@patch(
+    "mc.repository.mastercard.rates_available",
+    side_effect=lambda exchange_rate_date: exchange_rate_date != "2018-06-06",
+)
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.cache = RateCache(":memory:")
+
+    def test_skips_weekends_and_unpublished_days(self, available_mock, settle_mock):
+        # 2018-06-02 and 2018-06-03 are a weekend
+        rates = history.history("USD", "GBP", "2018-06-01", "2018-06-07", self.cache)
+
+        self.assertEqual(
+            rates,
+            [
+                ("2018-06-01", 0.751),
+                ("2018-06-04", 0.754),
+                ("2018-06-05", 0.755),
+                ("2018-06-07", 0.757),
+            ],
+        )
+        self.assertEqual(available_mock.call_count, 5)
+        self.assertEqual(settle_mock.call_count, 4)
+
+    def test_repeat_query_uses_cache(self, available_mock, settle_mock):
+        history.history("USD", "GBP", "2018-06-01", "2018-06-07", self.cache)
+        available_mock.reset_mock()
+        settle_mock.reset_mock()
+
+        rates = history.history("USD", "GBP", "2018-06-01", "2018-06-07", self.cache)
+
+        self.assertEqual(len(rates), 4)
+        available_mock.assert_not_called()
+        settle_mock.assert_not_called()
+
+    def test_refresh_fetches_again(self, available_mock, settle_mock):
+        history.history("USD", "GBP", "2018-06-04", "2018-06-05", self.cache)
+        settle_mock.reset_mock()
+
+        history.history(
+            "USD", "GBP", "2018-06-04", "2018-06-05", self.cache, refresh=True
+        )
+
+        self.assertEqual(settle_mock.call_count, 2)
+
+    def test_fill_store(self, available_mock, settle_mock):
+        with tempfile.TemporaryDirectory() as directory:
+            with RateStore(os.path.join(directory, "rates.mcrates")) as store:
+                stored = history.fill_store(
+                    store, ["GBP", "USD"], "2018-06-04", "2018-06-05", self.cache
+                )
+
+                self.assertEqual(stored, 4)
+                self.assertEqual(
+                    store.rates_on("2018-06-04"),
+                    [("GBP", "USD", 0.754), ("USD", "GBP", 0.754)],
+                )
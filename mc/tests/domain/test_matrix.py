@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from domain import matrix
+from repository.cache import RateCache
+from repository.rate_store import RateStore
+
+from mc.tests.fakes import fake_settle
+
+# Rates of one unit of each currency in USD
+USD_RATES = {"USD": 1.0, "GBP": 1.25, "EUR": 1.1, "JPY": 0.0064}
+
+
+fake_mastercard_settle = fake_settle(
+    lambda transaction_currency, card_currency, exchange_rate_date: (
+        USD_RATES[transaction_currency] / USD_RATES[card_currency]
+    )
+)
+
+
+class TestRateMatrix(unittest.TestCase):
+    def setUp(self):
+        self.matrix = matrix.RateMatrix(["GBP", "EUR", "JPY"], "2018-06-04")
+
+    def test_pivot_is_added(self):
+        self.assertIn("USD", self.matrix.index)
+
+    def test_identity(self):
+        self.assertEqual(self.matrix.rate("GBP", "GBP"), 1.0)
+
+    def test_direct(self):
+        self.matrix.set("GBP", "EUR", 1.13)
+
+        self.assertEqual(self.matrix.rate("GBP", "EUR"), 1.13)
+
+    def test_inverse(self):
+        self.matrix.set("GBP", "USD", 1.25)
+
+        self.assertAlmostEqual(self.matrix.rate("USD", "GBP"), 0.8)
+
+    def test_triangulates_through_pivot(self):
+        self.matrix.set("GBP", "USD", 1.25)
+        self.matrix.set("EUR", "USD", 1.1)
+
+        self.assertAlmostEqual(self.matrix.rate("GBP", "EUR"), 1.25 / 1.1)
+
+    def test_unknown(self):
+        self.matrix.set("GBP", "USD", 1.25)
+
+        with self.assertRaises(KeyError):
+            self.matrix.rate("GBP", "JPY")
+
+    def test_from_catalogue(self):
+        rate_matrix = matrix.RateMatrix.from_catalogue(
+            [
+                {"alphaCd": "GBP", "currNam": "GREAT BRITISH POUND"},
+                {"alphaCd": "USD", "currNam": "UNITED STATES DOLLAR"},
+            ],
+            "2018-06-04",
+        )
+
+        self.assertEqual(rate_matrix.index, {"GBP": 0, "USD": 1})
+
+    def test_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with RateStore(os.path.join(directory, "rates.mcrates")) as store:
+                store.put("2018-06-04", "GBP", "USD", 1.25)
+                store.put("2018-06-04", "EUR", "USD", 1.1)
+                store.put("2018-06-05", "EUR", "USD", 1.2)
+
+                rate_matrix = matrix.RateMatrix.from_store(store, "2018-06-04")
+
+        self.assertAlmostEqual(rate_matrix.rate("GBP", "EUR"), 1.25 / 1.1)
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestBuild(unittest.TestCase):
+    def test_fetches_one_rate_per_currency(self, settle_mock):
+        rate_matrix = matrix.build(
+            ["GBP", "EUR", "JPY"], "2018-06-04", RateCache(":memory:")
+        )
+
+        self.assertEqual(settle_mock.call_count, 3)
+        self.assertAlmostEqual(rate_matrix.rate("JPY", "GBP"), 0.0064 / 1.25)
+        self.assertAlmostEqual(rate_matrix.rate("EUR", "JPY"), 1.1 / 0.0064)
+
+    def test_uses_cached_rates(self, settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-04", "GBP", "USD", 1.25)
+        cache.put("2018-06-04", "USD", "EUR", 1 / 1.1)
+
+        matrix.build(["GBP", "EUR", "JPY"], "2018-06-04", cache)
+
+        settle_mock.assert_called_once()
+
+    def test_verify(self, settle_mock):
+        rate_matrix = matrix.RateMatrix(["GBP", "EUR"], "2018-06-04")
+        rate_matrix.set("GBP", "USD", 1.25)
+        rate_matrix.set("EUR", "USD", 1.2)
+
+        mismatches = matrix.verify(
+            rate_matrix, [("GBP", "USD"), ("GBP", "EUR")], tolerance=0.01
+        )
+
+        self.assertEqual(len(mismatches), 1)
+        self.assertEqual(mismatches[0][:2], ("GBP", "EUR"))
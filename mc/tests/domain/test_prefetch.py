@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from domain import prefetch
+from repository.cache import RateCache
+from repository.rate_store import RateStore
+
+from mc.tests.fakes import fake_settle
+
+fake_mastercard_settle = fake_settle(
+    lambda transaction_currency, card_currency, exchange_rate_date: (
+        2.0 if transaction_currency == "USD" else 0.5
+    )
+)
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.cache = RateCache(":memory:")
+        self.cache.put_latest_date("2018-06-05", expires_at=time.time() + 60)
+
+    def test_fetches_missing_pairs(self, settle_mock):
+        self.cache.put("2018-06-05", "USD", "GBP", 2.0)
+
+        fx_date, fetched = prefetch.prefetch(
+            [("USD", "GBP"), ("GBP", "USD")], self.cache
+        )
+
+        self.assertEqual((fx_date, fetched), ("2018-06-05", 1))
+        settle_mock.assert_called_once()
+        self.assertEqual(
+            self.cache.get("2018-06-05", "GBP", "USD"), ("2018-06-05", 0.5)
+        )
+
+    @patch("mc.repository.mastercard.rates_available", return_value=True)
+    def test_refresh_probes_for_a_new_publication(self, available_mock, settle_mock):
+        fx_date, _ = prefetch.prefetch([("USD", "GBP")], self.cache, refresh=True)
+
+        available_mock.assert_called()
+        self.assertNotEqual(fx_date, "2018-06-05")
+
+    def test_fills_store_through_pivot(self, settle_mock):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with RateStore(os.path.join(directory.name, "rates.mcrates")) as store:
+            prefetch.prefetch([("EUR", "GBP")], self.cache, store)
+
+            self.assertEqual(store.get("2018-06-05", "EUR", "USD"), 0.5)
+            self.assertEqual(store.get("2018-06-05", "USD", "GBP"), 2.0)
+
+    def test_store_skips_rates_of_another_date(self, settle_mock):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settle_mock.side_effect = lambda **arguments: {
+            **fake_mastercard_settle(**arguments),
+            "fxDate": "2018-06-04"
+            if arguments["transaction_currency"] == "EUR"
+            else arguments["exchange_rate_date"],
+        }
+
+        with (
+            RateStore(os.path.join(directory.name, "rates.mcrates")) as store,
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            prefetch.prefetch([("EUR", "GBP")], self.cache, store)
+
+            self.assertEqual(store.get("2018-06-05", "USD", "GBP"), 2.0)
+        self.assertIn("No EUR->USD rate for 2018-06-05", logs.output[0])
+
+
+class TestPrefetchRun(unittest.TestCase):
+    @patch("domain.prefetch.prefetch")
+    def test_failures_are_retried_after_interval(self, prefetch_mock):
+        prefetch_mock.side_effect = [ConnectionError, ("2018-06-05", 1)]
+        # Stop the loop once it waits after the successful prefetch
+        sleep = Mock(side_effect=[None, KeyboardInterrupt])
+        reports = []
+
+        with self.assertLogs(level="ERROR"), self.assertRaises(KeyboardInterrupt):
+            prefetch.run(
+                [("USD", "GBP")],
+                RateCache(":memory:"),
+                interval=60,
+                report=reports.append,
+                sleep=sleep,
+            )
+
+        self.assertEqual(sleep.call_args_list[0].args, (60,))
+        self.assertEqual(reports, ["2018-06-05: fetched 1 rates"])
+
+
+class TestPrefetchParsePair(unittest.TestCase):
+    def test_parse_pair(self):
+        self.assertEqual(prefetch.parse_pair("usd:gbp"), ("USD", "GBP"))
+
+    def test_invalid_pair(self):
+        with self.assertRaises(ValueError):
+            prefetch.parse_pair("usdgbp")
+
+
+class TestPrefetchNextPoll(unittest.TestCase):
+    def test_waits_for_next_publication(self):
+        # Wednesday evening, with Wednesday's rates
+        now = 1528308000
+
+        wait, late = prefetch.next_poll("2018-06-06", now, interval=60)
+
+        self.assertEqual(wait, 20 * 60 * 60)
+        self.assertFalse(late)
+
+    def test_polls_at_interval_while_late(self):
+        wait, late = prefetch.next_poll("2018-06-05", 1528308000, interval=60)
+
+        self.assertEqual(wait, 60)
+        self.assertTrue(late)
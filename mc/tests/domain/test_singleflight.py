@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from domain import singleflight, transaction
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_call(self):
+        flight = singleflight.SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return "rate"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: flight.do("key", fetch), range(8)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], ["rate"] * 8)
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 7)
+        self.assertEqual((flight.total, flight.merged), (8, 7))
+        self.assertEqual(flight.merge_ratio, 7 / 8)
+
+    def test_different_keys_are_not_merged(self):
+        flight = singleflight.SingleFlight()
+
+        self.assertEqual(flight.do("a", lambda: 1), (1, False))
+        self.assertEqual(flight.do("b", lambda: 2), (2, False))
+        self.assertEqual(flight.do("a", lambda: 3), (3, False))
+
+    def test_error_is_shared(self):
+        flight = singleflight.SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.05)
+            raise ValueError("Mastercard is down")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, "key", fail)
+            started.wait()
+            follower = executor.submit(flight.do, "key", fail)
+
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result()
+
+        # Once the call is finished, the key can be tried again
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
+
+    def test_async_calls_share_one_call(self):
+        flight = singleflight.SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "rate"
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.do_async("key", fetch) for _ in range(5))
+            )
+
+        results = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("rate", False)] + [("rate", True)] * 4)
+
+
+def slow_mastercard_settle(
+    transaction_amount,
+    transaction_currency,
+    card_currency,
+    exchange_rate_date,
+    bank_fee_percentage,
+):
+    time.sleep(0.05)
+    return {
+        "conversionRate": 0.754287,
+        "crdhldBillAmt": round(transaction_amount * 0.754287, 6),
+        "fxDate": "2018-06-03",
+        "transCurr": transaction_currency,
+        "crdhldBillCurr": card_currency,
+        "transAmt": transaction_amount,
+    }
+
+
+class TestTransactionSettleCoalescing(unittest.TestCase):
+    @patch("mc.repository.mastercard.settle", side_effect=slow_mastercard_settle)
+    def test_concurrent_settles_share_a_request(self, settle_mock):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda amount: transaction.settle(
+                        amount, "USD", "GBP", "2018-06-03"
+                    ),
+                    range(1, 5),
+                )
+            )
+
+        settle_mock.assert_called_once()
+        # Each caller still gets the settlement of its own amount
+        self.assertEqual(
+            [result["card_amount"] for result in results],
+            [round(amount * 0.754287, 6) for amount in range(1, 5)],
+        )
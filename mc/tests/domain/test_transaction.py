@@ -1,7 +1,13 @@
+import time
 import unittest
-from unittest.mock import patch
+from array import array
+from decimal import Decimal
+from unittest.mock import AsyncMock, patch
 
 from domain import transaction
+from repository.cache import RateCache
+
+from mc.repository.throttle import CircuitOpenError
 
 
 class TestTransactionSettle(unittest.TestCase):
@@ -29,6 +35,20 @@ class TestTransactionSettle(unittest.TestCase):
             },
         )
 
+    @patch("mc.repository.mastercard.settle")
+    def test_decimal_amount_gives_decimal_result(self, settle_mock):
+        settle_mock.return_value = self.valid_settle_return_value()
+
+        result = transaction.settle(
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=Decimal("10.00"),
+            transaction_currency="USD",
+        )
+
+        self.assertEqual(result["card_amount"], Decimal("7.54287"))
+        self.assertEqual(str(result["transaction_amount"]), "10.00")
+
     @patch("mc.repository.mastercard.settle")
     def test_success_call(self, settle_mock):
         settle_mock.return_value = self.valid_settle_return_value()
@@ -68,6 +88,73 @@ class TestTransactionSettle(unittest.TestCase):
             transaction_currency="USD",
         )
 
+    @patch("mc.repository.mastercard.settle")
+    def test_cache_miss_stores_rate(self, settle_mock):
+        settle_mock.return_value = self.valid_settle_return_value()
+        cache = RateCache(":memory:")
+
+        transaction.settle(
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=10,
+            transaction_currency="USD",
+            cache=cache,
+        )
+
+        settle_mock.assert_called_once()
+        self.assertEqual(
+            cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    @patch("mc.repository.mastercard.settle")
+    def test_cache_hit_settles_locally(self, settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        result = transaction.settle(
+            bank_fee_percentage=2,
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=20,
+            transaction_currency="USD",
+            cache=cache,
+        )
+
+        settle_mock.assert_not_called()
+        self.assertEqual(
+            result,
+            {
+                "bank_fee_percentage": 2,
+                "card_amount": 15.387455,
+                "card_currency": "GBP",
+                "conversion_rate": 0.754287,
+                "conversion_rate_date": "2018-06-03",
+                "transaction_amount": 20,
+                "transaction_currency": "USD",
+            },
+        )
+
+    @patch("mc.repository.mastercard.settle")
+    def test_cache_refresh_fetches_again(self, settle_mock):
+        settle_mock.return_value = self.valid_settle_return_value()
+        cache = RateCache(":memory:")
+        cache.put("2018-06-03", "USD", "GBP", 0.5)
+
+        result = transaction.settle(
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=10,
+            transaction_currency="USD",
+            cache=cache,
+            refresh=True,
+        )
+
+        settle_mock.assert_called_once()
+        self.assertEqual(result["card_amount"], 7.542870)
+        self.assertEqual(
+            cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
     @staticmethod
     def valid_settle_return_value():
         return {
@@ -79,3 +166,262 @@ class TestTransactionSettle(unittest.TestCase):
             "transAmt": 10,
             "bankFee": 0,
         }
+
+
+class TestTransactionCircuitOpen(unittest.TestCase):
+    @patch("mc.repository.mastercard.settle", side_effect=CircuitOpenError)
+    def test_latest_falls_back_to_newest_cached_rate(self, _settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-01", "USD", "GBP", 0.75)
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        result = transaction.settle_latest(10, "USD", "GBP", cache=cache)
+
+        self.assertEqual(result["card_amount"], 7.54287)
+        self.assertEqual(result["conversion_rate_date"], "2018-06-03")
+
+    @patch("mc.repository.mastercard.settle", side_effect=CircuitOpenError)
+    def test_latest_falls_back_once_latest_date_is_memoized(self, _settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-01", "USD", "GBP", 0.754287)
+        cache.put_latest_date("2018-06-03", time.time() + 3600)
+
+        result = transaction.settle_latest(10, "USD", "GBP", cache=cache)
+
+        self.assertEqual(result["card_amount"], 7.54287)
+        self.assertEqual(result["conversion_rate_date"], "2018-06-01")
+
+    @patch("mc.repository.mastercard.settle", side_effect=CircuitOpenError)
+    def test_requested_date_does_not_fall_back(self, _settle_mock):
+        cache = RateCache(":memory:")
+        cache.put("2018-06-01", "USD", "GBP", 0.75)
+
+        with self.assertRaises(CircuitOpenError):
+            transaction.settle(10, "USD", "GBP", "2018-06-03", cache=cache)
+
+    @patch("mc.repository.mastercard.settle", side_effect=CircuitOpenError)
+    def test_nothing_cached(self, _settle_mock):
+        with self.assertRaises(CircuitOpenError):
+            transaction.settle_latest(10, "USD", "GBP", cache=RateCache(":memory:"))
+
+
+class TestTransactionLatestDate(unittest.TestCase):
+    @patch("mc.repository.mastercard.settle")
+    def test_latest_date_is_memoized(self, settle_mock):
+        settle_mock.return_value = TestTransactionSettle.valid_settle_return_value()
+        cache = RateCache(":memory:")
+
+        transaction.settle_latest(
+            card_currency="GBP",
+            transaction_amount=10,
+            transaction_currency="USD",
+            cache=cache,
+        )
+
+        self.assertEqual(cache.latest_date(), "2018-06-03")
+
+    @patch("mc.repository.mastercard.settle")
+    def test_latest_uses_concrete_date(self, settle_mock):
+        settle_mock.return_value = TestTransactionSettle.valid_settle_return_value()
+        cache = RateCache(":memory:")
+        cache.put_latest_date("2018-06-03", expires_at=time.time() + 60)
+
+        transaction.settle_latest(
+            card_currency="GBP",
+            transaction_amount=10,
+            transaction_currency="USD",
+            cache=cache,
+        )
+        result = transaction.settle_latest(
+            card_currency="GBP",
+            transaction_amount=20,
+            transaction_currency="USD",
+            cache=cache,
+        )
+
+        settle_mock.assert_called_once_with(
+            bank_fee_percentage=0,
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=10,
+            transaction_currency="USD",
+        )
+        self.assertEqual(result["card_amount"], 15.08574)
+
+    @patch("mc.repository.mastercard.rates_available", return_value=True)
+    def test_latest_date_probes_rates_available(self, available_mock):
+        cache = RateCache(":memory:")
+
+        first = transaction.latest_date(cache)
+        second = transaction.latest_date(cache)
+
+        self.assertEqual(first, second)
+        available_mock.assert_called_once()
+
+    @patch("mc.repository.mastercard.rates_available", return_value=False)
+    def test_latest_date_none_published(self, available_mock):
+        with self.assertRaises(LookupError):
+            transaction.latest_date(RateCache(":memory:"))
+
+
+class TestTransactionSettleAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_success_return(self):
+        client = AsyncMock()
+        client.settle.return_value = TestTransactionSettle.valid_settle_return_value()
+
+        result = await transaction.settle_latest_async(
+            client,
+            card_currency="GBP",
+            transaction_amount=10,
+            transaction_currency="USD",
+        )
+
+        self.assertEqual(result["card_amount"], 7.542870)
+        self.assertEqual(result["conversion_rate_date"], "2018-06-03")
+        client.settle.assert_awaited_once_with(
+            bank_fee_percentage=0,
+            card_currency="GBP",
+            exchange_rate_date="0000-00-00",
+            transaction_amount=10,
+            transaction_currency="USD",
+        )
+
+    async def test_cache_hit_settles_locally(self):
+        client = AsyncMock()
+        cache = RateCache(":memory:")
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        result = await transaction.settle_async(
+            client,
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            transaction_amount=10,
+            transaction_currency="USD",
+            cache=cache,
+        )
+
+        client.settle.assert_not_awaited()
+        self.assertEqual(result["card_amount"], 7.54287)
+
+
+class TestTransactionSettleAmounts(unittest.TestCase):
+    @patch("mc.repository.mastercard.settle")
+    def test_fetches_rate_once(self, settle_mock):
+        settle_mock.return_value = TestTransactionSettle.valid_settle_return_value()
+
+        result = transaction.settle_amounts(
+            array("d", [10, 20, 30]),
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+        )
+
+        settle_mock.assert_called_once()
+        self.assertEqual(
+            result["card_amounts"], array("d", [7.54287, 15.08574, 22.62861])
+        )
+        self.assertEqual(result["conversion_rate"], 0.754287)
+        self.assertEqual(result["conversion_rate_date"], "2018-06-03")
+
+    def test_card_amounts_match_settlements(self):
+        for response in self.settlements():
+            with self.subTest(response=response):
+                (card_amount,) = transaction.card_amounts(
+                    [response["transAmt"]],
+                    response["conversionRate"],
+                    response["bankFee"],
+                )
+
+                self.assertAlmostEqual(card_amount, response["crdhldBillAmt"], places=2)
+
+    def test_exact_card_amounts_match_settlements_exactly(self):
+        for response in self.settlements():
+            with self.subTest(response=response):
+                (card_amount,) = transaction.exact_card_amounts(
+                    [Decimal(str(response["transAmt"]))],
+                    response["conversionRate"],
+                    response["bankFee"],
+                )
+
+                self.assertEqual(card_amount, Decimal(str(response["crdhldBillAmt"])))
+
+    def test_card_units_match_settlements_exactly(self):
+        for response in self.settlements():
+            with self.subTest(response=response):
+                (units,) = transaction.card_units(
+                    [round(response["transAmt"] * 100)],
+                    2,
+                    response["conversionRate"],
+                    response["bankFee"],
+                )
+
+                self.assertEqual(
+                    Decimal(units).scaleb(-transaction.CARD_AMOUNT_PLACES),
+                    Decimal(str(response["crdhldBillAmt"])),
+                )
+
+    def test_card_units_round_halves_away_from_zero(self):
+        # 0.05 * 0.00001 = 0.0000005
+        self.assertEqual(transaction.card_units([5, -5], 2, 0.00001), [1, -1])
+
+    def test_decimal_amounts_keep_every_digit(self):
+        self.assertEqual(
+            transaction.card_amount(Decimal("1234567.89"), 0.754287),
+            Decimal("931218.510044"),
+        )
+
+    def test_card_amounts_match_card_amount(self):
+        amounts = [response["transAmt"] for response in self.settlements()]
+
+        self.assertEqual(
+            list(transaction.card_amounts(amounts, 1.325754, 2)),
+            [transaction.card_amount(amount, 1.325754, 2) for amount in amounts],
+        )
+
+    @classmethod
+    def settlements(cls):
+        return cls.recorded_settlements() + cls.synthetic_settlements()
+
+    @staticmethod
+    def recorded_settlements():
+        # Mastercard's response for 10 USD in GBP on 2018-06-03, as in test_mastercard
+        return [
+            {
+                "conversionRate": 0.754287,
+                "crdhldBillAmt": 7.54287,
+                "transAmt": 10,
+                "bankFee": 0,
+            },
+        ]
+
+    @staticmethod
+    def synthetic_settlements():
+        # Not recorded from Mastercard: each crdhldBillAmt is calculated as amount *
+        # rate * (1 + fee / 100) rounded to 6 places. They check that the engines agree
+        # over awkward amounts and fees, not that they agree with Mastercard
+        return [
+            {
+                "conversionRate": 0.754287,
+                "crdhldBillAmt": 931.212559,
+                "transAmt": 1234.56,
+                "bankFee": 0,
+            },
+            {
+                "conversionRate": 1.325754,
+                "crdhldBillAmt": 135.213385,
+                "transAmt": 99.99,
+                "bankFee": 2,
+            },
+            {
+                "conversionRate": 0.754287,
+                "crdhldBillAmt": 0.007543,
+                "transAmt": 0.01,
+                "bankFee": 0,
+            },
+            {
+                "conversionRate": 147.6105,
+                "crdhldBillAmt": 38009703.75,
+                "transAmt": 250000,
+                "bankFee": 3,
+            },
+        ]
@@ -0,0 +1,48 @@
+import time
+
+# The date a fake settlement answers requests for the latest rates with
+FAKE_LATEST_DATE = "2018-06-03"
+
+
+def fake_settle(rate=0.754287, delay=0):
+    """Return a stand-in for mastercard.settle, answering as Mastercard would.
+
+    rate is the conversion rate, or a function of (transaction_currency,
+    card_currency, exchange_rate_date) returning it. Settlements are for the date
+    asked for, or FAKE_LATEST_DATE for the latest rates, and take delay seconds.
+    """
+
+    def settle(
+        transaction_amount,
+        transaction_currency,
+        card_currency,
+        exchange_rate_date,
+        bank_fee_percentage,
+    ):
+        if delay:
+            time.sleep(delay)
+        conversion_rate = (
+            rate(transaction_currency, card_currency, exchange_rate_date)
+            if callable(rate)
+            else rate
+        )
+        return {
+            "conversionRate": conversion_rate,
+            "crdhldBillAmt": round(
+                float(transaction_amount)
+                * conversion_rate
+                * (1 + float(bank_fee_percentage) / 100),
+                6,
+            ),
+            "fxDate": FAKE_LATEST_DATE
+            if exchange_rate_date == "0000-00-00"
+            else exchange_rate_date,
+            "transCurr": transaction_currency,
+            "crdhldBillCurr": card_currency,
+            "transAmt": transaction_amount,
+        }
+
+    return settle
+
+
+fake_mastercard_settle = fake_settle()
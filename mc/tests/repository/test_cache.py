@@ -0,0 +1,168 @@
+import unittest
+
+from repository.cache import LATEST_DATE, LruRateCache, RateCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = RateCache(":memory:", clock=self.clock)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get("2018-06-03", "USD", "GBP"))
+
+    def test_historical_hit(self):
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        self.assertEqual(
+            self.cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    def test_historical_never_expires(self):
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        self.clock.now += 10**9
+
+        self.assertEqual(
+            self.cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    def test_pair_is_directional(self):
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        self.assertIsNone(self.cache.get("2018-06-03", "GBP", "USD"))
+
+    def test_latest_hit(self):
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        self.cache.put_latest_date("2018-06-03", expires_at=self.clock.now + 60)
+
+        self.assertEqual(
+            self.cache.get(LATEST_DATE, "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    def test_latest_expires(self):
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        self.cache.put_latest_date("2018-06-03", expires_at=self.clock.now + 60)
+        self.clock.now += 60
+
+        self.assertIsNone(self.cache.latest_date())
+        self.assertIsNone(self.cache.get(LATEST_DATE, "USD", "GBP"))
+        # The rate itself is still known for its concrete date
+        self.assertEqual(
+            self.cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    def test_latest_date_applies_to_every_pair(self):
+        self.cache.put_latest_date("2018-06-03", expires_at=self.clock.now + 60)
+
+        self.assertEqual(self.cache.latest_date(), "2018-06-03")
+        self.assertIsNone(self.cache.get(LATEST_DATE, "USD", "GBP"))
+
+    def test_most_recent(self):
+        self.cache.put("2018-06-01", "USD", "GBP", 0.1)
+        self.cache.put("2018-06-03", "USD", "GBP", 0.3)
+        self.cache.put("2018-06-04", "USD", "EUR", 0.4)
+
+        self.assertEqual(self.cache.most_recent("USD", "GBP"), ("2018-06-03", 0.3))
+        self.assertIsNone(self.cache.most_recent("GBP", "USD"))
+
+    def test_currencies(self):
+        self.cache.put_currencies({"GBP": "POUND"}, expires_at=self.clock.now + 60)
+
+        self.assertEqual(self.cache.currencies(), {"GBP": "POUND"})
+
+    def test_currencies_replaced(self):
+        self.cache.put_currencies({"GBP": "POUND"}, expires_at=self.clock.now + 60)
+        self.cache.put_currencies({"USD": "DOLLAR"}, expires_at=self.clock.now + 60)
+
+        self.assertEqual(self.cache.currencies(), {"USD": "DOLLAR"})
+
+    def test_currencies_expire(self):
+        self.cache.put_currencies({"GBP": "POUND"}, expires_at=self.clock.now + 60)
+        self.clock.now += 60
+
+        self.assertIsNone(self.cache.currencies())
+
+
+class TestLruRateCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_hit(self):
+        cache = LruRateCache(clock=self.clock)
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+
+        self.assertEqual(
+            cache.get("2018-06-03", "USD", "GBP"), ("2018-06-03", 0.754287)
+        )
+
+    def test_evicts_least_recently_used(self):
+        cache = LruRateCache(capacity=2, clock=self.clock)
+        cache.put("2018-06-01", "USD", "GBP", 0.1)
+        cache.put("2018-06-02", "USD", "GBP", 0.2)
+        cache.get("2018-06-01", "USD", "GBP")
+        cache.put("2018-06-03", "USD", "GBP", 0.3)
+
+        self.assertIsNotNone(cache.get("2018-06-01", "USD", "GBP"))
+        self.assertIsNone(cache.get("2018-06-02", "USD", "GBP"))
+        self.assertIsNotNone(cache.get("2018-06-03", "USD", "GBP"))
+
+    def test_latest_expires(self):
+        cache = LruRateCache(clock=self.clock)
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        cache.put_latest_date("2018-06-03", expires_at=self.clock.now + 60)
+
+        self.assertEqual(cache.get(LATEST_DATE, "USD", "GBP"), ("2018-06-03", 0.754287))
+        self.clock.now += 60
+        self.assertIsNone(cache.get(LATEST_DATE, "USD", "GBP"))
+
+    def test_backing_read_and_write_through(self):
+        backing = RateCache(":memory:", clock=self.clock)
+        backing.put("2018-06-01", "USD", "GBP", 0.1)
+        cache = LruRateCache(backing=backing, clock=self.clock)
+
+        self.assertEqual(cache.get("2018-06-01", "USD", "GBP"), ("2018-06-01", 0.1))
+
+        cache.put("2018-06-02", "USD", "GBP", 0.2)
+        self.assertEqual(backing.get("2018-06-02", "USD", "GBP"), ("2018-06-02", 0.2))
+
+    def test_backing_latest_date(self):
+        backing = RateCache(":memory:", clock=self.clock)
+        cache = LruRateCache(backing=backing, clock=self.clock)
+
+        cache.put_latest_date("2018-06-03", expires_at=self.clock.now + 60)
+
+        self.assertEqual(backing.latest_date(), "2018-06-03")
+        self.assertEqual(
+            LruRateCache(backing=backing, clock=self.clock).latest_date(),
+            "2018-06-03",
+        )
+
+    def test_backing_currencies(self):
+        backing = RateCache(":memory:", clock=self.clock)
+        cache = LruRateCache(backing=backing, clock=self.clock)
+
+        cache.put_currencies({"GBP": "POUND"}, expires_at=self.clock.now + 60)
+
+        self.assertEqual(backing.currencies(), {"GBP": "POUND"})
+        self.assertEqual(
+            LruRateCache(backing=backing, clock=self.clock).currencies(),
+            {"GBP": "POUND"},
+        )
+
+    def test_most_recent(self):
+        cache = LruRateCache(clock=self.clock)
+        cache.put("2018-06-01", "USD", "GBP", 0.1)
+        cache.put("2018-06-03", "USD", "GBP", 0.3)
+
+        self.assertEqual(cache.most_recent("USD", "GBP"), ("2018-06-03", 0.3))
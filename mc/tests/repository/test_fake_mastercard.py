@@ -0,0 +1,59 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from repository import mastercard
+from repository.fake_mastercard import FakeMastercardServer
+from requests import HTTPError
+
+
+@patch.object(mastercard, "get_random_user_agent", return_value="test-agent")
+class TestFakeMastercardServer(unittest.TestCase):
+    def start(self, **settings):
+        fake = FakeMastercardServer(**settings).start()
+        self.addCleanup(fake.stop)
+        client = mastercard.MastercardClient(base_url=fake.base_url, backoff_factor=0)
+        self.addCleanup(client.close)
+        return fake, client
+
+    def test_settle(self, _user_agent_mock):
+        _, client = self.start()
+
+        result = client.settle(
+            transaction_amount=10,
+            transaction_currency="GBP",
+            card_currency="USD",
+            exchange_rate_date="2018-06-04",
+            bank_fee_percentage=2,
+        )
+
+        self.assertEqual(result["conversionRate"], 1.27)
+        self.assertEqual(result["crdhldBillAmt"], Decimal("12.954"))
+        self.assertEqual(result["fxDate"], "2018-06-04")
+
+    def test_rates_available(self, _user_agent_mock):
+        _, client = self.start()
+
+        self.assertTrue(client.rates_available("2018-06-04"))
+        # A Saturday
+        self.assertFalse(client.rates_available("2018-06-02"))
+
+    def test_currencies(self, _user_agent_mock):
+        _, client = self.start()
+
+        currencies = client.currencies()
+
+        self.assertIn({"alphaCd": "EUR", "currNam": "EURO"}, currencies)
+
+    def test_injected_errors_are_retried(self, _user_agent_mock):
+        fake, client = self.start(error_rate=0.5, seed=1)
+
+        for _ in range(10):
+            self.assertTrue(client.rates_available("2018-06-04"))
+        self.assertGreater(fake.request_count, 10)
+
+    def test_injected_errors(self, _user_agent_mock):
+        _, client = self.start(error_rate=1, error_status=429)
+
+        with self.assertRaises(HTTPError):
+            client.rates_available("2018-06-04")
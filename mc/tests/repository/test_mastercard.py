@@ -1,5 +1,7 @@
 import json
 import unittest
+from decimal import Decimal
+from unittest.mock import patch
 
 import httpretty
 from requests import HTTPError
@@ -24,7 +26,7 @@ class TestMastercardSettle(unittest.TestCase):
             transaction_currency="USD",
         )
 
-        self.assertEqual(result["crdhldBillAmt"], 7.542870)
+        self.assertEqual(result["crdhldBillAmt"], Decimal("7.542870"))
 
     def test_throws_on_bad_status(self):
         httpretty.register_uri(
@@ -107,7 +109,101 @@ class TestMastercardRatesAvailable(unittest.TestCase):
         )
 
 
+class TestMastercardFormatAmount(unittest.TestCase):
+    def test_whole_amount_is_sent(self):
+        self.assertEqual(mastercard.format_amount(1234567.89), "1234567.89")
+        self.assertEqual(mastercard.format_amount(Decimal("1E+7")), "10000000")
+
+    def test_trailing_zeros_are_dropped(self):
+        self.assertEqual(mastercard.format_amount(10.0), "10")
+        self.assertEqual(mastercard.format_amount(Decimal("2.50")), "2.5")
+
+
+@httpretty.activate
+@patch.object(mastercard, "get_random_user_agent", return_value="test-agent")
+class TestMastercardClient(unittest.TestCase):
+    URL = "https://www.mastercard.com/settlement/currencyrate/conversion-rate-issued?date=2018-06-03"
+
+    def test_retries_throttled_responses(self, _user_agent_mock):
+        httpretty.register_uri(
+            httpretty.GET,
+            self.URL,
+            responses=[
+                httpretty.Response("", status=429),
+                httpretty.Response("", status=503),
+                httpretty.Response(TestMastercardRatesAvailable.valid_response("YES")),
+            ],
+        )
+        client = mastercard.MastercardClient(backoff_factor=0)
+
+        self.assertTrue(client.rates_available("2018-06-03"))
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+    def test_throws_once_retries_exhausted(self, _user_agent_mock):
+        httpretty.register_uri(httpretty.GET, self.URL, status=503)
+        client = mastercard.MastercardClient(retries=2, backoff_factor=0)
+
+        with self.assertRaises(HTTPError):
+            client.rates_available("2018-06-03")
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+    def test_module_functions_share_default_client(self, _user_agent_mock):
+        httpretty.register_uri(
+            httpretty.GET,
+            self.URL,
+            TestMastercardRatesAvailable.valid_response("YES"),
+        )
+        client = mastercard.MastercardClient()
+        mastercard.set_default_client(client)
+        self.addCleanup(mastercard.set_default_client, None)
+
+        mastercard.rates_available("2018-06-03")
+
+        self.assertIs(mastercard.default_client(), client)
+
+    def test_query_values_are_quoted(self, _user_agent_mock):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.mastercard.com/settlement/currencyrate/conversion-rate",
+            TestMastercardSettle.valid_response(),
+        )
+        client = mastercard.MastercardClient()
+
+        client.settle(10, "USD", "GBP", "2018-06-03&transCurr=EUR", 0)
+
+        self.assertIn(
+            "fxDate=2018-06-03%26transCurr%3DEUR&transCurr=USD&",
+            httpretty.last_request().path,
+        )
+
+
+@httpretty.activate
+@patch.object(mastercard, "get_random_user_agent", return_value="test-agent")
 class TestMastercardCurrenciesAvailable(unittest.TestCase):
+    def test_success(self, _user_agent_mock):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.mastercard.com/settlement/currencyrate/settlement-currencies",
+            self.valid_response(),
+        )
+
+        result = mastercard.MastercardClient().currencies()
+
+        self.assertEqual(len(result), 152)
+        self.assertEqual(
+            result[0], {"alphaCd": "AFN", "currNam": "AFGHANISTAN AFGHANI "}
+        )
+
+    def test_throws_on_bad_status(self, _user_agent_mock):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.mastercard.com/settlement/currencyrate/settlement-currencies",
+            status=400,
+        )
+
+        with self.assertRaises(HTTPError):
+            mastercard.MastercardClient(retries=0).currencies()
+
     def valid_response(self):
         return json.dumps(
             {
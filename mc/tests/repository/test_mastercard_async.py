@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from repository.mastercard_async import AsyncMastercardClient, HostRateLimiter
+
+
+class BlockingClient:
+    """Stands in for MastercardClient, recording how many calls overlap."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def rates_available(self, exchange_rate_date):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return True
+
+    def close(self):
+        pass
+
+
+class TestAsyncMastercardClient(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_requests_concurrently(self):
+        blocking_client = BlockingClient()
+        client = AsyncMastercardClient(
+            blocking_client, concurrency=10, requests_per_second=None
+        )
+        self.addCleanup(client.close)
+
+        results = await asyncio.gather(
+            *(client.rates_available("2018-06-03") for _ in range(10))
+        )
+
+        self.assertEqual(results, [True] * 10)
+        self.assertGreater(blocking_client.max_in_flight, 1)
+
+    async def test_concurrency_is_bounded(self):
+        blocking_client = BlockingClient()
+        client = AsyncMastercardClient(
+            blocking_client, concurrency=3, requests_per_second=None
+        )
+        self.addCleanup(client.close)
+
+        await asyncio.gather(*(client.rates_available("2018-06-03") for _ in range(9)))
+
+        self.assertLessEqual(blocking_client.max_in_flight, 3)
+
+    async def test_settle_passes_arguments(self):
+        sync_client = Mock()
+        sync_client.settle.return_value = {"crdhldBillAmt": 7.54287}
+        client = AsyncMastercardClient(sync_client, requests_per_second=None)
+        self.addCleanup(client.close)
+
+        result = await client.settle(
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            bank_fee_percentage=0,
+        )
+
+        self.assertEqual(result, {"crdhldBillAmt": 7.54287})
+        sync_client.settle.assert_called_once_with(
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+            bank_fee_percentage=0,
+        )
+
+    def test_close_leaves_shared_client_open(self):
+        sync_client = Mock()
+
+        AsyncMastercardClient(sync_client).close()
+
+        sync_client.close.assert_not_called()
+
+    async def test_requests_are_limited_by_client_host(self):
+        client = AsyncMastercardClient(Mock(host="127.0.0.1:8080"))
+        self.addCleanup(client.close)
+        client.rate_limiter = Mock(acquire=AsyncMock())
+
+        await client.rates_available("2018-06-03")
+        client.client = BlockingClient()
+        await client.rates_available("2018-06-03")
+
+        self.assertEqual(
+            [call.args for call in client.rate_limiter.acquire.await_args_list],
+            [("127.0.0.1:8080",), ("www.mastercard.com",)],
+        )
+
+
+class TestHostRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_spaces_out_requests_per_host(self):
+        limiter = HostRateLimiter(requests_per_second=50)
+
+        start = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire("www.mastercard.com")
+
+        # 6 requests at 50/s need at least 5 intervals of 20ms
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    async def test_hosts_are_independent(self):
+        limiter = HostRateLimiter(requests_per_second=1)
+
+        start = time.monotonic()
+        await limiter.acquire("a.example")
+        await limiter.acquire("b.example")
+
+        self.assertLess(time.monotonic() - start, 0.5)
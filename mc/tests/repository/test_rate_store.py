@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import unittest
+
+from repository.rate_store import RateStore
+
+
+class TestRateStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "rates.mcrates")
+        self.store = RateStore(self.path)
+        self.addCleanup(lambda: self.store.close())
+
+    def test_pivot_rates(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.27)
+        self.store.put("2018-06-04", "USD", "GBP", 0.787402)
+
+        self.assertEqual(self.store.get("2018-06-04", "GBP", "USD"), 1.27)
+        self.assertEqual(self.store.get("2018-06-04", "USD", "GBP"), 0.787402)
+
+    def test_inverse(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+
+        self.assertAlmostEqual(self.store.get("2018-06-04", "USD", "GBP"), 0.8)
+
+    def test_cross_rates_go_through_pivot(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+        self.store.put("2018-06-04", "USD", "JPY", 150.0)
+
+        self.assertAlmostEqual(self.store.get("2018-06-04", "GBP", "JPY"), 187.5)
+
+    def test_only_pivot_pairs_are_stored(self):
+        self.assertFalse(self.store.put("2018-06-04", "GBP", "JPY", 187.5))
+        self.assertEqual(self.store.fx_dates(), [])
+
+    def test_unknown(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+
+        self.assertIsNone(self.store.get("2018-06-05", "GBP", "USD"))
+        self.assertIsNone(self.store.get("2018-06-04", "EUR", "USD"))
+
+    def test_series(self):
+        for fx_date, rate in (
+            ("2018-06-05", 1.26),
+            ("2018-06-04", 1.25),
+            ("2018-06-07", 1.28),
+        ):
+            self.store.put(fx_date, "GBP", "USD", rate)
+
+        self.assertEqual(
+            self.store.series("GBP", "USD", "2018-06-04", "2018-06-06"),
+            [("2018-06-04", 1.25), ("2018-06-05", 1.26)],
+        )
+
+    def test_reopened(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+        self.store.put("2018-06-05", "USD", "EUR", 0.9)
+        self.store.close()
+
+        with RateStore(self.path) as reopened:
+            self.assertEqual(reopened.currencies, ["GBP", "EUR"])
+            self.assertEqual(reopened.get("2018-06-04", "GBP", "USD"), 1.25)
+            self.assertEqual(reopened.get("2018-06-05", "USD", "EUR"), 0.9)
+        self.store = RateStore(self.path)
+
+    def test_fixed_size_records(self):
+        empty = os.path.getsize(self.path)
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+        one = os.path.getsize(self.path)
+        self.store.put("2018-06-05", "EUR", "USD", 1.1)
+
+        self.assertEqual(os.path.getsize(self.path) - one, one - empty)
+
+    def test_csv_round_trip(self):
+        self.store.put("2018-06-04", "GBP", "USD", 1.25)
+        self.store.put("2018-06-04", "USD", "JPY", 150.0)
+        exported = io.StringIO()
+        self.store.export_csv(exported)
+
+        with RateStore(self.path + ".copy") as copy:
+            self.assertEqual(copy.import_csv(io.StringIO(exported.getvalue())), 2)
+            self.assertEqual(
+                copy.rates_on("2018-06-04"), self.store.rates_on("2018-06-04")
+            )
+
+    def test_not_a_store(self):
+        with open(self.path + ".txt", "w") as other:
+            other.write("x" * 100)
+
+        with self.assertRaises(ValueError):
+            RateStore(self.path + ".txt")
@@ -0,0 +1,232 @@
+import datetime
+import random
+import unittest
+
+# Imported from mc, as the transport raises mc.repository.throttle's CircuitOpenError
+from mc.repository import throttle
+from mc.repository.fake_mastercard import FakeMastercardServer
+from mc.repository.transport import HttpTransport, ThrottledTransport
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ScriptedTransport:
+    """Answers requests with the given statuses in turn."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, make_headers):
+        self.requests += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = throttle.TokenBucket(
+            requests_per_second=10, burst=2, clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def test_burst_then_rate(self):
+        waits = [self.bucket.acquire() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[2], 0.1)
+        self.assertAlmostEqual(waits[3], 0.1)
+
+    def test_throttled_halves_rate_and_recovers(self):
+        self.bucket.throttled()
+        self.assertEqual(self.bucket.rate, 5)
+
+        for _ in range(20):
+            self.bucket.succeeded()
+        self.assertEqual(self.bucket.rate, 10)
+
+    def test_throttled_pauses_for_retry_after(self):
+        self.bucket.throttled(retry_after=3)
+
+        self.assertEqual(self.bucket.acquire(), 3)
+
+    def test_rate_has_a_floor(self):
+        for _ in range(20):
+            self.bucket.throttled()
+
+        self.assertEqual(self.bucket.rate, throttle.MIN_REQUESTS_PER_SECOND)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = throttle.CircuitBreaker(
+            failure_threshold=2, reset_timeout=30, clock=self.clock
+        )
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.failed()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.failed()
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        self.breaker.failed()
+        self.breaker.succeeded()
+        self.breaker.failed()
+
+        self.assertTrue(self.breaker.allow())
+
+    def test_allows_one_trial_after_timeout(self):
+        self.breaker.failed()
+        self.breaker.failed()
+        self.clock.now += 30
+
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.succeeded()
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.is_open)
+
+    def test_failed_trial_opens_again(self):
+        self.breaker.failed()
+        self.breaker.failed()
+        self.clock.now += 30
+        self.breaker.allow()
+
+        self.breaker.failed()
+
+        self.assertFalse(self.breaker.allow())
+
+
+class TestBackoff(unittest.TestCase):
+    def test_full_jitter(self):
+        rng = random.Random(1)
+        delays = [throttle.backoff_delay(3, 0.5, rng=rng) for _ in range(100)]
+
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_capped(self):
+        delay = throttle.backoff_delay(100, 0.5, rng=random.Random(1))
+
+        self.assertLessEqual(delay, throttle.MAX_BACKOFF_SECONDS)
+
+    def test_waits_at_least_retry_after(self):
+        self.assertGreaterEqual(throttle.backoff_delay(0, 0.5, retry_after=7), 7)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(throttle.retry_after_seconds("120"), 120)
+        self.assertIsNone(throttle.retry_after_seconds(None))
+        self.assertIsNone(throttle.retry_after_seconds("soon"))
+
+    def test_retry_after_date(self):
+        now = datetime.datetime(2018, 6, 3, 12, 0, 0, tzinfo=datetime.UTC)
+
+        self.assertEqual(
+            throttle.retry_after_seconds("Sun, 03 Jun 2018 12:01:00 GMT", now=now), 60
+        )
+
+
+class TestThrottledTransport(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = throttle.TokenBucket(
+            requests_per_second=10, burst=10, clock=self.clock, sleep=self.clock.sleep
+        )
+        self.breaker = throttle.CircuitBreaker(
+            failure_threshold=2, reset_timeout=30, clock=self.clock
+        )
+
+    def throttled_transport(self, inner, retries=3):
+        return ThrottledTransport(
+            inner,
+            self.limiter,
+            self.breaker,
+            retries=retries,
+            backoff_factor=0,
+            sleep=self.clock.sleep,
+        )
+
+    def test_retries_throttled_response_after_retry_after(self):
+        inner = ScriptedTransport(
+            FakeResponse(429, {"Retry-After": "5"}), FakeResponse(200)
+        )
+        started = self.clock.now
+
+        response = self.throttled_transport(inner).get("url", dict)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(inner.requests, 2)
+        self.assertGreaterEqual(self.clock.now - started, 5)
+        self.assertLess(self.limiter.rate, 10)
+
+    def test_forbidden_is_throttling(self):
+        inner = ScriptedTransport(FakeResponse(403), FakeResponse(200))
+
+        self.throttled_transport(inner).get("url", dict)
+
+        self.assertEqual(inner.requests, 2)
+        self.assertLess(self.limiter.rate, 10)
+
+    def test_returns_last_response_once_retries_exhausted(self):
+        inner = ScriptedTransport(*[FakeResponse(503)] * 3)
+
+        response = self.throttled_transport(inner, retries=2).get("url", dict)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(inner.requests, 3)
+
+    def test_client_errors_are_not_retried(self):
+        inner = ScriptedTransport(FakeResponse(400))
+
+        response = self.throttled_transport(inner).get("url", dict)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(self.breaker.allow())
+
+    def test_circuit_opens_after_repeated_failures(self):
+        inner = ScriptedTransport(ConnectionError("refused"), FakeResponse(503))
+        transport = self.throttled_transport(inner, retries=0)
+
+        with self.assertRaises(ConnectionError):
+            transport.get("url", dict)
+        transport.get("url", dict)
+
+        with self.assertRaises(throttle.CircuitOpenError):
+            transport.get("url", dict)
+        self.assertEqual(inner.requests, 2)
+
+    def test_http_retry_after_reaches_throttling(self):
+        # Through a real HttpTransport, as urllib3 has retry rules of its own
+        with FakeMastercardServer(
+            error_rate=1, error_status=429, retry_after=0
+        ) as fake:
+            transport = self.throttled_transport(HttpTransport(retries=1), retries=1)
+            self.addCleanup(transport.close)
+
+            response = transport.get(fake.base_url + "/settlement-currencies", dict)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(fake.request_count, 2)
+        self.assertLess(self.limiter.rate, 10)
+        self.assertEqual(self.breaker.failures, 1)
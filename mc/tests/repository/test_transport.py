@@ -0,0 +1,129 @@
+import tempfile
+import unittest
+from decimal import ROUND_HALF_UP, Decimal
+from unittest.mock import patch
+
+from repository import mastercard
+from repository.fake_mastercard import FakeMastercardServer
+from repository.transport import (
+    FixtureNotFoundError,
+    HttpTransport,
+    RecordingTransport,
+    ReplayTransport,
+)
+
+from mc import instrumentation
+
+
+@patch.object(mastercard, "get_random_user_agent", return_value="test-agent")
+class TestRecordAndReplay(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeMastercardServer().start()
+        self.addCleanup(self.fake.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fixture_dir = directory.name
+
+    def test_replays_recorded_responses(self, _user_agent_mock):
+        recording = mastercard.MastercardClient(
+            transport=RecordingTransport(self.fixture_dir, HttpTransport()),
+            base_url=self.fake.base_url,
+        )
+        recorded = recording.settle(
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-04",
+            bank_fee_percentage=0,
+        )
+        self.fake.stop()
+
+        replaying = mastercard.MastercardClient(
+            transport=ReplayTransport(self.fixture_dir),
+            base_url=self.fake.base_url,
+        )
+        replayed = replaying.settle(
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-04",
+            bank_fee_percentage=0,
+        )
+
+        self.assertEqual(replayed, recorded)
+
+    def test_replays_rate_for_other_amounts(self, _user_agent_mock):
+        recording = mastercard.MastercardClient(
+            transport=RecordingTransport(self.fixture_dir, HttpTransport()),
+            base_url=self.fake.base_url,
+        )
+        recorded = recording.settle(
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-04",
+            bank_fee_percentage=0,
+        )
+        self.fake.stop()
+
+        replaying = mastercard.MastercardClient(
+            transport=ReplayTransport(self.fixture_dir),
+            base_url=self.fake.base_url,
+        )
+        replayed = replaying.settle(
+            transaction_amount=Decimal("25.5"),
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-04",
+            bank_fee_percentage=2,
+        )
+
+        self.assertEqual(replayed["conversionRate"], recorded["conversionRate"])
+        self.assertEqual(replayed["transAmt"], 25.5)
+        self.assertEqual(
+            Decimal(str(replayed["crdhldBillAmt"])),
+            (
+                Decimal("25.5")
+                * Decimal(str(recorded["conversionRate"]))
+                * Decimal("1.02")
+            )
+            .quantize(Decimal("0.000001"), ROUND_HALF_UP)
+            .normalize(),
+        )
+
+    def test_replay_missing_fixture(self, _user_agent_mock):
+        client = mastercard.MastercardClient(
+            transport=ReplayTransport(self.fixture_dir)
+        )
+
+        with self.assertRaises(FixtureNotFoundError):
+            client.rates_available("2018-06-04")
+
+    def test_replay_does_not_build_headers(self, user_agent_mock):
+        client = mastercard.MastercardClient(
+            transport=ReplayTransport(self.fixture_dir)
+        )
+
+        with self.assertRaises(FixtureNotFoundError):
+            client.currencies()
+        user_agent_mock.assert_not_called()
+
+
+@patch.object(mastercard, "get_random_user_agent", return_value="test-agent")
+class TestHttpTransportInstrumentation(unittest.TestCase):
+    def test_counts_requests_retries_and_bytes(self, _user_agent_mock):
+        fake = FakeMastercardServer(error_rate=0.5, seed=1).start()
+        self.addCleanup(fake.stop)
+        client = mastercard.MastercardClient(base_url=fake.base_url, backoff_factor=0)
+        self.addCleanup(client.close)
+        stats = instrumentation.Stats()
+        instrumentation.add_hook(stats)
+        self.addCleanup(instrumentation.remove_hook, stats)
+
+        for _ in range(5):
+            client.rates_available("2018-06-04")
+
+        self.assertEqual(stats.counts["http.requests"], fake.request_count)
+        self.assertEqual(stats.counts["http.retries"], fake.request_count - 5)
+        self.assertGreater(stats.counts["http.bytes_received"], 0)
+        self.assertEqual(stats.spans["mastercard.rates_available"][0], 5)
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mc import bench
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [i / 100 for i in range(100, 0, -1)]
+
+        self.assertEqual(bench.percentile(values, 50), 0.5)
+        self.assertEqual(bench.percentile(values, 95), 0.95)
+        self.assertEqual(bench.percentile(values, 99), 0.99)
+        self.assertEqual(bench.percentile(values, 100), 1.0)
+
+    def test_single_value(self):
+        self.assertEqual(bench.percentile([0.2], 99), 0.2)
+
+    def test_no_values(self):
+        self.assertEqual(bench.percentile([], 50), 0)
+
+
+class TestRun(unittest.TestCase):
+    def test_runs_every_workload_against_fake_api(self):
+        report = bench.run(iterations=20, concurrency=4)
+
+        self.assertEqual(
+            [result["workload"] for result in report["results"]],
+            list(bench.WORKLOADS),
+        )
+        for result in report["results"]:
+            self.assertEqual(result["operations"], 20)
+            self.assertGreater(result["throughput"], 0)
+            self.assertLessEqual(result["latency"]["p50"], result["latency"]["p99"])
+            self.assertGreater(result["peak_memory_bytes"], 0)
+
+    def test_reports_time_spent_in_each_phase(self):
+        report = bench.run(workloads=["single", "cached"], iterations=10, memory=False)
+
+        single, cached = report["results"]
+        self.assertEqual(set(single["phases"]), set(bench.PHASES))
+        self.assertGreater(single["phases"]["request"], single["phases"]["decode"])
+        self.assertGreater(single["phases"]["mapping"], 0)
+        self.assertEqual(cached["phases"]["request"], 0)
+        self.assertIn("request ms", bench.format_report(report))
+
+    def test_saved_report_can_be_compared(self):
+        report = bench.run(workloads=["cached"], iterations=10, memory=False)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.json")
+            bench.save_report(report, path)
+            baseline = bench.load_report(path)
+
+        self.assertEqual(baseline, json.loads(json.dumps(report)))
+        self.assertIn("throughput +0.0%", bench.format_report(report, baseline))
@@ -0,0 +1,112 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from mc import cli
+from mc.repository import mastercard
+from mc.repository.cache import LruRateCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Slow to import, and only needed once a conversion makes a request. Startup time is
+# checked by keeping these out rather than by timing it, which would be flaky
+HEAVY_MODULES = (
+    "asyncio",
+    "dateutil",
+    "http.server",
+    "latest_user_agents",
+    "requests",
+    "urllib3",
+)
+
+
+def run_python(*arguments):
+    return subprocess.run(
+        [sys.executable, *arguments],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+class TestStartup(unittest.TestCase):
+    def test_help_skips_heavy_imports(self):
+        result = run_python(
+            "-c",
+            "import sys\n"
+            "from mc.cli import main\n"
+            "try:\n"
+            "    main(['--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(','.join(sorted(m for m in sys.modules if m.split('.')[0] in "
+            f"{HEAVY_MODULES!r} or m in {HEAVY_MODULES!r})), file=sys.stderr)",
+        )
+
+        self.assertEqual(result.stderr.strip(), "")
+
+
+class TestConvert(unittest.TestCase):
+    def setUp(self):
+        # An expired catalogue, with a cached rate
+        self.cache = LruRateCache()
+        self.cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        self.addCleanup(mastercard.set_default_client, None)
+
+    def convert(self, *argv):
+        stdout = io.StringIO()
+        with (
+            patch("mc.cli.RateCache", return_value=self.cache),
+            redirect_stdout(stdout),
+        ):
+            cli.main(list(argv))
+        return stdout.getvalue()
+
+    @patch("mc.repository.mastercard.currencies")
+    @patch("mc.repository.mastercard.settle")
+    def test_cached_rate_needs_no_requests(self, settle_mock, currencies_mock):
+        output = self.convert("10", "usd", "gbp", "--date", "2018-06-03")
+
+        self.assertEqual(output, "7.54287\n")
+        currencies_mock.assert_not_called()
+        settle_mock.assert_not_called()
+
+    @patch(
+        "mc.repository.mastercard.currencies",
+        return_value=[
+            {"alphaCd": "USD", "currNam": "US Dollar"},
+            {"alphaCd": "GBP", "currNam": "Pound Sterling"},
+        ],
+    )
+    @patch("mc.repository.mastercard.settle")
+    def test_currencies_are_checked_before_fetching(self, settle_mock, currencies_mock):
+        with redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            self.convert("10", "usd", "gbx", "--date", "2018-06-03", "--no-server")
+
+        self.assertIn("Unknown currency GBX, did you mean GBP?", stderr.getvalue())
+        settle_mock.assert_not_called()
+
+    def test_offline_without_fixture_reports_it(self):
+        fixture_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(fixture_dir.cleanup)
+
+        with redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            self.convert(
+                "10",
+                "usd",
+                "eur",
+                "--date",
+                "2018-06-03",
+                "--offline",
+                fixture_dir.name,
+            )
+
+        self.assertIn(
+            "mc couldn't convert offline: No recorded response", stderr.getvalue()
+        )
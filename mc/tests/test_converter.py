@@ -0,0 +1,191 @@
+import json
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from mc import converter
+from mc.domain.matrix import RateMatrix
+from mc.repository import mastercard
+from mc.repository.cache import LruRateCache
+from mc.repository.transport import fixture_path
+from mc.tests.fakes import fake_mastercard_settle
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestConverter(unittest.TestCase):
+    def setUp(self):
+        self.converter = converter.Converter(
+            converter.MastercardBackend(cache=LruRateCache()), bank_fee_percentage=2
+        )
+
+    def test_convert_uses_default_bank_fee(self, settle_mock):
+        result = self.converter.convert(10, "USD", "GBP")
+
+        self.assertEqual(result["bank_fee_percentage"], 2)
+        self.assertEqual(result["card_amount"], round(10 * 0.754287 * 1.02, 6))
+        self.assertEqual(result["conversion_rate_date"], "2018-06-03")
+
+    def test_convert_keeps_warm_cache(self, settle_mock):
+        self.converter.convert(10, "USD", "GBP", "2018-06-03")
+        result = self.converter.convert(
+            Decimal(20), "USD", "GBP", "2018-06-03", bank_fee_percentage=0
+        )
+
+        settle_mock.assert_called_once()
+        self.assertEqual(result["card_amount"], Decimal("15.08574"))
+
+    # Without a client of its own, the backend settles many through the default client
+    @patch.object(
+        mastercard.MastercardClient, "settle", side_effect=fake_mastercard_settle
+    )
+    def test_convert_many_fetches_each_rate_once(self, client_settle_mock, settle_mock):
+        results = self.converter.convert_many(
+            [
+                {"amount": 10, "from": "USD", "to": "GBP"},
+                {"amount": 20, "from": "USD", "to": "EUR", "bank_fee": 0},
+                {"amount": 30, "from": "USD", "to": "GBP"},
+            ]
+        )
+
+        self.assertEqual(client_settle_mock.call_count, 2)
+        self.assertEqual(
+            [(result["card_currency"], result["card_amount"]) for result in results],
+            [
+                ("GBP", round(10 * 0.754287 * 1.02, 6)),
+                ("EUR", round(20 * 0.754287, 6)),
+                ("GBP", round(30 * 0.754287 * 1.02, 6)),
+            ],
+        )
+
+    def test_rate(self, settle_mock):
+        self.assertEqual(
+            self.converter.rate("USD", "GBP", "2018-06-03"), ("2018-06-03", 0.754287)
+        )
+
+    def test_client_is_used_instead_of_default(self, settle_mock):
+        client = Mock()
+        client.settle.side_effect = fake_mastercard_settle
+
+        with converter.Converter(converter.MastercardBackend(client)) as own:
+            own.convert(10, "USD", "GBP")
+
+        client.settle.assert_called_once()
+        client.close.assert_called_once()
+        settle_mock.assert_not_called()
+
+
+class TestConverterAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_convert_many_async_runs_in_running_loop(self):
+        cache = LruRateCache()
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        client = Mock()
+        client.settle.side_effect = fake_mastercard_settle
+        fallback = converter.Converter(
+            converter.FallbackBackend(
+                converter.CacheBackend(cache), converter.MastercardBackend(client)
+            ),
+            exchange_rate_date="2018-06-03",
+        )
+
+        results = await fallback.convert_many_async(
+            [
+                {"amount": 10, "from": "USD", "to": "EUR"},
+                {"amount": 10, "from": "USD", "to": "GBP"},
+            ]
+        )
+
+        self.assertEqual(
+            [result["card_currency"] for result in results], ["EUR", "GBP"]
+        )
+        client.settle.assert_called_once()
+
+
+class TestBackends(unittest.TestCase):
+    def test_cache_backend_only_uses_cached_rates(self):
+        cache = LruRateCache()
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        cached = converter.Converter.cached(cache)
+
+        self.assertEqual(
+            cached.convert(10, "USD", "GBP", "2018-06-03")["card_amount"], 7.54287
+        )
+        with self.assertRaises(converter.RateNotFoundError):
+            cached.convert(10, "USD", "EUR", "2018-06-03")
+
+    def test_matrix_backend_only_has_its_date(self):
+        matrix = RateMatrix(["GBP", "EUR"], "2018-06-03")
+        matrix.set("GBP", "USD", 1.25)
+        matrix.set("USD", "EUR", 0.8)
+        local = converter.Converter.from_matrix(matrix)
+
+        self.assertEqual(local.rate("GBP", "EUR"), ("2018-06-03", 1.0))
+        with self.assertRaises(converter.RateNotFoundError):
+            local.rate("GBP", "EUR", "2018-06-04")
+        with self.assertRaises(converter.RateNotFoundError):
+            local.rate("GBP", "JPY")
+
+    def test_fallback_settles_what_is_left_with_last_backend(self):
+        cache = LruRateCache()
+        cache.put("2018-06-03", "USD", "GBP", 0.754287)
+        client = Mock()
+        client.settle.side_effect = fake_mastercard_settle
+        fallback = converter.Converter(
+            converter.FallbackBackend(
+                converter.CacheBackend(cache), converter.MastercardBackend(client)
+            ),
+            exchange_rate_date="2018-06-03",
+        )
+
+        results = fallback.convert_many(
+            [
+                {"amount": 10, "from": "USD", "to": "EUR"},
+                {"amount": 10, "from": "USD", "to": "GBP"},
+            ]
+        )
+
+        self.assertEqual(
+            [result["card_currency"] for result in results], ["EUR", "GBP"]
+        )
+        client.settle.assert_called_once()
+        self.assertEqual(client.settle.call_args.kwargs["card_currency"], "EUR")
+
+    def test_offline_convert_many_replays_fixtures_of_each_amount(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for card_currency in ("GBP", "EUR"):
+            url = mastercard.RATE_URL.substitute(
+                bank_fee_percentage=0,
+                card_currency=card_currency,
+                exchange_rate_date="2018-06-03",
+                transaction_amount=10,
+                transaction_currency="USD",
+            )
+            data = fake_mastercard_settle(10, "USD", card_currency, "2018-06-03", 0)
+            with open(fixture_path(directory.name, url), "w") as fixture_file:
+                json.dump(
+                    {"url": url, "status": 200, "body": json.dumps({"data": data})},
+                    fixture_file,
+                )
+
+        with converter.Converter.offline(
+            directory.name, exchange_rate_date="2018-06-03"
+        ) as offline:
+            results = offline.convert_many(
+                {"amount": 10, "from": "USD", "to": to} for to in ("GBP", "EUR")
+            )
+
+        self.assertEqual([result["card_amount"] for result in results], [7.54287] * 2)
+
+    def test_fallback_tries_backends_in_turn(self):
+        matrix = RateMatrix(["GBP"], "2018-06-03")
+        matrix.set("GBP", "USD", 1.25)
+        fallback = converter.FallbackBackend(
+            converter.CacheBackend(LruRateCache()), converter.MatrixBackend(matrix)
+        )
+
+        self.assertEqual(
+            fallback.rate("GBP", "USD", "2018-06-03"), ("2018-06-03", 1.25)
+        )
+        with self.assertRaises(converter.RateNotFoundError):
+            fallback.rate("GBP", "JPY", "2018-06-03")
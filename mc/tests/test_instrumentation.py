@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+
+from mc import instrumentation
+from mc.domain import transaction
+from mc.repository.cache import LruRateCache
+
+
+class RecordingHook:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, kind, name, value, attributes):
+        self.events.append((kind, name, value, attributes))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.hook = RecordingHook()
+        instrumentation.add_hook(self.hook)
+        self.addCleanup(instrumentation.remove_hook, self.hook)
+
+    def test_span_reports_duration(self):
+        with instrumentation.span("work", endpoint="/conversion-rate"):
+            pass
+
+        [(kind, name, seconds, attributes)] = self.hook.events
+        self.assertEqual((kind, name), ("span", "work"))
+        self.assertGreaterEqual(seconds, 0)
+        self.assertEqual(attributes, {"endpoint": "/conversion-rate"})
+
+    def test_span_reports_duration_on_error(self):
+        with self.assertRaises(ValueError), instrumentation.span("work"):
+            raise ValueError
+
+        self.assertEqual([event[1] for event in self.hook.events], ["work"])
+
+    def test_count(self):
+        instrumentation.count("things", 3)
+
+        self.assertEqual(self.hook.events, [("count", "things", 3, {})])
+
+    def test_disabled_without_hooks(self):
+        instrumentation.remove_hook(self.hook)
+        self.addCleanup(instrumentation.add_hook, self.hook)
+
+        self.assertFalse(instrumentation.enabled())
+        self.assertIs(instrumentation.span("work"), instrumentation.NO_SPAN)
+        instrumentation.count("things")
+        self.assertEqual(self.hook.events, [])
+
+    @patch("mc.repository.mastercard.settle")
+    def test_counts_cache_hits_and_misses(self, settle_mock):
+        settle_mock.return_value = {
+            "conversionRate": 0.754287,
+            "crdhldBillAmt": 7.54287,
+            "fxDate": "2018-06-03",
+            "transCurr": "USD",
+            "crdhldBillCurr": "GBP",
+            "transAmt": 10,
+        }
+        cache = LruRateCache()
+
+        for _ in range(3):
+            transaction.settle(10, "USD", "GBP", "2018-06-03", cache=cache)
+
+        counts = [
+            event[1]
+            for event in self.hook.events
+            if event[0] == "count" and event[1].startswith("cache.")
+        ]
+        self.assertEqual(counts, ["cache.misses", "cache.hits", "cache.hits"])
+
+
+class TestStats(unittest.TestCase):
+    def test_totals(self):
+        stats = instrumentation.Stats()
+        stats("span", "request", 0.002, {})
+        stats("span", "request", 0.004, {})
+        stats("count", "cache.hits", 1, {})
+        stats("count", "cache.hits", 1, {})
+
+        self.assertEqual(stats.spans["request"], [2, 0.006, 0.004])
+        self.assertEqual(stats.counts, {"cache.hits": 2})
+        summary = stats.summary()
+        self.assertIn("request", summary)
+        self.assertIn("cache.hits", summary)
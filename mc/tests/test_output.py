@@ -0,0 +1,125 @@
+import io
+import json
+import unittest
+from decimal import Decimal
+
+from mc import output
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def result(transaction_amount=10):
+    return {
+        "bank_fee_percentage": 0,
+        "card_amount": Decimal("7.54287") * transaction_amount,
+        "card_currency": "GBP",
+        "conversion_rate": 0.754287,
+        "conversion_rate_date": "2018-06-03",
+        "transaction_amount": Decimal(transaction_amount),
+        "transaction_currency": "USD",
+    }
+
+
+class TestRecordWriter(unittest.TestCase):
+    def write(self, output_format, results, **kwargs):
+        stream = io.StringIO()
+        with output.RecordWriter(stream, output_format, **kwargs) as writer:
+            for record in results:
+                writer.write(record)
+        return stream.getvalue()
+
+    def test_csv(self):
+        self.assertEqual(
+            self.write("csv", [result()]).splitlines(),
+            [
+                ",".join(output.FIELDS),
+                "10,USD,75.42870,GBP,0.754287,2018-06-03,0",
+            ],
+        )
+
+    def test_tsv_without_header(self):
+        self.assertEqual(
+            self.write("tsv", [result()], header=False),
+            "10\tUSD\t75.42870\tGBP\t0.754287\t2018-06-03\t0\r\n",
+        )
+
+    def test_json_is_one_array(self):
+        for count in (0, 1, 3):
+            with self.subTest(count=count):
+                records = json.loads(self.write("json", [result()] * count))
+
+                self.assertEqual(len(records), count)
+
+    def test_json_keeps_every_digit(self):
+        records = [
+            result(Decimal("1234567.89")),
+            {**result(), "card_amount": Decimal("123456789012.345678")},
+        ]
+
+        text = self.write("jsonl", records)
+        lines = [json.loads(line, parse_float=Decimal) for line in text.splitlines()]
+
+        self.assertEqual(lines[0]["transaction_amount"], Decimal("1234567.89"))
+        self.assertEqual(lines[1]["card_amount"], Decimal("123456789012.345678"))
+        self.assertIn('"card_amount": 123456789012.345678,', text)
+
+    def test_failure_discards_unwritten_output(self):
+        stream = io.StringIO()
+
+        with (
+            self.assertRaises(ValueError),
+            output.RecordWriter(stream, "json") as writer,
+        ):
+            writer.write(result())
+            raise ValueError("Row 2: Invalid amount 'ten'")
+
+        self.assertEqual(stream.getvalue(), "")
+
+    def test_jsonl_has_full_record(self):
+        lines = self.write("jsonl", [result(), result(2)]).splitlines()
+
+        self.assertEqual(
+            json.loads(lines[1]),
+            {
+                "transaction_amount": 2,
+                "transaction_currency": "USD",
+                "card_amount": 15.08574,
+                "card_currency": "GBP",
+                "conversion_rate": 0.754287,
+                "conversion_rate_date": "2018-06-03",
+                "bank_fee_percentage": 0,
+            },
+        )
+
+    def test_writes_in_blocks(self):
+        stream = CountingStream()
+
+        with output.RecordWriter(stream, "jsonl") as writer:
+            for _ in range(1000):
+                writer.write(result())
+
+        self.assertLess(stream.writes, 10)
+        self.assertEqual(stream.flushes, 1)
+        self.assertEqual(len(stream.getvalue().splitlines()), 1000)
+
+    def test_line_buffered_flushes_every_record(self):
+        stream = CountingStream()
+
+        with output.RecordWriter(stream, "csv", line_buffered=True) as writer:
+            writer.write(result())
+            self.assertEqual(len(stream.getvalue().splitlines()), 2)
+            writer.write(result())
+
+        self.assertEqual(stream.flushes, 3)
@@ -0,0 +1,153 @@
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from mc import server
+from mc.repository.cache import LruRateCache
+from mc.tests.fakes import fake_settle
+
+# Slow enough for concurrent requests to overlap
+fake_mastercard_settle = fake_settle(delay=0.05)
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestConversionService(unittest.TestCase):
+    def test_coalesces_concurrent_misses(self, settle_mock):
+        service = server.ConversionService(LruRateCache())
+        results = []
+
+        def convert(amount):
+            results.append(
+                service.settle(
+                    transaction_amount=amount,
+                    transaction_currency="USD",
+                    card_currency="GBP",
+                    exchange_rate_date="2018-06-03",
+                )
+            )
+
+        threads = [threading.Thread(target=convert, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        settle_mock.assert_called_once()
+        self.assertEqual(
+            sorted(result["card_amount"] for result in results),
+            [round(i * 0.754287, 6) for i in range(8)],
+        )
+
+
+@patch("mc.repository.mastercard.settle", side_effect=fake_mastercard_settle)
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.httpd = ThreadingHTTPServer(
+            (server.DEFAULT_HOST, 0), server.ConversionRequestHandler
+        )
+        self.httpd.service = server.ConversionService(LruRateCache())
+        thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+        self.address = self.httpd.server_address[:2]
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def test_settle_via_server(self, settle_mock):
+        result = server.settle_via_server(
+            self.address,
+            transaction_amount=10,
+            transaction_currency="USD",
+            card_currency="GBP",
+            exchange_rate_date="2018-06-03",
+        )
+
+        self.assertEqual(result["card_amount"], 7.54287)
+        self.assertEqual(result["conversion_rate_date"], "2018-06-03")
+
+    def test_repeat_uses_memory_cache(self, settle_mock):
+        for amount in (10, 20):
+            server.settle_via_server(
+                self.address,
+                transaction_amount=amount,
+                transaction_currency="USD",
+                card_currency="GBP",
+                exchange_rate_date="0000-00-00",
+            )
+
+        settle_mock.assert_called_once()
+
+    def test_bad_query_values_are_rejected(self, settle_mock):
+        host, port = self.address
+        for query in (
+            "amount=10&from=usd&to=gbp&date=2024-01-02%26transCurr%3DEUR",
+            "amount=10&from=usd%26x%3D1&to=gbp",
+            "amount=10&from=usd&to=gb",
+        ):
+            with self.subTest(query=query):
+                with self.assertRaises(urllib.error.HTTPError) as caught:
+                    urllib.request.urlopen(f"http://{host}:{port}/convert?{query}")
+                caught.exception.close()
+                self.assertEqual(caught.exception.code, 400)
+
+        settle_mock.assert_not_called()
+
+    def test_server_errors_are_raised(self, settle_mock):
+        settle_mock.side_effect = ValueError("Mastercard is down")
+
+        with self.assertRaises(server.ServerError):
+            server.settle_via_server(
+                self.address,
+                transaction_amount=10,
+                transaction_currency="USD",
+                card_currency="GBP",
+                exchange_rate_date="2018-06-03",
+            )
+
+
+class TestServerAddress(unittest.TestCase):
+    def test_missing_state_file(self):
+        self.assertIsNone(server.server_address("/nonexistent/server.json"))
+
+    def test_unreachable_server(self):
+        # Nothing listens on the discard port locally
+        self.assertIsNone(
+            server.settle_via_server(
+                ("127.0.0.1", 9),
+                transaction_amount=10,
+                transaction_currency="USD",
+                card_currency="GBP",
+                exchange_rate_date="2018-06-03",
+            )
+        )
+
+    def test_other_service_on_port(self):
+        # Answers every GET with an HTML error page
+        other = ThreadingHTTPServer((server.DEFAULT_HOST, 0), BaseHTTPRequestHandler)
+        threading.Thread(target=other.serve_forever, daemon=True).start()
+        self.addCleanup(other.server_close)
+        self.addCleanup(other.shutdown)
+
+        self.assertIsNone(
+            server.settle_via_server(
+                other.server_address[:2],
+                transaction_amount=10,
+                transaction_currency="USD",
+                card_currency="GBP",
+                exchange_rate_date="2018-06-03",
+            )
+        )
+
+    def test_reads_state_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, "server.json")
+            with open(state_path, "w") as state_file:
+                state_file.write('{"host": "127.0.0.1", "port": 1234, "pid": 1}')
+
+            self.assertEqual(server.server_address(state_path), ("127.0.0.1", 1234))